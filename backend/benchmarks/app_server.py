@@ -0,0 +1,43 @@
+"""Serve main.app for the benchmark suite, with mongomock standing in for MongoDB.
+
+benchmarks.run_suite starts this in its own process (so the RSS it reports
+is the app's alone) with the upstream URLs pointed at the mock inference
+server. The fixture users are seeded before the server starts. Pass
+--mongo-uri to use a real (throwaway) mongod instead; fixture users are
+replaced there too.
+
+Usage (from backend/):  python -m benchmarks.app_server --port 8200 --users 50
+"""
+import argparse
+import asyncio
+import os
+
+import uvicorn
+
+from benchmarks.fixtures import seed_users
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+        os.environ["MONGO_URI"] = "mongodb://mongomock"
+        # The app's lifespan builds its client through motor; hand it this in-memory one
+        mock_client = AsyncMongoMockClient()
+        motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: mock_client
+
+    import main as app_main
+    asyncio.run(seed_users(app_main.services.build_database_client().userdb.users, args.users))
+    uvicorn.run(app_main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Recall@k vs query latency for the memory index tiers on synthetic data.
+
+Vectors are drawn around random cluster centres (roughly how one user's
+memories bunch up by topic) and L2-normalized. Exact IndexFlatIP gives the
+ground truth; HNSW and IVF are scored against it. Use the crossover to pick
+MEMORY_ANN_THRESHOLD.
+
+Usage (from backend/):  python -m benchmarks.bench_ann_index --sizes 1000 10000 50000 --k 3
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from utils.tiered_index import build_ann, build_flat
+
+DIMENSION = 384
+
+
+def synthetic(n, rng, clusters=64):
+    centres = rng.standard_normal((clusters, DIMENSION)).astype("float32")
+    vectors = centres[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, DIMENSION)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def query_latency_us(index, queries, k):
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q[None, :], k)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def recall(truth, found):
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        vectors = synthetic(size, rng)
+        queries = synthetic(args.queries, rng)
+        flat = build_flat(DIMENSION, vectors)
+        _, truth = flat.search(queries, args.k)
+        print(f"N={size}")
+        print(f"  flat  recall@{args.k} 1.000  {query_latency_us(flat, queries, args.k):8.1f}us/query")
+        for kind in ("hnsw", "ivf"):
+            start = time.perf_counter()
+            index = build_ann(DIMENSION, vectors, kind)
+            build_s = time.perf_counter() - start
+            _, found = index.search(queries, args.k)
+            print(f"  {kind:<5} recall@{args.k} {recall(truth, found):.3f}  "
+                  f"{query_latency_us(index, queries, args.k):8.1f}us/query  build {build_s:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Auth overhead per request, before and after the auth caches.
+
+Access tokens: a full python-jose decode on every request vs TokenVerifier
+(LRU of verified token digests) over --users distinct tokens.
+
+Google ID tokens: google-auth's verify_token with a fresh requests.Request()
+(certs re-downloaded over a new connection each time, as auth_callback
+used to do) vs GoogleAuth with its cached JWKS. Certs are served by a local
+mock, so no network access is needed.
+
+Usage (from backend/):  python -m benchmarks.bench_auth --requests 20000 --users 500
+"""
+import argparse
+import asyncio
+import datetime
+import statistics
+import time
+
+from fastapi import FastAPI, Response
+from google.auth.transport import requests as google_requests
+from google.oauth2 import id_token
+from jose import jwt
+
+from benchmarks.fixtures import ALGORITHM, CLIENT_ID, SECRET_KEY, make_google_fixtures
+from benchmarks.mock_server import serve_in_thread
+from utils.auth import GoogleAuth, TokenVerifier
+
+
+def create_certs_app(jwks, pem_certs):
+    app = FastAPI()
+
+    @app.get("/oauth2/v1/certs")
+    async def pem():
+        return pem_certs
+
+    @app.get("/oauth2/v3/certs")
+    async def jwk_set(response: Response):
+        response.headers["Cache-Control"] = "public, max-age=21600"
+        return jwks
+
+    return app
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"  {label:<40} mean {statistics.mean(samples):9.1f}us  p50 {samples[len(samples) // 2]:9.1f}us  "
+          f"p99 {p99:9.1f}us")
+
+
+def bench_access_tokens(requests, users):
+    expire = datetime.datetime.utcnow() + datetime.timedelta(minutes=60)
+    tokens = [jwt.encode({"sub": f"user{u}@example.com", "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+              for u in range(users)]
+    verifier = TokenVerifier(SECRET_KEY, ALGORITHM)
+
+    before, after = [], []
+    for i in range(requests):
+        token = tokens[i % users]
+        start = time.perf_counter()
+        jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        before.append((time.perf_counter() - start) * 1e6)
+        start = time.perf_counter()
+        verifier.verify(token)
+        after.append((time.perf_counter() - start) * 1e6)
+
+    print(f"Access tokens: {requests} requests over {users} users")
+    report("jwt.decode per request", before)
+    report("TokenVerifier (LRU)", after)
+    print(f"  cache {verifier.stats()}")
+
+
+async def bench_google(base_url, token, logins):
+    before = []
+    for _ in range(logins):
+        start = time.perf_counter()
+        id_token.verify_token(token, google_requests.Request(), CLIENT_ID,
+                              certs_url=f"{base_url}/oauth2/v1/certs")
+        before.append((time.perf_counter() - start) * 1e6)
+
+    google_auth = GoogleAuth(client_id=CLIENT_ID, jwks_url=f"{base_url}/oauth2/v3/certs")
+    await google_auth.start()
+    await google_auth.refresh_keys()
+    after = []
+    for _ in range(logins):
+        start = time.perf_counter()
+        await google_auth.verify_id_token(token)
+        after.append((time.perf_counter() - start) * 1e6)
+    await google_auth.close()
+
+    print(f"Google ID tokens: {logins} logins (local cert server)")
+    report("verify_token, fresh Request() each", before)
+    report("GoogleAuth, cached JWKS", after)
+    print(f"  jwks fetches: {google_auth.jwks_fetches}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    bench_access_tokens(args.requests, args.users)
+    token, jwks, pem_certs = make_google_fixtures()
+    with serve_in_thread(create_certs_app(jwks, pem_certs), args.port) as base_url:
+        asyncio.run(bench_google(base_url, token, args.logins))
+
+
+if __name__ == "__main__":
+    main()
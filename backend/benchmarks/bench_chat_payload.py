@@ -0,0 +1,87 @@
+"""/api/chats payload and latency: embedded messages vs summaries + a message page.
+
+Seeds one user with --chats chats of --messages messages each, then times
+the old read (whole user document, every message) against the new ones
+(chat summaries, and one page of a chat's history). Runs against mongomock
+by default; pass --mongo-uri to use a real mongod.
+
+Usage (from backend/):  python -m benchmarks.bench_chat_payload --chats 20 --messages 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from utils.chat_store import ChatStore
+
+
+def make_messages(count):
+    start = datetime(2024, 1, 1)
+    return [{
+        "role": "user" if i % 2 == 0 else "bot",
+        "text": f"message {i}: " + "lorem ipsum dolor sit amet " * 4,
+        "timestamp": (start + timedelta(seconds=i)).isoformat(),
+        "sentiment": {"scores": {"NEUTRAL": 1.0}, "dominant": "NEUTRAL", "confidence": 1.0} if i % 2 == 0 else None,
+    } for i in range(count)]
+
+
+async def timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = await fn()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        import motor.motor_asyncio
+        client = motor.motor_asyncio.AsyncIOMotorClient(args.mongo_uri)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    db = client.bench_chat_payload
+    await db.users.drop()
+    await db.chats.drop()
+    await db.messages.drop()
+
+    messages = make_messages(args.messages)
+    chats = [{"chat_id": f"chat-{c}", "chat_title": "New Chat", "created_at": messages[0]["timestamp"],
+              "messages": messages} for c in range(args.chats)]
+    await db.users.insert_one({"user_id": "u1", "email": "u1@example.com", "chats": chats})
+
+    store = ChatStore(db)
+    await store.ensure_indexes()
+    for chat in chats:
+        await store.create_chat("u1", chat["chat_id"], chat["chat_title"], chat["created_at"])
+        await store.append_messages("u1", chat["chat_id"], [dict(m) for m in messages])
+
+    async def old_get_chats():
+        user = await db.users.find_one({"email": "u1@example.com"})
+        return {"chats": user.get("chats", [])}
+
+    async def new_get_chats():
+        return {"chats": await store.list_chats("u1")}
+
+    async def new_get_page():
+        page, cursor = await store.get_messages("u1", "chat-0", limit=args.page_size)
+        return {"messages": page, "next_cursor": cursor}
+
+    print(f"{args.chats} chats x {args.messages} messages")
+    for label, fn in (("old /api/chats", old_get_chats),
+                      ("new /api/chats", new_get_chats),
+                      (f"new messages page ({args.page_size})", new_get_page)):
+        payload, latency = await timed(fn)
+        size = len(json.dumps(payload, default=str))
+        print(f"  {label:<28} {size / 1024:10.1f}KB  {latency:8.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
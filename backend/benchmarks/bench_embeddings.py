@@ -0,0 +1,79 @@
+"""Embedding throughput/latency: remote endpoint vs local micro-batched model.
+
+The remote path is exercised against the mock inference server (set
+--remote-url to hit the real API instead). The local path needs the optional
+sentence-transformers package and is skipped without it.
+
+Usage (from backend/):  python -m benchmarks.bench_embeddings --requests 256 --concurrency 1 16 64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.mock_server import serve_in_thread
+from utils.embedding_backends import LocalEmbeddingBackend, RemoteEmbeddingBackend
+from utils.inference_client import AsyncInferenceClient
+
+PORT = 8101
+
+
+async def measure(backend, texts, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(text):
+        async with semaphore:
+            start = time.perf_counter()
+            await backend.embed([text])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(text) for text in texts))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput": len(texts) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+    }
+
+
+def report(label, concurrency, result):
+    print(f"{label:<8} c={concurrency:<4} {result['throughput']:8.1f} texts/s  "
+          f"p50 {result['p50_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--remote-url")
+    args = parser.parse_args()
+
+    texts = [f"I told you about my dog number {i} yesterday" for i in range(args.requests)]
+
+    from benchmarks.mock_inference_server import app
+    with serve_in_thread(app, PORT) as base_url:
+        client = AsyncInferenceClient(token="mock")
+        remote = RemoteEmbeddingBackend(
+            client=client,
+            api_url=args.remote_url or f"{base_url}/models/sentence-transformers/all-MiniLM-L6-v2"
+        )
+        for concurrency in args.concurrency:
+            report("remote", concurrency, await measure(remote, texts, concurrency))
+        await client.close()
+
+    local = LocalEmbeddingBackend()
+    try:
+        await local.start()
+    except ImportError as e:
+        print(f"local    skipped: {e}")
+        return
+    for concurrency in args.concurrency:
+        report("local", concurrency, await measure(local, texts, concurrency))
+    await local.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
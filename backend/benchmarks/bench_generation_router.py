@@ -0,0 +1,147 @@
+"""Generation latency and availability through GenerationRouter against simulated endpoints.
+
+A local mock serves each endpoint profile with its own latency distribution:
+
+  steady      lognormal around --median ms
+  tail        the same, but --tail-rate of replies stall for --stall ms
+              (a slow replica, a GC pause, a cold cache)
+  local       an OpenAI-compatible /v1/completions server (llama.cpp, Ollama),
+              a little slower than the hosted model
+  down        a closed port: every attempt fails to connect
+
+Each scenario routes --requests generations, --concurrency at a time
+(after --warmup unmeasured ones that fill the latency windows), and
+reports latency percentiles, failed requests, the share of requests that
+were hedged, and upstream attempts per request (the extra load hedging
+and failover cost).
+
+  single          one tail endpoint, no hedging: the old hardwired behaviour
+  hedged          the same endpoint, hedged with a duplicate past its p95
+  two primaries   two tail endpoints hedging to each other
+  failover        a down primary before a tail one: the breaker opens and
+                  requests stop paying for the dead endpoint
+  fallback        every primary down: only then is the local model used
+
+Usage (from backend/):  python -m benchmarks.bench_generation_router --requests 1000 --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+from fastapi import FastAPI
+
+from benchmarks.mock_server import serve_in_thread
+from benchmarks.run_suite import percentile
+from utils.generation_router import GenerationRouter, parse_endpoints
+from utils.inference_client import AsyncInferenceClient
+
+REPLY = "Hello from the simulated model!"
+DOWN_URL = "http://127.0.0.1:9/models/down"
+
+
+def make_mock_app(args):
+    app = FastAPI()
+    rng = random.Random(args.seed)
+
+    def latency(profile):
+        seconds = rng.lognormvariate(0, 0.25) * args.median / 1000
+        if profile == "local":
+            seconds *= 1.5
+        if profile.startswith("tail") and rng.random() < args.tail_rate:
+            seconds += args.stall / 1000
+        return seconds
+
+    # Bodies are left unread: a cancelled hedge would otherwise show up as a ClientDisconnect
+    @app.post("/models/{profile}")
+    async def generate(profile: str):
+        await asyncio.sleep(latency(profile))
+        return [{"generated_text": REPLY}]
+
+    @app.post("/v1/{profile}/completions")
+    async def completions(profile: str):
+        await asyncio.sleep(latency(profile))
+        return {"choices": [{"text": REPLY}]}
+
+    return app
+
+
+def scenarios(mock_url):
+    return {
+        "single": ([f"{mock_url}/models/tail"], [], False),
+        "hedged": ([f"{mock_url}/models/tail"], [], True),
+        "two primaries": ([f"{mock_url}/models/tail", f"{mock_url}/models/tail-2"], [], True),
+        "failover": ([DOWN_URL, f"{mock_url}/models/tail"], [], True),
+        "fallback": ([DOWN_URL, DOWN_URL.replace("down", "down-2")],
+                     [f"openai+{mock_url}/v1/local/completions#local"], True),
+    }
+
+
+async def run_scenario(name, primaries, fallbacks, hedge, args):
+    client = AsyncInferenceClient(token="mock")
+    await client.start()
+    router = GenerationRouter(client, endpoints=parse_endpoints(",".join(primaries)),
+                              fallbacks=parse_endpoints(",".join(fallbacks), fallback=True), hedge=hedge)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(measured):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await router.generate("### Instructions:\nSay hi\n\n### Response:", {"max_new_tokens": 20})
+            except Exception:
+                failures += measured
+                return
+            if measured:
+                latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(False) for _ in range(args.warmup)))
+    requests, hedges, attempts = router.requests, router.hedges, router.attempts
+    await asyncio.gather(*(one(True) for _ in range(args.requests)))
+    await client.close()
+
+    measured = router.requests - requests
+    latencies.sort()
+    print(f"  {name:<14} p50 {percentile(latencies, 0.50):7.1f}ms  p95 {percentile(latencies, 0.95):7.1f}ms  "
+          f"p99 {percentile(latencies, 0.99):7.1f}ms  max {percentile(latencies, 1.0):7.1f}ms  "
+          f"failed {failures:>4}  hedged {(router.hedges - hedges) / measured:6.1%}  "
+          f"attempts/request {(router.attempts - attempts) / measured:5.2f}")
+    breakers = {e.name: e.breaker.state for e in router.endpoints + router.fallbacks if e.breaker.state != "closed"}
+    if breakers:
+        print(f"  {'':<14} breakers: {breakers}")
+
+
+async def run(mock_url, args):
+    for name, (primaries, fallbacks, hedge) in scenarios(mock_url).items():
+        await run_scenario(name, primaries, fallbacks, hedge, args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--median", type=float, default=40, help="median endpoint latency, ms")
+    parser.add_argument("--tail-rate", type=float, default=0.03)
+    parser.add_argument("--stall", type=float, default=500, help="extra latency of a stalled reply, ms")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8220)
+    args = parser.parse_args()
+    # Failing attempts against the down endpoints are expected; the summary counts what matters
+    logging.getLogger("utils.generation_router").setLevel(logging.ERROR)
+    # Admission control is not what is being measured
+    os.environ.setdefault("INFERENCE_MAX_CONCURRENCY", "64")
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, median {args.median:.0f}ms, "
+          f"{args.tail_rate:.0%} stall {args.stall:.0f}ms")
+    with serve_in_thread(make_mock_app(args), args.port) as mock_url:
+        asyncio.run(run(mock_url, args))
+
+
+if __name__ == "__main__":
+    main()
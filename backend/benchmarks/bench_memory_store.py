@@ -0,0 +1,87 @@
+"""Insert and cold-load cost: legacy hex-encoded JSON vs the binary append-only store.
+
+For each size N the user already has N memories. "insert" is the cost of
+adding one more; "cold load" is the cost of getting a searchable index back
+from disk. Vectors are random, so no embedding model is involved.
+
+Usage (from backend/):  python -m benchmarks.bench_memory_store --sizes 10000 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from utils.memory_store import UserMemoryStore
+
+DIMENSION = 384
+
+
+def legacy_save(path, texts, index):
+    # What MemoryManager.save_memories did on every add_memory
+    with open(path, "w") as f:
+        json.dump({"memories": texts, "index_data": faiss.serialize_index(index).tobytes().hex()}, f)
+
+
+def legacy_load(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    return data["memories"], faiss.deserialize_index(np.frombuffer(bytes.fromhex(data["index_data"]), dtype=np.uint8))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def bench(size, workdir):
+    texts = [f"memory number {i}: I like hiking on weekends" for i in range(size)]
+    vectors = np.random.default_rng(0).standard_normal((size, DIMENSION)).astype("float32")
+    extra = np.random.default_rng(1).standard_normal(DIMENSION).astype("float32")
+
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors)
+    legacy_path = os.path.join(workdir, f"legacy-{size}.json")
+    legacy_save(legacy_path, texts, index)
+
+    def legacy_insert():
+        index.add(extra[None, :])
+        legacy_save(legacy_path, texts + ["one more"], index)
+
+    store_path = os.path.join(workdir, f"store-{size}")
+    UserMemoryStore.write_new(store_path, DIMENSION, texts, vectors)
+    store = UserMemoryStore(store_path, DIMENSION)
+
+    def store_load():
+        loaded = UserMemoryStore(store_path, DIMENSION)
+        faiss.IndexFlatL2(DIMENSION).add(np.ascontiguousarray(loaded.vectors()))
+
+    return {
+        "legacy_insert_ms": timed(legacy_insert),
+        "store_insert_ms": timed(lambda: store.append("one more", extra)),
+        "legacy_load_ms": timed(lambda: legacy_load(legacy_path)),
+        "store_load_ms": timed(store_load),
+        "legacy_bytes": os.path.getsize(legacy_path),
+        "store_bytes": sum(os.path.getsize(os.path.join(store_path, f)) for f in os.listdir(store_path)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            r = bench(size, workdir)
+            print(f"N={size:<7} insert legacy {r['legacy_insert_ms']:9.1f}ms  store {r['store_insert_ms']:6.2f}ms | "
+                  f"cold load legacy {r['legacy_load_ms']:8.1f}ms  store {r['store_load_ms']:7.1f}ms | "
+                  f"disk legacy {r['legacy_bytes'] / 1e6:7.1f}MB  store {r['store_bytes'] / 1e6:6.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
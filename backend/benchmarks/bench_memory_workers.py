@@ -0,0 +1,149 @@
+"""MemoryManager throughput and correctness with 1..N worker processes sharing one memories directory.
+
+Each worker process runs its own MemoryManager (as uvicorn --workers
+would) over the same directory and, for --duration seconds, either adds a
+memory or searches a random user's memories (--write-ratio adds). Texts
+embed to deterministic random vectors, so no model is involved. Reported
+per worker count:
+
+  ops/s       adds + searches per second, all workers together
+  stale       searches whose resident view was behind the disk at the time
+              (bounded by MEMORY_MAX_STALENESS_MS when process safe)
+  lost        adds a worker made that are missing from the final store
+  corrupt     stored texts that don't decode to something a worker wrote
+
+--unsafe also runs every level with MEMORY_PROCESS_SAFE=false, the old
+behaviour, where workers append from stale offsets and never see each
+other's writes. Throughput only scales up to the number of cores.
+
+Usage (from backend/):  python -m benchmarks.bench_memory_workers --workers 1,2,4 --duration 5
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from utils.embedding_backends import EmbeddingBackend
+from utils.memory_store import OFFSETS_FILE, UserMemoryStore
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    name = "hash"
+
+    async def embed(self, texts):
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+            vectors.append(np.random.default_rng(seed).standard_normal(self.dimension))
+        vectors = np.asarray(vectors, dtype="float32")
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+async def worker_loop(worker, index_dir, args, results):
+    from utils.memory_manager import MemoryManager
+
+    manager = MemoryManager(index_dir=index_dir, embedding_backend=HashEmbeddingBackend())
+    rng = random.Random(worker)
+    users = [f"user-{i}" for i in range(args.users)]
+    added = []
+    ops = searches = stale = 0
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        user_id = rng.choice(users)
+        if rng.random() < args.write_ratio:
+            text = f"{user_id}|{worker}|{len(added)}|likes hiking with friends"
+            if await manager.add_memories(user_id, [text]):
+                added.append(text)
+        else:
+            await manager.get_relevant_memories(user_id, f"what does {user_id} like doing?")
+            entry = manager.residency.get(user_id)
+            if entry is not None:
+                on_disk = os.path.getsize(os.path.join(index_dir, user_id, OFFSETS_FILE)) // 16
+                stale += len(entry[1]) < on_disk
+            searches += 1
+        ops += 1
+    manager.close()
+    results.put({"worker": worker, "ops": ops, "searches": searches, "stale": stale, "added": added})
+
+
+def run_worker(worker, index_dir, args, env, results):
+    logging.getLogger("utils.memory_store").setLevel(logging.ERROR)
+    os.environ.update(env)
+    asyncio.run(worker_loop(worker, index_dir, args, results))
+
+
+def verify(index_dir, added, dimension):
+    """(lost, corrupt) against what the workers say they added"""
+    expected = {}
+    for text in added:
+        expected.setdefault(text.split("|")[0], set()).add(text)
+    lost = corrupt = 0
+    for user_id, texts in expected.items():
+        store = UserMemoryStore(os.path.join(index_dir, user_id), dimension)
+        stored = set()
+        for i in range(len(store)):
+            try:
+                stored.add(store[i])
+            except UnicodeDecodeError:
+                corrupt += 1
+        corrupt += len(stored - texts)
+        lost += len(texts - stored)
+    return lost, corrupt
+
+
+def run_level(workers, process_safe, args):
+    env = {
+        "MEMORY_PROCESS_SAFE": "true" if process_safe else "false",
+        "MEMORY_MAX_STALENESS_MS": str(args.staleness_ms),
+        "MEMORY_STORE_FSYNC": "1" if args.fsync else "0",
+    }
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    with tempfile.TemporaryDirectory(prefix="bench-memory-workers-") as index_dir:
+        processes = [context.Process(target=run_worker, args=(worker, index_dir, args, env, results))
+                     for worker in range(workers)]
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        added = [text for report in reports for text in report["added"]]
+        lost, corrupt = verify(index_dir, added, HashEmbeddingBackend.dimension)
+
+    ops = sum(report["ops"] for report in reports)
+    searches = sum(report["searches"] for report in reports)
+    stale = sum(report["stale"] for report in reports)
+    print(f"  {'safe' if process_safe else 'unsafe':<7} workers {workers:>2}: {ops / args.duration:8.0f} ops/s  "
+          f"stale {stale / searches if searches else 0:6.1%}  lost {lost:>5}  corrupt {corrupt:>5}  "
+          f"({len(added)} adds)")
+
+
+def main():
+    # The unsafe runs tear records on purpose; verify() counts them instead
+    logging.getLogger("utils.memory_store").setLevel(logging.ERROR)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--staleness-ms", type=float, default=1000)
+    parser.add_argument("--fsync", action="store_true")
+    parser.add_argument("--unsafe", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.users} users, {args.write_ratio:.0%} adds, "
+          f"staleness bound {args.staleness_ms:.0f}ms, fsync {'on' if args.fsync else 'off'}")
+    for workers in (int(level) for level in args.workers.split(",")):
+        for process_safe in ((True, False) if args.unsafe else (True,)):
+            run_level(workers, process_safe, args)
+
+
+if __name__ == "__main__":
+    main()
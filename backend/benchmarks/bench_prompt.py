@@ -0,0 +1,84 @@
+"""Prompt size and build time: the old unbounded f-string vs the budgeted PromptBuilder.
+
+Each scenario builds the system prompt --repeat times and reports its
+tokens (the real tokenizer if the optional `tokenizers` package can load
+PROMPT_TOKENIZER, otherwise the estimate) and the mean build time.
+
+Usage (from backend/):  python -m benchmarks.bench_prompt --budget 1024
+"""
+import argparse
+import time
+
+from utils.prompt_builder import PromptBuilder
+from utils.token_counter import TokenCounter
+
+SENTIMENT = {"dominant": "JOY", "confidence": 0.87}
+TRAITS = ["caring", "empathetic", "playful"]
+
+
+def legacy_build_prompt(relationship_stage, memories, sentiment, personality_traits):
+    # PromptBuilder.build_prompt before the token budget
+    stage_info = PromptBuilder.RELATIONSHIP_STAGES.get(relationship_stage, PromptBuilder.RELATIONSHIP_STAGES["acquaintance"])
+    emotion = sentiment.get('dominant', 'NEUTRAL').replace('LABEL_', '')
+    confidence = sentiment.get('confidence', 1.0)
+    memory_text = "\n".join(f"• {memory}" for memory in memories) if memories else "No previous memories."
+    return f"""You are a caring AI companion speaking in a {stage_info['tone']} manner.
+
+Context:
+• Relationship: {relationship_stage}
+• User's Mood: {emotion} ({confidence:.0%} confidence)
+• Previous Interactions:
+{memory_text}
+
+Remember to:
+1. Be natural and engaging
+2. Match the appropriate tone for our {relationship_stage} relationship
+3. Keep responses concise and meaningful
+4. Show emotional awareness
+5. Stay consistent in personality
+
+Your response should be warm yet appropriate for our current relationship stage."""
+
+
+def make_turns(count):
+    return [{"role": "user" if i % 2 == 0 else "bot",
+             "text": f"turn {i}: " + "I had a long day at work but it got better in the evening. " * 2}
+            for i in range(count)]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        prompt = fn()
+    return prompt, (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    counter = TokenCounter()
+    counter.load()
+    builder = PromptBuilder(token_counter=counter, token_budget=args.budget)
+    message = "Good morning! How did you sleep?"
+
+    scenarios = {
+        "3 short memories": (["Likes hiking on weekends", "Has a cat named Miso", "Works as a nurse"], []),
+        "3 long memories": (["We talked about their trip to Japan. " * 120] * 3, []),
+        "3 short memories + 20 turns": (["Likes hiking on weekends", "Has a cat named Miso", "Works as a nurse"],
+                                        make_turns(20)),
+    }
+    print(f"budget {args.budget} tokens, {'exact' if counter.exact else 'estimated'} counts")
+    for label, (memories, turns) in scenarios.items():
+        old, old_us = timed(lambda: legacy_build_prompt("friend", memories, SENTIMENT, TRAITS), args.repeat)
+        new, new_us = timed(lambda: builder.build_prompt("friend", memories, SENTIMENT, TRAITS,
+                                                         recent_turns=turns, message=message), args.repeat)
+        old_note = "  (no turns)" if turns else ""
+        print(f"  {label:<30} old {counter.count(old):6d} tok {old_us:7.1f}us{old_note}   "
+              f"new {counter.count(new):6d} tok {new_us:7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
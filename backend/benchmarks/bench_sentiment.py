@@ -0,0 +1,117 @@
+"""Per-message sentiment cost for each path through SentimentAnalyzer.
+
+  legacy        the old analyze(): a new httpx.AsyncClient (and connection) per message
+  remote        RemoteSentimentBackend over the pooled AsyncInferenceClient
+  local         LocalSentimentBackend, sequential and --concurrency at a time
+                (skipped unless the optional transformers package is installed)
+  fast path     the lexicon path for short trivial messages
+  cache hit     a repeated (normalized) message
+
+Remote paths hit the local mock with --latency seconds of model time; it
+speaks plain HTTP, so the legacy numbers leave out the TLS handshake a
+fresh connection to the real API also pays.
+
+Usage (from backend/):  python -m benchmarks.bench_sentiment --messages 500 --latency 0
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.mock_server import serve_in_thread
+from utils.inference_client import AsyncInferenceClient
+from utils.sentiment_analyzer import SentimentAnalyzer
+from utils.sentiment_backends import LocalSentimentBackend, RemoteSentimentBackend
+
+PATH = "/models/cardiffnlp/twitter-roberta-base-sentiment"
+TRIVIAL = ["hi!", "thanks 😊", "ok", "lol", "ugh", "good morning", "hmm?", "tired :("]
+
+
+def make_messages(count):
+    return [f"message {i}: I went for a walk after work and thought about what you said yesterday"
+            for i in range(count)]
+
+
+async def legacy_analyze(api_url, text):
+    # SentimentAnalyzer.analyze before the pooled client
+    async with httpx.AsyncClient() as client:
+        response = await client.post(api_url, headers={"Authorization": "Bearer mock"}, json={"inputs": text})
+        results = response.json()[0]
+        dominant = max(results, key=lambda x: x['score'])
+        return {"scores": {item['label']: item['score'] for item in results},
+                "dominant": dominant['label'], "confidence": dominant['score']}
+
+
+async def per_message(label, analyze, messages):
+    start = time.perf_counter()
+    for message in messages:
+        await analyze(message)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed / len(messages) * 1e6:10.1f}us/message")
+
+
+async def concurrent(label, analyze, messages, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(message):
+        async with semaphore:
+            await analyze(message)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(message) for message in messages))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed / len(messages) * 1e6:10.1f}us/message  ({len(messages) / elapsed:.0f} messages/s)")
+
+
+async def run(base_url, args):
+    api_url = f"{base_url}{PATH}"
+    messages = make_messages(args.messages)
+    print(f"{args.messages} messages, {args.latency * 1000:.0f}ms mock model latency")
+
+    await per_message("legacy (client per call)", lambda text: legacy_analyze(api_url, text), messages)
+
+    client = AsyncInferenceClient(token="mock")
+    await client.start()
+    remote = SentimentAnalyzer(backend=RemoteSentimentBackend(client=client, api_url=api_url))
+    await per_message("remote (pooled client)", remote.analyze, messages)
+    await per_message("cache hit", remote.analyze, messages)
+    # A one-entry cache never holds the next of the cycling trivial messages
+    fast = SentimentAnalyzer(backend=remote.backend, cache_size=1)
+    await per_message("fast path (lexicon)", fast.analyze, TRIVIAL * (args.messages // len(TRIVIAL)))
+    print(f"  remote {remote.stats()}")
+    print(f"  fast path {fast.stats()}")
+    await client.close()
+
+    local_backend = LocalSentimentBackend()
+    try:
+        await local_backend.start()
+    except ImportError as e:
+        print(f"  local: skipped ({e})")
+        return
+    local = SentimentAnalyzer(backend=local_backend, cache_size=1, fast_path_words=0)
+    await per_message("local model (sequential)", local.analyze, messages[:args.local_messages])
+    await concurrent(f"local model (x{args.concurrency})", local.analyze, messages[-args.local_messages:],
+                     args.concurrency)
+    await local_backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--local-messages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8102)
+    args = parser.parse_args()
+
+    os.environ["MOCK_SENTIMENT_LATENCY"] = str(args.latency)
+    from benchmarks.mock_inference_server import app
+
+    with serve_in_thread(app, args.port) as base_url:
+        asyncio.run(run(base_url, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Per-user indices vs the shared sharded index: RSS, file count, query latency.
+
+Each layout is built on disk, then loaded fully resident in a fresh child
+process so its RSS is measured in isolation. Vectors are random and
+normalized; no embedding model is involved.
+
+Usage (from backend/):  python -m benchmarks.bench_shared_index --users 100000 --memories-per-user 5
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+from utils.memory_store import UserMemoryStore
+from utils.shared_memory_index import USERS_FILE, IDS_FILE, MemoryShard, encode_id
+from utils.tiered_index import TieredIndex
+
+DIMENSION = 384
+
+
+def rss_bytes():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def count_files(path):
+    return sum(len(files) for _, _, files in os.walk(path))
+
+
+def user_vectors(user, per_user):
+    vectors = np.random.default_rng(user).standard_normal((per_user, DIMENSION)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_per_user(path, users, per_user):
+    for user in range(users):
+        texts = [f"user {user} memory {i}" for i in range(per_user)]
+        UserMemoryStore.write_new(os.path.join(path, f"user{user}"), DIMENSION, texts, user_vectors(user, per_user), fsync=False)
+
+
+def build_shared(path, users, per_user, num_shards):
+    os.makedirs(path)
+    shards = {s: ([], [], []) for s in range(num_shards)}
+    with open(os.path.join(path, USERS_FILE), "w") as f:
+        for user in range(users):
+            f.write(f"user{user}\t{user}\n")
+            texts, vectors, ids = shards[zlib.crc32(f"user{user}".encode()) % num_shards]
+            texts.extend(f"user {user} memory {i}" for i in range(per_user))
+            vectors.append(user_vectors(user, per_user))
+            ids.extend(encode_id(user, i) for i in range(per_user))
+    for shard_id, (texts, vectors, ids) in shards.items():
+        shard_path = os.path.join(path, f"shard_{shard_id:03d}")
+        UserMemoryStore.write_new(shard_path, DIMENSION, texts, np.vstack(vectors), fsync=False)
+        np.array(ids, dtype="<i8").tofile(os.path.join(shard_path, IDS_FILE))
+
+
+def measure_per_user(path, users, queries, result):
+    base = rss_bytes()
+    resident = {}
+    for user in range(users):
+        store = UserMemoryStore(os.path.join(path, f"user{user}"), DIMENSION, fsync=False)
+        resident[user] = (TieredIndex(DIMENSION, np.array(store.vectors()), source=store.vectors), store)
+    loaded = rss_bytes()
+    start = time.perf_counter()
+    for user, query in queries:
+        index, store = resident[user]
+        _, found = index.search(query[None, :], 3)
+        [store[int(i)] for i in found[0] if i >= 0]
+    result.update(rss=loaded - base, query_us=(time.perf_counter() - start) / len(queries) * 1e6)
+
+
+def measure_shared(path, num_shards, queries, result):
+    base = rss_bytes()
+    shards = {s: MemoryShard(os.path.join(path, f"shard_{s:03d}"), DIMENSION, fsync=False) for s in range(num_shards)}
+    loaded = rss_bytes()
+    start = time.perf_counter()
+    for user, query in queries:
+        shards[zlib.crc32(f"user{user}".encode()) % num_shards].search(user, query, 3)
+    result.update(rss=loaded - base, query_us=(time.perf_counter() - start) / len(queries) * 1e6)
+
+
+def in_child(target, *args):
+    # spawn, not fork: a forked child inherits the builder's already-resident heap
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        result = manager.dict()
+        process = context.Process(target=target, args=(*args, result))
+        process.start()
+        process.join()
+        return dict(result)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--memories-per-user", type=int, default=5)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = [(int(u), user_vectors(int(u), 1)[0]) for u in rng.integers(0, args.users, args.queries)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        per_user_path = os.path.join(workdir, "per_user")
+        shared_path = os.path.join(workdir, "shared")
+        build_per_user(per_user_path, args.users, args.memories_per_user)
+        build_shared(shared_path, args.users, args.memories_per_user, args.shards)
+
+        per_user = in_child(measure_per_user, per_user_path, args.users, queries)
+        shared = in_child(measure_shared, shared_path, args.shards, queries)
+
+        print(f"{args.users} users x {args.memories_per_user} memories")
+        print(f"  per_user  files {count_files(per_user_path):>8}  RSS {per_user['rss'] / 1e6:8.1f}MB  "
+              f"query {per_user['query_us']:8.1f}us")
+        print(f"  shared    files {count_files(shared_path):>8}  RSS {shared['rss'] / 1e6:8.1f}MB  "
+              f"query {shared['query_us']:8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Cold-start cost of the app: import time and time to the first served requests.
+
+  import      `import main` in a fresh interpreter, median of --imports runs,
+              plus the slowest imports main triggers directly (`python -X importtime`)
+  startup     benchmarks.app_server in a fresh process against the mock
+              inference server (and mongomock), timed from spawn to:
+                health         first 200 from /health
+                ready          first 200 from /ready
+                first message  a new chat and one POST /api/chat/{id}/message,
+                               which pays for whatever is still loaded lazily
+              once with PREWARM=false and once with PREWARM=true, median of
+              --runs runs each
+
+Numbers include interpreter start-up and seeding the fixture users, so
+compare them across commits rather than reading them as absolutes.
+
+Usage (from backend/):  python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fixtures import access_token, bench_email
+from benchmarks.mock_server import serve_in_thread
+from benchmarks.run_suite import BACKEND_DIR, app_environment
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def clean_environment():
+    # main must import without any configuration
+    return {key: value for key, value in os.environ.items() if key != "MONGO_URI"}
+
+
+def time_imports(runs):
+    seconds = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=clean_environment(),
+                                capture_output=True, text=True, check=True).stdout
+        seconds.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(seconds)
+
+
+def slowest_imports(count):
+    """(cumulative microseconds, module) for main's slowest direct imports"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                            env=clean_environment(), capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # One level of indent: imported by main itself
+        if name.startswith("   ") and not name.startswith("    "):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def wait_for(client, path, process, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("App server exited during startup")
+        try:
+            if client.get(path, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{path} did not answer in time")
+
+
+def time_startup(mock_url, port, prewarm):
+    env = app_environment(mock_url, [f"PREWARM={'true' if prewarm else 'false'}"])
+    command = [sys.executable, "-m", "benchmarks.app_server", "--port", str(port), "--users", "1"]
+    base_url = f"http://127.0.0.1:{port}"
+    headers = {"Authorization": f"Bearer {access_token(bench_email(0))}"}
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as workdir:
+        spawned = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            with httpx.Client(base_url=base_url, timeout=30) as client:
+                health = wait_for(client, "/health", process)
+                ready = wait_for(client, "/ready", process)
+                chat_id = client.post("/api/chat/new", json={"chat_title": "Bench"}, headers=headers).json()["chat_id"]
+                client.post(f"/api/chat/{chat_id}/message", json={"message": "hi, how was your day?"},
+                            headers=headers).raise_for_status()
+                first_message = time.perf_counter()
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return {"health": health - spawned, "ready": ready - spawned, "first message": first_message - spawned}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--imports", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8210)
+    parser.add_argument("--mock-port", type=int, default=8211)
+    args = parser.parse_args()
+
+    print(f"import main: {time_imports(args.imports) * 1000:.0f}ms (median of {args.imports})")
+    for cumulative, name in slowest_imports(args.top):
+        print(f"  {name:<32} {cumulative / 1000:8.1f}ms")
+
+    # The first message's generation should not dominate what is being measured
+    os.environ.update({"MOCK_LATENCY": "0", "MOCK_SENTIMENT_LATENCY": "0", "MOCK_EMBEDDING_LATENCY": "0"})
+    from benchmarks.mock_inference_server import app as mock_app
+
+    with serve_in_thread(mock_app, args.mock_port) as mock_url:
+        for prewarm in (False, True):
+            runs = [time_startup(mock_url, args.port, prewarm) for _ in range(args.runs)]
+            print(f"PREWARM={'true' if prewarm else 'false'} (median of {args.runs}, from spawn)")
+            for milestone in runs[0]:
+                print(f"  {milestone:<14} {statistics.median(run[milestone] for run in runs) * 1000:8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Chat sync cost at N idle clients: full /api/chats polling vs versioned delta sync.
+
+Seeds --clients users with --chats chats each, then runs one 30s polling
+cycle for every client concurrently, as the old full fetch and as the new
+`since=<version>` request, and reports bytes sent and Mongo work (queries
+and documents returned). A second cycle after each user receives one new
+exchange shows the delta payload. With the push channel open, idle clients
+make no requests at all. Runs against mongomock by default; pass
+--mongo-uri to use a real mongod.
+
+Usage (from backend/):  python -m benchmarks.bench_sync --clients 1000 --chats 20
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.bench_chat_payload import make_messages
+from utils.chat_store import ChatStore
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, *args, **kwargs):
+        self.cursor = self.cursor.limit(*args, **kwargs)
+        return self
+
+    async def to_list(self, length=None):
+        docs = await self.cursor.to_list(length=length)
+        self.counter["docs"] += len(docs)
+        return docs
+
+
+class CountingCollection:
+    """Counts read queries and returned documents on a motor collection"""
+
+    def __init__(self, collection, counter):
+        self.collection = collection
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def find(self, *args, **kwargs):
+        self.counter["queries"] += 1
+        return CountingCursor(self.collection.find(*args, **kwargs), self.counter)
+
+    async def find_one(self, *args, **kwargs):
+        self.counter["queries"] += 1
+        doc = await self.collection.find_one(*args, **kwargs)
+        self.counter["docs"] += doc is not None
+        return doc
+
+
+class CountingDb:
+    def __init__(self, db, counter):
+        self.db = db
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return CountingCollection(getattr(self.db, name), self.counter)
+
+
+async def full_fetch(store, user_id):
+    return {"version": await store.get_version(user_id), "chats": await store.list_chats(user_id)}
+
+
+async def delta_fetch(store, user_id, since):
+    # Mirrors get_chats: 304 with an empty body when nothing changed
+    version = await store.get_version(user_id)
+    if version == since:
+        return None
+    return {"version": version, "since": since, **await store.changes_since(user_id, since)}
+
+
+async def run_cycle(label, counter, requests):
+    counter["queries"] = counter["docs"] = 0
+    start = time.perf_counter()
+    payloads = await asyncio.gather(*requests)
+    elapsed = time.perf_counter() - start
+    size = sum(len(json.dumps(p, default=str)) for p in payloads if p is not None)
+    not_modified = sum(p is None for p in payloads)
+    print(f"  {label:<34} {size / 1024:10.1f}KB  {counter['queries']:7d} queries  "
+          f"{counter['docs']:8d} docs  {not_modified:5d} x 304  {elapsed * 1000:8.0f}ms")
+    return payloads
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        import motor.motor_asyncio
+        client = motor.motor_asyncio.AsyncIOMotorClient(args.mongo_uri)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    raw_db = client.bench_sync
+    for name in ("chats", "messages", "sync_state"):
+        await raw_db[name].drop()
+
+    counter = {"queries": 0, "docs": 0}
+    store = ChatStore(CountingDb(raw_db, counter))
+    await store.ensure_indexes()
+    messages = make_messages(2)
+    users = [f"user-{u}" for u in range(args.clients)]
+    for user_id in users:
+        for c in range(args.chats):
+            await store.create_chat(user_id, f"chat-{c}", "New Chat", messages[0]["timestamp"])
+            await store.append_messages(user_id, f"chat-{c}", [dict(m) for m in messages])
+
+    versions = {user_id: await store.get_version(user_id) for user_id in users}
+
+    print(f"{args.clients} clients x {args.chats} chats, one polling cycle")
+    await run_cycle("idle, full /api/chats", counter, [full_fetch(store, u) for u in users])
+    await run_cycle("idle, since=<version>", counter, [delta_fetch(store, u, versions[u]) for u in users])
+    print(f"  {'idle, push channel':<34} {0:10.1f}KB  {0:7d} queries  {0:8d} docs")
+
+    for user_id in users:
+        await store.append_messages(user_id, "chat-0", [dict(m) for m in make_messages(2)])
+    await run_cycle("1 new exchange, full /api/chats", counter, [full_fetch(store, u) for u in users])
+    await run_cycle("1 new exchange, since=<version>", counter, [delta_fetch(store, u, versions[u]) for u in users])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
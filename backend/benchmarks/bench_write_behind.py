@@ -0,0 +1,160 @@
+"""Message persistence: direct Mongo writes vs write-behind with a local WAL.
+
+Two phases per mode, each with --clients concurrent users:
+
+  burst  every user appends --turns exchanges back to back; reports
+         appends/s and the acknowledgement latency.
+  turns  every user runs --turns message turns the way add_message does:
+         read the chat context, "generate" for --generation-ms, persist
+         the exchange, then read and type for --think-ms. Reports context
+         read and persist latency (reads include waiting for the user's
+         own queued writes in write-behind mode).
+
+Both report the number of Mongo write operations issued.
+
+mongomock has no network, so every Mongo call is delayed by --rtt-ms to
+stand in for the round trip; pass --mongo-uri to use a real mongod instead
+(and --rtt-ms 0).
+
+Usage (from backend/):  python -m benchmarks.bench_write_behind --clients 50 --turns 10
+"""
+import argparse
+import asyncio
+import inspect
+import shutil
+import tempfile
+import time
+
+from benchmarks.bench_chat_payload import make_messages
+from utils.chat_store import ChatStore
+from utils.write_behind import WriteBehindChatStore
+
+
+class LatencyCollection:
+    """Adds a fixed delay to every awaited collection call and counts writes"""
+
+    WRITES = {"insert_one", "insert_many", "update_one", "find_one_and_update", "bulk_write", "delete_many"}
+
+    def __init__(self, collection, rtt, counter):
+        self.collection = collection
+        self.rtt = rtt
+        self.counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if not inspect.isawaitable(result):
+                return result
+
+            async def delayed():
+                if name in self.WRITES:
+                    self.counter["writes"] += 1
+                try:
+                    if self.rtt:
+                        await asyncio.sleep(self.rtt)
+                except asyncio.CancelledError:
+                    result.close()
+                    raise
+                return await result
+            return delayed()
+        return call
+
+
+class LatencyDb:
+    def __init__(self, db, rtt, counter):
+        self.db = db
+        self.rtt = rtt
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return LatencyCollection(getattr(self.db, name), self.rtt, self.counter)
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+
+
+async def run_mode(label, store, counter, args):
+    await store.ensure_indexes()
+    await store.start()
+    users = [f"user-{u}" for u in range(args.clients)]
+    for user_id in users:
+        await store.create_chat(user_id, "chat", "New Chat", "2024-01-01T00:00:00")
+
+    async def persist(user_id, context, latencies):
+        start = time.perf_counter()
+        await store.append_messages(user_id, "chat", [dict(m) for m in make_messages(2)], context=context)
+        latencies.append(time.perf_counter() - start)
+
+    async def burst(user_id, latencies):
+        for _ in range(args.turns):
+            await persist(user_id, None, latencies)
+
+    async def turns(user_id, latencies, reads):
+        for _ in range(args.turns):
+            start = time.perf_counter()
+            context = await store.get_context(user_id, "chat")
+            reads.append(time.perf_counter() - start)
+            await asyncio.sleep(args.generation_ms / 1000)
+            await persist(user_id, context, latencies)
+            await asyncio.sleep(args.think_ms / 1000)
+
+    counter["writes"] = 0
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(burst(user_id, latencies) for user_id in users))
+    if hasattr(store, "flush"):
+        await store.flush()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"  {label:<13} burst  {len(latencies) / elapsed:6.0f} appends/s        ack p50 {percentile(latencies, 0.5):7.2f}ms  "
+          f"p99 {percentile(latencies, 0.99):7.2f}ms   {counter['writes']:6d} Mongo writes")
+
+    counter["writes"] = 0
+    latencies, reads = [], []
+    await asyncio.gather(*(turns(user_id, latencies, reads) for user_id in users))
+    latencies.sort()
+    reads.sort()
+    print(f"  {label:<13} turns  read p99 {percentile(reads, 0.99):7.2f}ms   persist p50 {percentile(latencies, 0.5):7.2f}ms  "
+          f"p99 {percentile(latencies, 0.99):7.2f}ms   {counter['writes']:6d} Mongo writes")
+    await store.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--generation-ms", type=float, default=200)
+    parser.add_argument("--think-ms", type=float, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients x {args.turns} turns, {args.rtt_ms}ms per Mongo call")
+    for mode in ("sync", "write_behind"):
+        if args.mongo_uri:
+            import motor.motor_asyncio
+            raw_db = motor.motor_asyncio.AsyncIOMotorClient(args.mongo_uri)[f"bench_write_{mode}"]
+        else:
+            from mongomock_motor import AsyncMongoMockClient
+            raw_db = AsyncMongoMockClient()[f"bench_write_{mode}"]
+        for name in ("chats", "messages", "sync_state"):
+            await raw_db[name].drop()
+        counter = {"writes": 0}
+        db = LatencyDb(raw_db, args.rtt_ms / 1000, counter)
+        if mode == "sync":
+            await run_mode(mode, ChatStore(db), counter, args)
+        else:
+            wal_dir = tempfile.mkdtemp()
+            try:
+                await run_mode(mode, WriteBehindChatStore(db, wal_dir=wal_dir), counter, args)
+            finally:
+                shutil.rmtree(wal_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Deterministic users and credentials shared by the benchmarks and the mock servers"""
+import base64
+import datetime
+import functools
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from jose import jwt
+
+SECRET_KEY = "bench-secret"
+ALGORITHM = "HS256"
+CLIENT_ID = "bench-client-id"
+KID = "bench-key"
+
+
+def b64url_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+@functools.lru_cache(maxsize=1)
+def make_google_fixtures():
+    """(signed ID token, JWKS, PEM certs) for a throwaway RSA key; generated once per process"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench")])
+    now = datetime.datetime.utcnow()
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(1)
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    numbers = key.public_key().public_numbers()
+    jwks = {"keys": [{"kty": "RSA", "alg": "RS256", "use": "sig", "kid": KID,
+                      "n": b64url_uint(numbers.n), "e": b64url_uint(numbers.e)}]}
+    pem_certs = {KID: cert.public_bytes(serialization.Encoding.PEM).decode()}
+    token = jwt.encode(
+        {"iss": "https://accounts.google.com", "aud": CLIENT_ID, "sub": "123", "email": "bench@example.com",
+         "iat": int(time.time()), "exp": int(time.time()) + 3600},
+        private_pem, algorithm="RS256", headers={"kid": KID}
+    )
+    return token, jwks, pem_certs
+
+
+def bench_email(index: int) -> str:
+    return f"user{index}@example.com"
+
+
+def bench_user(index: int) -> dict:
+    """The users-collection document the OAuth callback would have created"""
+    return {
+        "user_id": f"bench-user-{index}",
+        "email": bench_email(index),
+        "name": f"Bench User {index}",
+        "picture": "",
+        "relationship_stage": ("acquaintance", "friend", "girlfriend")[index % 3],
+        "personality_traits": ["caring", "empathetic", "playful"],
+    }
+
+
+def access_token(email: str, minutes: int = 24 * 60) -> str:
+    """An app access token as create_access_token issues them, signed with SECRET_KEY"""
+    expire = datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes)
+    return jwt.encode({"sub": email, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+
+async def seed_users(collection, count: int) -> None:
+    await collection.delete_many({"email": {"$regex": r"^user\d+@example\.com$"}})
+    await collection.insert_many([bench_user(i) for i in range(count)])
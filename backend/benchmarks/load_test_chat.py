@@ -0,0 +1,60 @@
+"""Load test: blocking httpx.post vs the pooled AsyncInferenceClient.
+
+Starts the mock inference server in a background thread and fires N concurrent
+generations through each path. With the blocking client the event loop
+serializes every call (wall time ~ N * latency); with the async client the
+calls overlap (wall time ~ latency).
+
+Usage (from backend/):  python -m benchmarks.load_test_chat --requests 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.mock_server import serve_in_thread
+from utils.inference_client import AsyncInferenceClient
+
+PORT = 8100
+URL = f"http://127.0.0.1:{PORT}/models/mock-mistral"
+PAYLOAD = {"inputs": "### Instructions:\nSay hi\n\n### Response:", "parameters": {"max_new_tokens": 150}}
+
+
+async def blocking_call():
+    # What chat_with_mistral used to do inside the async route
+    return httpx.post(URL, json=PAYLOAD).json()
+
+
+async def run(label, call, n):
+    start = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {n} concurrent requests in {elapsed:.2f}s ({n / elapsed:.1f} req/s)")
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    os.environ["MOCK_LATENCY"] = str(args.latency)
+    from benchmarks.mock_inference_server import app
+
+    # The server gets its own thread/loop so the blocking baseline can't stall it
+    with serve_in_thread(app, PORT):
+        client = AsyncInferenceClient(token="mock")
+        await client.start()
+        try:
+            blocking = await run("blocking", blocking_call, args.requests)
+            pooled = await run("async", lambda: client.post_json(URL, PAYLOAD), args.requests)
+            print(f"speedup: {blocking / pooled:.1f}x")
+        finally:
+            await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
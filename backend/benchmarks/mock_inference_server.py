@@ -0,0 +1,87 @@
+"""Local stand-in for the Hugging Face inference endpoints and Google's signing keys.
+
+Serves text generation (plain and streamed), sentiment classification,
+feature extraction for sentence-transformers models, and the JWKS from
+benchmarks.fixtures. Latencies and an injected error rate (503 with
+Retry-After, which the inference client retries) come from the environment:
+
+  MOCK_LATENCY            generation, seconds (spread over the tokens when streaming)
+  MOCK_EMBEDDING_LATENCY  feature extraction, seconds
+  MOCK_SENTIMENT_LATENCY  sentiment classification, seconds
+  MOCK_ERROR_RATE         fraction of model requests answered with 503
+  MOCK_SEED               seed for the error injection
+
+Run with:  MOCK_LATENCY=0.5 uvicorn benchmarks.mock_inference_server:app --port 8100
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+import numpy as np
+
+from benchmarks.fixtures import make_google_fixtures
+
+app = FastAPI()
+
+MOCK_LATENCY = float(os.getenv("MOCK_LATENCY", "0.5"))
+MOCK_EMBEDDING_LATENCY = float(os.getenv("MOCK_EMBEDDING_LATENCY", "0.05"))
+MOCK_SENTIMENT_LATENCY = float(os.getenv("MOCK_SENTIMENT_LATENCY", "0.05"))
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0"))
+MOCK_REPLY = "Hello from the mock model! How has your day been?"
+SENTIMENT_LABELS = ("LABEL_0", "LABEL_1", "LABEL_2")
+
+error_rng = random.Random(int(os.getenv("MOCK_SEED", "0")))
+
+
+async def token_stream():
+    # Spread the total latency across the tokens, like a real decoder
+    tokens = MOCK_REPLY.split(" ")
+    for i, word in enumerate(tokens):
+        await asyncio.sleep(MOCK_LATENCY / len(tokens))
+        text = word if i == 0 else f" {word}"
+        yield f"data: {json.dumps({'token': {'text': text, 'special': False}})}\n\n"
+
+
+def mock_embedding(text: str, dimension: int = 384) -> list:
+    # Deterministic per text so repeated inputs embed identically
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(dimension).tolist()
+
+
+def mock_sentiment(text: str) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+    scores = np.random.default_rng(seed).dirichlet(np.ones(len(SENTIMENT_LABELS)))
+    return [[{"label": label, "score": float(score)} for label, score in zip(SENTIMENT_LABELS, scores)]]
+
+
+@app.get("/oauth2/v3/certs")
+async def jwks(response: Response):
+    response.headers["Cache-Control"] = "public, max-age=21600"
+    return make_google_fixtures()[1]
+
+
+@app.post("/models/{model_path:path}")
+async def generate(model_path: str, request: Request):
+    body = await request.json()
+    if MOCK_ERROR_RATE and error_rng.random() < MOCK_ERROR_RATE:
+        return JSONResponse({"error": "Model is overloaded"}, status_code=503, headers={"Retry-After": "0.05"})
+    if model_path.startswith("sentence-transformers/"):
+        await asyncio.sleep(MOCK_EMBEDDING_LATENCY)
+        inputs = body["inputs"]
+        if isinstance(inputs, str):
+            return mock_embedding(inputs)
+        return [mock_embedding(text) for text in inputs]
+    if "sentiment" in model_path:
+        await asyncio.sleep(MOCK_SENTIMENT_LATENCY)
+        inputs = body["inputs"]
+        if isinstance(inputs, str):
+            return mock_sentiment(inputs)
+        return [mock_sentiment(text)[0] for text in inputs]
+    if body.get("stream"):
+        return StreamingResponse(token_stream(), media_type="text/event-stream")
+    await asyncio.sleep(MOCK_LATENCY)
+    return [{"generated_text": f"{body.get('inputs', '')} {MOCK_REPLY}"}]
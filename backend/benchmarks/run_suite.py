@@ -0,0 +1,289 @@
+"""End-to-end benchmark suite: the real app against local stand-ins, no network needed.
+
+Starts the mock inference server (generation, sentiment, embeddings and
+Google's JWKS, with --*-latency and --error-rate) in a thread, and the app
+in a subprocess via benchmarks.app_server (mongomock unless --mongo-uri).
+Each fixture user gets a signed access token. Then, for each --concurrency
+level, that many virtual users run a fixed, seeded mix of requests for
+--duration seconds:
+
+  message         POST /api/chat/{chat_id}/message
+  message_stream  POST /api/chat/{chat_id}/message/stream (until the last event)
+  chats           GET  /api/chats
+  messages        GET  /api/chat/{chat_id}/messages
+  memories        GET  /api/memories
+
+Reported per level: throughput, errors, p50/p95/p99 per endpoint, the
+app's RSS after the level (plus its peak), and the app's own per-stage
+percentiles from /api/pipeline/stats. Results go to a JSON file named
+after the current commit. Pass --compare with an earlier file to print the
+changes.
+
+  --app-env KEY=VALUE   extra settings for the app, e.g. CHAT_WRITE_MODE=write_behind
+
+Usage (from backend/):  python -m benchmarks.run_suite --concurrency 1,8,32 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fixtures import SECRET_KEY, access_token, bench_email
+from benchmarks.mock_server import serve_in_thread
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+MIX = {"message": 0.45, "message_stream": 0.1, "chats": 0.25, "messages": 0.15, "memories": 0.05}
+MESSAGES = [
+    "Hi! How are you today?",
+    "I had a rough day at work, my manager keeps changing the deadline.",
+    "I love hiking in the mountains on weekends.",
+    "Do you remember what I told you about my sister?",
+    "My cat Miso knocked over a plant again.",
+    "I'm thinking about learning to play the piano.",
+    "What should I cook for dinner tonight?",
+    "I feel a bit lonely this evening.",
+]
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+
+def read_rss_mb(pid):
+    """(current, peak) resident set size of a process in MB, from /proc"""
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                key, value = line.split(":", 1)
+                values[key] = int(value.split()[0]) / 1024
+    return round(values.get("VmRSS", 0.0), 1), round(values.get("VmHWM", 0.0), 1)
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--", "."], cwd=BACKEND_DIR, text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, index: int, users: int, seed: int):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {access_token(bench_email(index % users))}"}
+        self.rng = random.Random(seed * 100003 + index)
+        self.chat_id = None
+
+    async def setup(self):
+        response = await self.client.post("/api/chat/new", json={"chat_title": "Bench"}, headers=self.headers)
+        response.raise_for_status()
+        self.chat_id = response.json()["chat_id"]
+
+    async def request(self, endpoint):
+        """Send one request; returns its status code (599 for an error event mid-stream)"""
+        message = self.rng.choice(MESSAGES)
+        if endpoint == "message":
+            response = await self.client.post(f"/api/chat/{self.chat_id}/message", json={"message": message},
+                                              headers=self.headers)
+        elif endpoint == "message_stream":
+            async with self.client.stream("POST", f"/api/chat/{self.chat_id}/message/stream",
+                                          json={"message": message}, headers=self.headers) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("data:") and json.loads(line[len("data:"):])["type"] == "error":
+                        return 599
+        elif endpoint == "chats":
+            response = await self.client.get("/api/chats", headers=self.headers)
+        elif endpoint == "messages":
+            response = await self.client.get(f"/api/chat/{self.chat_id}/messages", headers=self.headers)
+        else:
+            response = await self.client.get("/api/memories", params={"query": message}, headers=self.headers)
+        return response.status_code
+
+    async def run(self, deadline, samples):
+        endpoints, weights = list(MIX), list(MIX.values())
+        while time.perf_counter() < deadline:
+            endpoint = self.rng.choices(endpoints, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = await self.request(endpoint)
+            except httpx.HTTPError:
+                status = 0
+            samples.append((endpoint, time.perf_counter() - start, status))
+
+
+async def run_level(base_url, concurrency, args, pid):
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        users = [VirtualUser(client, i, args.users, args.seed) for i in range(concurrency)]
+        await asyncio.gather(*(user.setup() for user in users))
+        samples = []
+        start = time.perf_counter()
+        await asyncio.gather(*(user.run(start + args.duration, samples) for user in users))
+        elapsed = time.perf_counter() - start
+        stages = (await client.get("/api/pipeline/stats")).json().get("stages", {})
+
+    endpoints = {}
+    for endpoint in MIX:
+        latencies = sorted(seconds for name, seconds, _ in samples if name == endpoint)
+        errors = sum(1 for name, _, status in samples if name == endpoint and not 200 <= status < 400)
+        endpoints[endpoint] = {
+            "count": len(latencies),
+            "errors": errors,
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+        }
+    rss, peak = read_rss_mb(pid)
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+        "rss_mb": rss,
+        "peak_rss_mb": peak,
+        "endpoints": endpoints,
+        "stages": {name: {key: round(value, 2) for key, value in stats.items()} for name, stats in stages.items()},
+    }
+
+
+def print_level(level):
+    print(f"concurrency {level['concurrency']:>3}: {level['throughput_rps']:8.1f} req/s  "
+          f"{level['errors']} errors  RSS {level['rss_mb']}MB (peak {level['peak_rss_mb']}MB)")
+    for name, stats in level["endpoints"].items():
+        print(f"  {name:<15} n={stats['count']:<6} p50 {stats['p50_ms']:8.1f}ms  p95 {stats['p95_ms']:8.1f}ms  "
+              f"p99 {stats['p99_ms']:8.1f}ms  errors {stats['errors']}")
+
+
+def compare(baseline, current):
+    print(f"\nvs {baseline['commit']} ({baseline['timestamp']}):")
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in current["levels"]:
+        old = previous.get(level["concurrency"])
+        if old is None:
+            continue
+        change = (level["throughput_rps"] / old["throughput_rps"] - 1) * 100 if old["throughput_rps"] else 0.0
+        print(f"concurrency {level['concurrency']:>3}: throughput {change:+6.1f}%  RSS {level['rss_mb'] - old['rss_mb']:+.1f}MB")
+        for name, stats in level["endpoints"].items():
+            before = old["endpoints"].get(name)
+            if before and before["p95_ms"]:
+                print(f"  {name:<15} p95 {stats['p95_ms'] - before['p95_ms']:+8.1f}ms  "
+                      f"p99 {stats['p99_ms'] - before['p99_ms']:+8.1f}ms")
+
+
+def app_environment(mock_url, extra=()):
+    """The app subprocess's environment, with every upstream pointed at the mock"""
+    return {
+        **os.environ,
+        "PYTHONPATH": BACKEND_DIR,
+        "JWT_SECRET": SECRET_KEY,
+        "HUGGINGFACE_API_URL": f"{mock_url}/models/mistralai/Mistral-7B-Instruct-v0.3",
+        "SENTIMENT_API_URL": f"{mock_url}/models/cardiffnlp/twitter-roberta-base-sentiment",
+        "EMBEDDING_API_URL": f"{mock_url}/models/sentence-transformers/all-MiniLM-L6-v2",
+        "GOOGLE_JWKS_URL": f"{mock_url}/oauth2/v3/certs",
+        "HF_TOKEN": "mock",
+        "INFERENCE_BACKOFF_BASE": "0.05",
+        **dict(item.split("=", 1) for item in extra),
+    }
+
+
+def wait_until_up(base_url, process, timeout=60):
+    """Block until the app's /ready answers 200 (so after any PREWARM)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("App server exited during startup")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("App server did not start in time")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--sentiment-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--mock-port", type=int, default=8201)
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    os.environ.update({
+        "MOCK_LATENCY": str(args.llm_latency),
+        "MOCK_SENTIMENT_LATENCY": str(args.sentiment_latency),
+        "MOCK_EMBEDDING_LATENCY": str(args.embedding_latency),
+        "MOCK_ERROR_RATE": str(args.error_rate),
+        "MOCK_SEED": str(args.seed),
+    })
+    from benchmarks.mock_inference_server import app as mock_app
+
+    commit, dirty = git_commit()
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    with serve_in_thread(mock_app, args.mock_port) as mock_url:
+        env = app_environment(mock_url, args.app_env)
+        command = [sys.executable, "-m", "benchmarks.app_server", "--port", str(args.port), "--users", str(args.users)]
+        if args.mongo_uri:
+            command += ["--mongo-uri", args.mongo_uri]
+        # Run from a scratch directory so memory stores, WAL segments etc. start empty
+        with open(os.path.join(workdir, "app.log"), "w") as log:
+            process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            wait_until_up(base_url, process)
+            print(f"commit {commit}{' (dirty)' if dirty else ''}, {args.duration}s per level, "
+                  f"LLM {args.llm_latency}s, error rate {args.error_rate}, app log in {workdir}/app.log")
+            results = []
+            for concurrency in levels:
+                level = asyncio.run(run_level(base_url, concurrency, args, process.pid))
+                print_level(level)
+                results.append(level)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "levels": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"suite-{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import motor.motor_asyncio
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-import httpx
 import logging
-from cachetools import TTLCache
-from huggingface_hub import InferenceClient
 from typing import List, Optional, Dict
 from pydantic import BaseModel
 import uuid
-
-from utils.memory_manager import MemoryManager
-from utils.sentiment_analyzer import SentimentAnalyzer
-from utils.prompt_builder import PromptBuilder
+import asyncio
+import time
+import json
+import math
+
+from utils.admission import BACKGROUND, IN_FLIGHT, Overloaded, admission_context, identify_caller
+from utils.generation_router import BREAKER_OPEN, CircuitBreaker, GenerationError
+from utils.pipeline import run_stage, server_timing_header, StageStats
+from utils.response_cleaner import clean_response, StreamingResponseCleaner
+from utils.services import Services
+from utils.metrics import REGISTRY
+from utils.tracing import TraceRecorder, TracingMiddleware, span
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -28,7 +31,32 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+# JWT & Auth configuration
+SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key")
+ALGORITHM = "HS256"
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/google", auto_error=False)
+
+# MongoDB, auth, inference and memory components; built by the lifespan, heavy ones on first use
+services = Services(SECRET_KEY, ALGORITHM)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await services.start()
+    try:
+        yield
+    finally:
+        await services.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # Fail fast and tell well-behaved clients when to come back
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests, please retry shortly"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
 
 # CORS configuration
 app.add_middleware(
@@ -37,55 +65,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag", "X-Trace-Id"],
 )
 
-# JWT & Auth configuration
-SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key")
-ALGORITHM = "HS256"
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/google", auto_error=False)
-
-# MongoDB setup
-def get_database_client():
-    try:
-        # Direct connection string with retryWrites and proper timeout settings
-        connection_string = os.getenv("MONGO_URI")
-        if not connection_string:
-            raise ValueError("MONGO_URI environment variable is not set")
-            
-        client = motor.motor_asyncio.AsyncIOMotorClient(
-            connection_string,
-            serverSelectionTimeoutMS=5000,  # 5 second timeout
-            connectTimeoutMS=5000,
-            socketTimeoutMS=5000,
-            retryWrites=True,
-            retryReads=True,
-            maxPoolSize=50,
-            minPoolSize=10
-        )
-        return client
-    except Exception as e:
-        logger.error(f"MongoDB connection error: {e}")
-        raise
-
-try:
-    client = get_database_client()
-    db = client.userdb  # Use your database name
-    users_collection = db.users
-except Exception as e:
-    logger.error(f"Failed to initialize MongoDB: {e}")
-    raise
+# Per-request spans and latency histograms; see /metrics and /api/pipeline/traces
+trace_recorder = TraceRecorder()
+app.add_middleware(TracingMiddleware, recorder=trace_recorder)
 
-# Cache setup
-auth_cache = TTLCache(maxsize=100, ttl=300)
+stage_stats = StageStats()
 
-# Hugging Face setup
-HF_TOKEN = os.getenv("HF_TOKEN")
-HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.3"
+# Per-stage timeouts (seconds) for the pre-generation pipeline
+USER_LOOKUP_TIMEOUT = float(os.getenv("STAGE_TIMEOUT_USER", "2"))
+SENTIMENT_TIMEOUT = float(os.getenv("STAGE_TIMEOUT_SENTIMENT", "1.5"))
+MEMORY_TIMEOUT = float(os.getenv("STAGE_TIMEOUT_MEMORIES", "2"))
 
-# Initialize new components
-memory_manager = MemoryManager()
-sentiment_analyzer = SentimentAnalyzer()
-prompt_builder = PromptBuilder()
+# Keep-alive interval for the /api/sync/stream push channel
+SYNC_HEARTBEAT_SECONDS = float(os.getenv("SYNC_HEARTBEAT_SECONDS", "25"))
 
 # Pydantic models
 class Message(BaseModel):
@@ -113,14 +108,6 @@ class User(BaseModel):
     relationship_stage: str = "acquaintance"
     personality_traits: List[str] = ["caring", "empathetic", "playful"]
 
-# System prompt
-SYSTEM_PROMPT = """You are an AI companion with specific personality traits:
-- Be natural and engaging
-- Keep responses concise and meaningful
-- Respond based on the current relationship stage
-- Show emotional awareness
-- Be consistent in personality"""
-
 # Helper functions
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -136,10 +123,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = services.token_verifier.verify(token)
         email: str = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        # Per-user rate limits for the upstream calls this request makes
+        identify_caller(email)
         return email
     except JWTError:
         raise HTTPException(
@@ -148,48 +137,70 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def chat_with_mistral(prompt: str) -> str:
-    formatted_prompt = f"""### Instructions:
+GENERATION_PARAMETERS = {
+    "max_new_tokens": 150,
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "presence_penalty": 0.6,
+    "frequency_penalty": 0.6,
+    # The prompt ends with a User:/You: transcript; don't let the model write the user's next turn
+    "stop": ["\nUser:"]
+}
+
+def format_instruction_prompt(prompt: str) -> str:
+    return f"""### Instructions:
 {prompt}
 
 ### Response:"""
-    
+
+GENERATION_ERROR_DETAILS = {
+    503: "AI service is temporarily unavailable",
+    504: "AI response timed out",
+}
+
+def generation_http_error(e: GenerationError) -> HTTPException:
+    headers = {"Retry-After": str(max(1, math.ceil(e.retry_after)))} if e.retry_after is not None else None
+    return HTTPException(
+        status_code=e.status_code,
+        detail=GENERATION_ERROR_DETAILS.get(e.status_code, "Error generating AI response"),
+        headers=headers
+    )
+
+async def chat_with_mistral(prompt: str) -> str:
     try:
-        headers = {"Authorization": f"Bearer {HF_TOKEN}"}
-        response = httpx.post(
-            HUGGINGFACE_API_URL,
-            headers=headers,
-            json={"inputs": formatted_prompt, "parameters": {
-                "max_new_tokens": 150,
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "presence_penalty": 0.6,
-                "frequency_penalty": 0.6
-            }}
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail="Error from Hugging Face API")
-            
+        with span("generation"):
+            reply = await services.generation_router.generate(format_instruction_prompt(prompt), GENERATION_PARAMETERS)
         # Clean up the response to get only the actual message
-        full_response = response.json()[0]["generated_text"].strip()
-        
-        # Extract only the actual response part
-        if "### Response:" in full_response:
-            actual_response = full_response.split("### Response:")[-1].strip()
-        else:
-            actual_response = full_response
-            
-        # Remove any remaining instruction artifacts
-        actual_response = actual_response.replace("User:", "").strip()
-        actual_response = actual_response.split("### Instructions:")[0].strip()
-        
-        return actual_response
+        return clean_response(reply)
         
+    except Overloaded:
+        raise
+    except GenerationError as e:
+        logger.error(f"Mistral API error: {str(e)}")
+        raise generation_http_error(e)
     except Exception as e:
         logger.error(f"Mistral API error: {str(e)}")
         raise HTTPException(status_code=500, detail="Error generating AI response")
 
+async def stream_with_mistral(prompt: str, cleaner: StreamingResponseCleaner):
+    """Yield cleaned text chunks as Mistral generates them"""
+    async for text in services.generation_router.stream(format_instruction_prompt(prompt), GENERATION_PARAMETERS):
+        chunk = cleaner.feed(text)
+        if chunk:
+            yield chunk
+        if cleaner.done:
+            return
+    chunk = cleaner.finish()
+    if chunk:
+        yield chunk
+
+async def admit_generation(current_user: str = Depends(get_current_user)) -> str:
+    """Charge the generation rate limits up front, so an overloaded server answers 429 before doing any work"""
+    upstream = services.generation_router.primary_upstream()
+    if upstream is not None:
+        services.inference_client.admission.admit(upstream, upfront=True)
+    return current_user
+
 # API Routes
 @app.get("/api/auth/login")
 async def login_url():
@@ -199,7 +210,7 @@ async def login_url():
 
 @app.get("/oauth2callback")
 async def auth_callback(code: str, redirect_uri: str = None):
-    cached_response = auth_cache.get(code)
+    cached_response = services.auth_cache.get(code)
     if cached_response:
         return cached_response
 
@@ -207,70 +218,62 @@ async def auth_callback(code: str, redirect_uri: str = None):
         from urllib.parse import unquote
         final_redirect_uri = unquote(redirect_uri) if redirect_uri else os.getenv("REDIRECT_URI")
         
-        token_url = "https://oauth2.googleapis.com/token"
-        token_data = {
-            "code": code,
-            "client_id": os.getenv("CLIENT_ID"),
-            "client_secret": os.getenv("CLIENT_SECRET"),
-            "redirect_uri": final_redirect_uri,
-            "grant_type": "authorization_code"
-        }
+        response = await services.google_auth.exchange_code(code, final_redirect_uri)
+        response_data = response.json()
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                token_url,
-                data=token_data,
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    "Accept": "application/json"
-                }
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Authentication failed: {response_data.get('error_description', response_data.get('error', 'Unknown error'))}"
             )
-            
-            response_data = response.json()
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Authentication failed: {response_data.get('error_description', response_data.get('error', 'Unknown error'))}"
-                )
-            
-            if 'id_token' not in response_data:
-                raise HTTPException(status_code=400, detail="Invalid OAuth response")
 
-            user_info = id_token.verify_oauth2_token(
-                response_data["id_token"],
-                requests.Request(),
-                os.getenv("CLIENT_ID")
-            )
+        if 'id_token' not in response_data:
+            raise HTTPException(status_code=400, detail="Invalid OAuth response")
 
-            user_data = {
-                "user_id": user_info["sub"],
-                "email": user_info["email"],
-                "name": user_info.get("name", ""),
-                "picture": user_info.get("picture", "")
-            }
-
-            await users_collection.update_one(
-                {"user_id": user_data["user_id"]},
-                {"$set": user_data},
-                upsert=True
-            )
+        user_info = await services.google_auth.verify_id_token(
+            response_data["id_token"],
+            access_token=response_data.get("access_token")
+        )
 
-            access_token = create_access_token(data={"sub": user_data["email"]})
-            
-            response_payload = {
-                "access_token": access_token,
-                "user": user_data,
-                "token_type": "bearer"
-            }
-            
-            auth_cache[code] = response_payload
-            return response_payload
+        user_data = {
+            "user_id": user_info["sub"],
+            "email": user_info["email"],
+            "name": user_info.get("name", ""),
+            "picture": user_info.get("picture", "")
+        }
+
+        await services.users_collection.update_one(
+            {"user_id": user_data["user_id"]},
+            {"$set": user_data},
+            upsert=True
+        )
+        services.profile_cache.invalidate(user_data["email"])
+
+        access_token = create_access_token(data={"sub": user_data["email"]})
+        
+        response_payload = {
+            "access_token": access_token,
+            "user": user_data,
+            "token_type": "bearer"
+        }
+        
+        services.auth_cache[code] = response_payload
+        return response_payload
 
     except Exception as e:
         logger.error(f"Authentication error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+async def get_profile(email: str) -> Dict:
+    """The cached user profile (user_id, relationship_stage, personality_traits); 404 if missing"""
+    user = await services.profile_cache.get(email)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+async def get_user_id(email: str) -> str:
+    return (await get_profile(email))["user_id"]
+
 # Chat routes
 @app.post("/api/chat/new")
 async def create_new_chat(chat_data: ChatCreate, current_user: str = Depends(get_current_user)):
@@ -278,48 +281,152 @@ async def create_new_chat(chat_data: ChatCreate, current_user: str = Depends(get
         chat_id = str(uuid.uuid4())
         timestamp = datetime.utcnow().isoformat()
         
-        new_chat = {
-            "chat_id": chat_id,
-            "chat_title": chat_data.chat_title,
-            "messages": [],
-            "created_at": timestamp
-        }
-        
-        result = await users_collection.update_one(
-            {"email": current_user},
-            {"$push": {"chats": new_chat}},
-            upsert=True
-        )
+        user_id = await get_user_id(current_user)
+        new_chat = await services.chat_store.create_chat(user_id, chat_id, chat_data.chat_title, timestamp)
         
-        if not result.acknowledged:
-            raise HTTPException(status_code=500, detail="Failed to save chat")
-        
-        return new_chat
+        return {**new_chat, "messages": []}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating new chat: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def gather_message_context(current_user: str, message: str, chat_id: str):
+    """Fan out the pre-generation lookups concurrently.
+
+    Sentiment runs alongside the user lookup; memory retrieval and the chat's
+    rolling context start as soon as the user_id is known. Sentiment,
+    memories and context degrade to defaults when late, so only the user
+    lookup (or a missing chat) can fail the request.
+    """
+    # Imported here so importing main doesn't pull in numpy
+    from utils.sentiment_analyzer import neutral_sentiment
+
+    timings = {}
+    sentiment_task = asyncio.create_task(run_stage(
+        "sentiment", services.sentiment_analyzer.analyze(message), SENTIMENT_TIMEOUT, timings,
+        fallback=neutral_sentiment()
+    ))
+    try:
+        user = await run_stage(
+            "user_lookup", services.profile_cache.get(current_user), USER_LOOKUP_TIMEOUT,
+            timings
+        )
+    except asyncio.TimeoutError:
+        sentiment_task.cancel()
+        raise HTTPException(status_code=504, detail="User lookup timed out")
+    except Exception:
+        sentiment_task.cancel()
+        raise
+    if not user:
+        sentiment_task.cancel()
+        raise HTTPException(status_code=404, detail="User not found")
+
+    memories, context = await asyncio.gather(
+        run_stage(
+            "memories", services.memory_manager.get_relevant_memories(user["user_id"], message), MEMORY_TIMEOUT, timings,
+            fallback=[]
+        ),
+        run_stage(
+            "chat_context", services.chat_store.get_context(user["user_id"], chat_id), USER_LOOKUP_TIMEOUT, timings,
+            fallback={"recent": [], "summary": None}
+        )
+    )
+    if context is None:
+        sentiment_task.cancel()
+        raise HTTPException(status_code=404, detail="Chat not found")
+    sentiment = await sentiment_task
+    return user, sentiment, memories, context, timings
+
+SUMMARY_PROMPT = """Summarize this conversation between a user and their AI companion in at most three sentences.
+Keep facts about the user, their feelings and anything left unresolved.
+
+Summary so far: {summary}
+
+Latest messages:
+{turns}"""
+
+FACT_EXTRACTION_PROMPT = """List the lasting facts this message reveals about the user (preferences, life details, relationships, plans), one per line.
+Write each as a short statement about "the user". If there are none, reply NONE.
+
+Message: {message}"""
+
+async def extract_facts_with_llm(user_text: str, bot_text: str) -> List[str]:
+    """MEMORY_EXTRACTOR=llm: let Mistral pick the facts (one extra generation per exchange)"""
+    reply = await chat_with_mistral(FACT_EXTRACTION_PROMPT.format(message=user_text))
+    facts = [line.strip(" -•*\t") for line in reply.splitlines()]
+    return [fact for fact in facts if fact and fact.upper() != "NONE"]
+
+if os.getenv("MEMORY_EXTRACTOR", "heuristic") == "llm":
+    services.extract_facts = extract_facts_with_llm
+
+# Strong references to in-flight summary refreshes so they aren't garbage collected
+summary_tasks = set()
+
+async def refresh_chat_summary(user_id: str, chat_id: str, summary: Optional[str], turns: List[Dict]):
+    try:
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary or "(none)",
+            turns="\n".join(f"{'User' if turn['role'] == 'user' else 'Companion'}: {turn['text']}" for turn in turns)
+        )
+        # Queues behind interactive generations
+        with admission_context(BACKGROUND):
+            reply = await chat_with_mistral(prompt)
+        await services.chat_store.set_summary(user_id, chat_id, reply)
+    except Exception as e:
+        logger.error(f"Error refreshing chat summary: {str(e)}")
+
+def schedule_summary_refresh(user_id: str, chat_id: str, context: Dict, appended: int):
+    """Fold the context window into the summary each time it fully turns over"""
+    window = services.chat_store.context_size
+    count = context["message_count"]
+    if count // window > (count - appended) // window:
+        task = asyncio.create_task(refresh_chat_summary(user_id, chat_id, context.get("summary"), context["recent"]))
+        summary_tasks.add(task)
+        task.add_done_callback(summary_tasks.discard)
+
+async def lookup_cached_reply(user: Dict, sentiment: Dict, memories: List[str], context: Dict, message: str,
+                              timings: Dict):
+    """Return (cache key, message embedding, cached reply) for turns the response cache may answer.
+
+    The key is None when the cache is off or doesn't apply (memories were
+    retrieved or the chat already has history, so the prompt is personal);
+    the reply is None on a miss.
+    """
+    if services.response_cache is None or memories or context["recent"] or not message:
+        return None, None, None
+    vector = await run_stage(
+        "response_cache", services.memory_manager.get_embedding(message), MEMORY_TIMEOUT, timings, fallback=None
+    )
+    if vector is None:
+        return None, None, None
+    key = services.response_cache.context_key(
+        user.get("relationship_stage", "acquaintance"),
+        user.get("personality_traits", ["caring", "empathetic"]),
+        sentiment
+    )
+    return key, vector, services.response_cache.get(key, vector)
+
 @app.post("/api/chat/{chat_id}/message")
 async def add_message(
     chat_id: str,
     chat_data: ChatCreate,
-    current_user: str = Depends(get_current_user)
+    response: Response,
+    current_user: str = Depends(admit_generation)
 ):
     timestamp = datetime.utcnow().isoformat()
     
-    user = await users_collection.find_one({"email": current_user})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user, sentiment, memories, context, timings = await gather_message_context(current_user, chat_data.message, chat_id)
     
-    sentiment = await sentiment_analyzer.analyze(chat_data.message)
-    memories = await memory_manager.get_relevant_memories(user["user_id"], chat_data.message)
-    
-    system_prompt = prompt_builder.build_prompt(
+    system_prompt = services.prompt_builder.build_prompt(
         relationship_stage=user.get("relationship_stage", "acquaintance"),
         memories=memories,
         sentiment=sentiment,
-        personality_traits=user.get("personality_traits", ["caring", "empathetic"])
+        personality_traits=user.get("personality_traits", ["caring", "empathetic"]),
+        recent_turns=context["recent"],
+        summary=context.get("summary"),
+        message=chat_data.message or ""
     )
 
     user_message = Message(
@@ -329,9 +436,17 @@ async def add_message(
         sentiment=sentiment
     )
     
-    ai_response = chat_with_mistral(f"{system_prompt}\n\nUser: {chat_data.message}")
-    # Remove any leading/trailing whitespace and newlines
-    ai_response = ai_response.strip()
+    cache_key, message_vector, ai_response = await lookup_cached_reply(
+        user, sentiment, memories, context, chat_data.message, timings
+    )
+    if ai_response is None:
+        generation_start = time.perf_counter()
+        ai_response = await chat_with_mistral(f"{system_prompt}\n\nUser: {chat_data.message}")
+        timings["generation"] = time.perf_counter() - generation_start
+        # Remove any leading/trailing whitespace and newlines
+        ai_response = ai_response.strip()
+        if cache_key is not None:
+            services.response_cache.put(cache_key, message_vector, ai_response, timings["generation"])
     
     bot_message = Message(
         role="bot",
@@ -339,27 +454,184 @@ async def add_message(
         timestamp=datetime.utcnow().isoformat()
     )
     
-    await users_collection.update_one(
-        {"email": current_user, "chats.chat_id": chat_id},
-        {"$push": {"chats.$.messages": {"$each": [user_message.dict(), bot_message.dict()]}}}
-    )
+    with span("chat.persist"):
+        saved = await services.chat_store.append_messages(
+            user["user_id"], chat_id, [user_message.dict(), bot_message.dict()], context=context
+        )
+    if not saved:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    schedule_summary_refresh(user["user_id"], chat_id, saved, 2)
+    services.memory_worker.submit(user["user_id"], chat_data.message or "", ai_response)
     
+    stage_stats.record(timings)
+    response.headers["Server-Timing"] = server_timing_header(timings)
     return {
         "messages": [user_message.dict(), bot_message.dict()]
     }
 
+def sse_event(data: Dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/{chat_id}/message/stream")
+async def add_message_stream(
+    chat_id: str,
+    chat_data: ChatCreate,
+    current_user: str = Depends(admit_generation)
+):
+    """Server-sent events variant of add_message that relays tokens as they arrive"""
+    timestamp = datetime.utcnow().isoformat()
+    
+    user, sentiment, memories, context, timings = await gather_message_context(current_user, chat_data.message, chat_id)
+    
+    system_prompt = services.prompt_builder.build_prompt(
+        relationship_stage=user.get("relationship_stage", "acquaintance"),
+        memories=memories,
+        sentiment=sentiment,
+        personality_traits=user.get("personality_traits", ["caring", "empathetic"]),
+        recent_turns=context["recent"],
+        summary=context.get("summary"),
+        message=chat_data.message or ""
+    )
+
+    user_message = Message(
+        role="user",
+        text=chat_data.message,
+        timestamp=timestamp,
+        sentiment=sentiment
+    )
+
+    cache_key, message_vector, cached_reply = await lookup_cached_reply(
+        user, sentiment, memories, context, chat_data.message, timings
+    )
+
+    async def event_stream():
+        yield sse_event({"type": "user_message", "message": user_message.dict()})
+        if cached_reply is not None:
+            reply = cached_reply
+            yield sse_event({"type": "token", "text": reply})
+        else:
+            cleaner = StreamingResponseCleaner()
+            generation_start = time.perf_counter()
+            try:
+                with span("generation"):
+                    async for chunk in stream_with_mistral(f"{system_prompt}\n\nUser: {chat_data.message}", cleaner):
+                        if "first_token" not in timings:
+                            timings["first_token"] = time.perf_counter() - generation_start
+                        yield sse_event({"type": "token", "text": chunk})
+            except Overloaded as e:
+                yield sse_event({"type": "error", "detail": "Too many requests, please retry shortly",
+                                 "retry_after": max(1, math.ceil(e.retry_after))})
+                return
+            except GenerationError as e:
+                logger.error(f"Mistral streaming error: {str(e)}")
+                error = generation_http_error(e)
+                event = {"type": "error", "detail": error.detail}
+                if error.headers:
+                    event["retry_after"] = int(error.headers["Retry-After"])
+                yield sse_event(event)
+                return
+            except Exception as e:
+                logger.error(f"Mistral streaming error: {str(e)}")
+                yield sse_event({"type": "error", "detail": "Error generating AI response"})
+                return
+            timings["generation"] = time.perf_counter() - generation_start
+            reply = cleaner.text
+            if cache_key is not None:
+                services.response_cache.put(cache_key, message_vector, reply, timings["generation"])
+
+        bot_message = Message(
+            role="bot",
+            text=reply,
+            timestamp=datetime.utcnow().isoformat()
+        )
+        with span("chat.persist"):
+            saved = await services.chat_store.append_messages(
+                user["user_id"], chat_id, [user_message.dict(), bot_message.dict()], context=context
+            )
+        if not saved:
+            yield sse_event({"type": "error", "detail": "Chat not found"})
+            return
+        schedule_summary_refresh(user["user_id"], chat_id, saved, 2)
+        services.memory_worker.submit(user["user_id"], chat_data.message or "", reply)
+        stage_stats.record(timings)
+        yield sse_event({"type": "done", "messages": [user_message.dict(), bot_message.dict()]})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/chats")
-async def get_chats(current_user: str = Depends(get_current_user)):
-    user = await users_collection.find_one({"email": current_user})
-    return {"chats": user.get("chats", [])}
+async def get_chats(
+    request: Request,
+    response: Response,
+    since: Optional[int] = Query(None, ge=0),
+    current_user: str = Depends(get_current_user)
+):
+    """Chat summaries only; message history comes from /api/chat/{chat_id}/messages.
+
+    With `since=<version>` only chats and messages changed after that version
+    are returned, or 304 if nothing changed. The version is also the ETag.
+    """
+    user_id = await get_user_id(current_user)
+    # The committed version: the data read after it includes every write up to it,
+    # and anything newer that slips in is sent again next time (clients dedupe)
+    version = await services.chat_store.get_version(user_id)
+    etag = f'"{version}"'
+    if since == version or (since is None and request.headers.get("if-none-match") == etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    if since is not None and since < version:
+        changes = await services.chat_store.changes_since(user_id, since)
+        return {"version": version, "since": since, **changes}
+    return {"version": version, "chats": await services.chat_store.list_chats(user_id)}
+
+@app.get("/api/sync/stream")
+async def sync_stream(request: Request, current_user: str = Depends(get_current_user)):
+    """Push channel: emits the user's sync version whenever their chats change"""
+    user_id = await get_user_id(current_user)
+    queue = services.sync_notifier.subscribe(user_id)
+
+    async def event_stream():
+        try:
+            yield sse_event({"type": "version", "version": await services.chat_store.get_version(user_id)})
+            while not await request.is_disconnected():
+                try:
+                    version = await asyncio.wait_for(queue.get(), timeout=SYNC_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_event({"type": "version", "version": version})
+        finally:
+            services.sync_notifier.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/chat/{chat_id}/messages")
+async def get_chat_messages(
+    chat_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    current_user: str = Depends(get_current_user)
+):
+    """A page of messages, oldest first; pass next_cursor as `before` for older ones"""
+    user_id = await get_user_id(current_user)
+    try:
+        messages, next_cursor = await services.chat_store.get_messages(user_id, chat_id, limit=limit, before=before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"messages": messages, "next_cursor": next_cursor}
 
 @app.delete("/api/chat/{chat_id}")
 async def delete_chat(chat_id: str, current_user: str = Depends(get_current_user)):
-    result = await users_collection.update_one(
-        {"email": current_user},
-        {"$pull": {"chats": {"chat_id": chat_id}}}
-    )
-    if result.modified_count == 0:
+    user_id = await get_user_id(current_user)
+    if not await services.chat_store.delete_chat(user_id, chat_id):
         raise HTTPException(status_code=404, detail="Chat not found")
     return {"status": "success"}
 
@@ -368,7 +640,7 @@ async def analyze_sentiment(
     message: str,
     current_user: str = Depends(get_current_user)
 ):
-    sentiment = sentiment_analyzer.analyze(message)
+    sentiment = await services.sentiment_analyzer.analyze(message)
     return sentiment
 
 @app.post("/api/store-memory")
@@ -378,12 +650,12 @@ async def store_memory(
 ):
     try:
         # Get user info to use user_id instead of email
-        user = await users_collection.find_one({"email": current_user})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+        user = await get_profile(current_user)
             
-        memory_manager.add_memory(user["user_id"], memory)
+        await services.memory_manager.add_memory(user["user_id"], memory)
         return {"status": "success", "message": "Memory stored successfully"}
+    except Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error storing memory: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to store memory")
@@ -391,11 +663,9 @@ async def store_memory(
 @app.get("/api/memories")
 async def get_memories(query: str, current_user: str = Depends(get_current_user)):
     try:
-        user = await users_collection.find_one({"email": current_user})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+        user = await get_profile(current_user)
             
-        memories = await memory_manager.get_relevant_memories(user["user_id"], query)
+        memories = await services.memory_manager.get_relevant_memories(user["user_id"], query)
         return {"memories": memories or []}  # Ensure we always return a list
     except Exception as e:
         logger.error(f"Error retrieving memories: {str(e)}")
@@ -409,13 +679,14 @@ async def update_relationship(
     try:
         body = await request.json()
         stage = body.get("stage")
-        if not stage or stage not in prompt_builder.RELATIONSHIP_STAGES:
+        if not stage or stage not in services.prompt_builder.RELATIONSHIP_STAGES:
             raise HTTPException(status_code=400, detail="Invalid relationship stage")
             
-        result = await users_collection.update_one(
+        result = await services.users_collection.update_one(
             {"email": current_user},
             {"$set": {"relationship_stage": stage}}
         )
+        services.profile_cache.invalidate(current_user)
         
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
@@ -424,13 +695,103 @@ async def update_relationship(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid request body")
 
+@app.get("/api/pipeline/stats")
+async def pipeline_stats():
+    """Per-stage latency percentiles for the message pipeline; components not yet loaded report None"""
+    memory_manager = services.loaded("memory_manager")
+    response_cache = services.loaded("response_cache")
+    memory_worker = services.loaded("memory_worker")
+    sentiment_analyzer = services.loaded("sentiment_analyzer")
+    return {
+        "stages": stage_stats.snapshot(),
+        "services": services.stats(),
+        "embedding_cache": memory_manager.embedding_cache.stats() if memory_manager is not None else None,
+        "memory_residency": memory_manager.residency.stats() if memory_manager is not None else None,
+        "profile_cache": services.profile_cache.stats(),
+        "auth": {**services.token_verifier.stats(), **services.google_auth.stats()},
+        "admission": services.inference_client.admission.stats(),
+        "generation": services.generation_router.stats(),
+        "response_cache": response_cache.stats() if response_cache is not None else None,
+        "memory_extraction": memory_worker.stats() if memory_worker is not None else None,
+        "sentiment": sentiment_analyzer.stats() if sentiment_analyzer is not None else None,
+        "chat_writes": services.chat_store.stats() if services.write_behind else None
+    }
+
+@app.get("/api/pipeline/traces")
+async def pipeline_traces(limit: int = Query(50, ge=1, le=500), min_ms: float = Query(0, ge=0)):
+    """The most recent request traces (newest first) with their spans"""
+    return {"traces": trace_recorder.recent(limit=limit, min_ms=min_ms)}
+
+CACHE_HITS = REGISTRY.counter("cache_hits_total", "Lookups answered from the cache", ["cache"])
+CACHE_MISSES = REGISTRY.counter("cache_misses_total", "Lookups the cache could not answer", ["cache"])
+CACHE_HIT_RATIO = REGISTRY.gauge("cache_hit_ratio", "Hits over lookups since startup", ["cache"])
+QUEUE_DEPTH = REGISTRY.gauge("queue_depth", "Items waiting in background queues", ["queue"])
+
+def collect_component_metrics():
+    """Copy the components' own counters into the registry at scrape time"""
+    if not services.started:
+        return
+    profile = services.profile_cache.stats()
+    caches = {
+        "profile": (profile["hits"], profile["misses"] + profile["coalesced"]),
+        "auth_token": (services.token_verifier.hits, services.token_verifier.misses),
+    }
+    memory_manager = services.loaded("memory_manager")
+    if memory_manager is not None:
+        embedding = memory_manager.embedding_cache.stats()
+        caches["embedding"] = (embedding["hits"] + embedding["disk_hits"], embedding["misses"])
+    sentiment_analyzer = services.loaded("sentiment_analyzer")
+    if sentiment_analyzer is not None:
+        caches["sentiment"] = (sentiment_analyzer.hits, sentiment_analyzer.fast_path + sentiment_analyzer.model_calls)
+    response_cache = services.loaded("response_cache")
+    if response_cache is not None:
+        caches["response"] = (response_cache.hits, response_cache.misses)
+    for name, (hits, misses) in caches.items():
+        CACHE_HITS.set(hits, cache=name)
+        CACHE_MISSES.set(misses, cache=name)
+        CACHE_HIT_RATIO.set(hits / (hits + misses) if hits + misses else 0.0, cache=name)
+    memory_worker = services.loaded("memory_worker")
+    if memory_worker is not None:
+        QUEUE_DEPTH.set(memory_worker.stats()["queue_depth"], queue="memory_extraction")
+    if services.write_behind:
+        QUEUE_DEPTH.set(len(services.chat_store.pending), queue="chat_writes")
+    for upstream, lane in services.inference_client.admission.lanes.items():
+        QUEUE_DEPTH.set(len(lane.waiters), queue=f"inference:{upstream}")
+        IN_FLIGHT.set(lane.active, upstream=upstream)
+    for endpoint in services.generation_router.endpoints + services.generation_router.fallbacks:
+        BREAKER_OPEN.set(int(endpoint.breaker.state == CircuitBreaker.OPEN), endpoint=endpoint.name)
+
+REGISTRY.on_collect(collect_component_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the latency histograms and counters"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 # Add health check endpoint
 @app.get("/health")
 async def health_check():
     try:
         # Ping MongoDB
-        await client.admin.command('ping')
+        await services.client.admin.command('ping')
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
-        raise HTTPException(status_code=503, detail="Database connection failed")
\ No newline at end of file
+        raise HTTPException(status_code=503, detail="Database connection failed")
+
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """Whether to route traffic here: started, database reachable and, with PREWARM=true, models loaded.
+
+    /health only says the process is up and can reach MongoDB.
+    """
+    state = services.stats()
+    if services.ready:
+        try:
+            await services.client.admin.command('ping')
+            return {"status": "ready", **state}
+        except Exception as e:
+            logger.error(f"Readiness check failed: {e}")
+            state["database"] = "unreachable"
+    response.status_code = 503
+    return {"status": "starting" if not services.ready else "unavailable", **state}
@@ -0,0 +1,81 @@
+"""Move chats embedded in user documents into the chats/messages collections.
+
+For every user that still has a `chats` array, each chat becomes a summary
+document plus one document per message, then the array is unset. A chat's
+messages are replaced wholesale, so the script is safe to re-run after an
+interruption.
+
+Usage (from backend/):  MONGO_URI=... python -m scripts.migrate_chat_messages [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+
+from utils.chat_store import ChatStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def chat_summary(user_id, chat, context_size):
+    messages = chat.get("messages", [])
+    first_user = next((m["text"] for m in messages if m.get("role") == "user"), None)
+    return {
+        "user_id": user_id,
+        "chat_id": chat["chat_id"],
+        "chat_title": chat.get("chat_title", "New Chat"),
+        "created_at": chat.get("created_at"),
+        "updated_at": messages[-1]["timestamp"] if messages else chat.get("created_at"),
+        "message_count": len(messages),
+        "preview": first_user,
+        # Seed the rolling context window so existing chats keep their recent history
+        "recent": [{"role": m["role"], "text": m["text"]} for m in messages[-context_size:]],
+    }
+
+
+async def migrate_user(chat_store, users_collection, user, dry_run):
+    user_id = user["user_id"]
+    for chat in user.get("chats", []):
+        summary = chat_summary(user_id, chat, chat_store.context_size)
+        if dry_run:
+            logger.info(f"[dry-run] {user_id}/{chat['chat_id']}: {summary['message_count']} messages")
+            continue
+        await chat_store.chats.replace_one(
+            {"user_id": user_id, "chat_id": chat["chat_id"]}, summary, upsert=True
+        )
+        await chat_store.messages.delete_many({"user_id": user_id, "chat_id": chat["chat_id"]})
+        messages = [{"user_id": user_id, "chat_id": chat["chat_id"], **m} for m in chat.get("messages", [])]
+        if messages:
+            await chat_store.messages.insert_many(messages)
+    if not dry_run:
+        await users_collection.update_one({"_id": user["_id"]}, {"$unset": {"chats": ""}})
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = motor.motor_asyncio.AsyncIOMotorClient(os.environ["MONGO_URI"])
+    db = client.userdb
+    chat_store = ChatStore(db)
+    await chat_store.ensure_indexes()
+
+    migrated = 0
+    async for user in db.users.find({"chats": {"$exists": True}, "user_id": {"$exists": True}}):
+        try:
+            await migrate_user(chat_store, db.users, user, args.dry_run)
+            migrated += 1
+        except Exception as e:
+            logger.error(f"Failed to migrate chats for user {user.get('user_id')}: {str(e)}")
+    logger.info(f"Migrated chats for {migrated} users")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+"""Convert every legacy memories/{user_id}.json file to the binary store layout.
+
+MemoryManager also migrates lazily on first access; this does it up front.
+
+Usage (from backend/):  python -m scripts.migrate_memories [--index-dir memories] [--dimension 384]
+"""
+import argparse
+import logging
+import os
+
+from utils.memory_store import migrate_legacy_json
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default="memories")
+    parser.add_argument("--dimension", type=int, default=384)
+    args = parser.parse_args()
+
+    migrated = failed = 0
+    for name in sorted(os.listdir(args.index_dir)):
+        if not name.endswith(".json"):
+            continue
+        user_id = name[:-len(".json")]
+        store_path = os.path.join(args.index_dir, user_id)
+        if os.path.isdir(store_path):
+            logger.warning(f"Skipping {name}: {store_path} already exists")
+            continue
+        try:
+            if migrate_legacy_json(os.path.join(args.index_dir, name), store_path, args.dimension):
+                migrated += 1
+            else:
+                failed += 1
+        except Exception as e:
+            logger.error(f"Failed to migrate {name}: {str(e)}")
+            failed += 1
+
+    logger.info(f"Migrated {migrated} users, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
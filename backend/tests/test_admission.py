@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from utils.admission import BACKGROUND, INTERACTIVE, AdmissionController, Overloaded, admission_context
+
+
+def make_controller(**options):
+    options = {"max_concurrency": 1, "max_queue": 8, "global_rate": 0, "user_rate": 0,
+               "max_wait": {INTERACTIVE: 1.0, BACKGROUND: 1.0}, **options}
+    return AdmissionController(**options)
+
+
+async def hold(controller, released, order=None, name=None, priority=INTERACTIVE):
+    with admission_context(priority):
+        async with controller.slot("model"):
+            if order is not None:
+                order.append(name)
+            await released.wait()
+
+
+async def queued(controller, count):
+    # Let the started tasks reach the wait queue
+    while len(controller.lane("model").waiters) < count:
+        await asyncio.sleep(0)
+
+
+def test_interactive_waiters_go_before_background_ones():
+    async def scenario():
+        controller = make_controller()
+        released = asyncio.Event()
+        order = []
+        holder = asyncio.ensure_future(hold(controller, released))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(hold(controller, released, order, "background", BACKGROUND))]
+        await queued(controller, 1)
+        waiters.append(asyncio.ensure_future(hold(controller, released, order, "interactive")))
+        await queued(controller, 2)
+
+        released.set()
+        await asyncio.gather(holder, *waiters)
+        assert order == ["interactive", "background"]
+        assert controller.lane("model").active == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_evicts_a_lower_priority_waiter():
+    async def scenario():
+        controller = make_controller(max_queue=1)
+        released = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, released))
+        await asyncio.sleep(0)
+        background = asyncio.ensure_future(hold(controller, released, priority=BACKGROUND))
+        await queued(controller, 1)
+
+        # Another background call has no one to evict
+        with pytest.raises(Overloaded) as raised:
+            await hold(controller, released, priority=BACKGROUND)
+        assert raised.value.reason == "queue_full"
+
+        interactive = asyncio.ensure_future(hold(controller, released))
+        with pytest.raises(Overloaded) as raised:
+            await background
+        assert raised.value.reason == "evicted"
+
+        released.set()
+        await asyncio.gather(holder, interactive)
+        assert controller.rejected == {"queue_full": 1, "evicted": 1}
+
+    asyncio.run(scenario())
+
+
+def test_waiter_is_dropped_at_its_deadline():
+    async def scenario():
+        controller = make_controller(max_wait={INTERACTIVE: 0.05, BACKGROUND: 1.0})
+        released = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, released))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as raised:
+            await hold(controller, released)
+        assert raised.value.reason == "deadline"
+        assert controller.lane("model").waiters == []
+
+        released.set()
+        await holder
+        assert controller.lane("model").active == 0
+
+    asyncio.run(scenario())
+
+
+def test_expected_wait_beyond_the_deadline_is_refused_up_front():
+    async def scenario():
+        controller = make_controller(max_wait={INTERACTIVE: 0.05, BACKGROUND: 1.0})
+        controller.lane("model").service_seconds = 1.0
+        released = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, released))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as raised:
+            await hold(controller, released)
+        assert raised.value.reason == "deadline" and raised.value.retry_after == pytest.approx(1.0)
+        released.set()
+        await holder
+
+    asyncio.run(scenario())
+
+
+def test_granted_waiter_cancelled_passes_the_slot_on():
+    async def scenario():
+        controller = make_controller()
+        released = asyncio.Event()
+        released.set()
+        order = []
+        slot = controller.slot("model")
+        await slot.__aenter__()
+        first = asyncio.ensure_future(hold(controller, released, order, "first"))
+        await queued(controller, 1)
+        second = asyncio.ensure_future(hold(controller, released, order, "second"))
+        await queued(controller, 2)
+
+        # Releasing grants the slot to `first`, which is cancelled before it gets to run
+        await slot.__aexit__(None, None, None)
+        first.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        assert first.cancelled()
+        assert order == ["second"]
+        assert controller.lane("model").active == 0
+
+    asyncio.run(scenario())
+
+
+def test_upfront_admission_covers_exactly_one_call():
+    controller = make_controller(global_rate=0.001, global_burst=1)
+    with admission_context(INTERACTIVE, user="u"):
+        controller.admit("model", upfront=True)
+        # The route's early check already paid for this call
+        controller.admit("model")
+        with pytest.raises(Overloaded) as raised:
+            controller.admit("model")
+    assert raised.value.reason == "global_rate"
+    assert controller.admitted == 1
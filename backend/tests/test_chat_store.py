@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from utils.chat_store import ChatStore
+
+
+def make_store(published):
+    db = mongomock_motor.AsyncMongoMockClient().userdb
+    return ChatStore(db, on_change=lambda user_id, version: published.append(version))
+
+
+def hold_inserts(store):
+    """Make messages.insert_many wait for the returned event, to freeze a write halfway"""
+    release = asyncio.Event()
+    insert_many = store.messages.insert_many
+
+    async def held(*args, **kwargs):
+        await release.wait()
+        return await insert_many(*args, **kwargs)
+
+    store.messages.insert_many = held
+    return release
+
+
+def message(text, timestamp):
+    return {"role": "user", "text": text, "timestamp": timestamp}
+
+
+def test_version_waits_for_the_write_to_land():
+    async def scenario():
+        published = []
+        store = make_store(published)
+        await store.create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+        before = await store.get_version("u")
+
+        release = hold_inserts(store)
+        append = asyncio.ensure_future(store.append_messages("u", "c", [message("hi", "2024-01-01T00:00:01")]))
+        await asyncio.sleep(0.01)
+        # The chat summary is updated but its messages are not in yet
+        assert await store.get_version("u") == before
+
+        release.set()
+        await append
+        version = await store.get_version("u")
+        assert version == before + 1
+        assert published[-1] == version
+        changes = await store.changes_since("u", before)
+        assert [m["text"] for m in changes["messages"]] == ["hi"]
+
+    asyncio.run(scenario())
+
+
+def test_later_write_is_not_committed_ahead_of_an_earlier_one():
+    async def scenario():
+        published = []
+        store = make_store(published)
+        await store.create_chat("u", "a", "A", "2024-01-01T00:00:00")
+        await store.create_chat("u", "b", "B", "2024-01-01T00:00:00")
+        before = await store.get_version("u")
+
+        release = hold_inserts(store)
+        slow = asyncio.ensure_future(store.append_messages("u", "a", [message("first", "2024-01-01T00:00:01")]))
+        await asyncio.sleep(0.01)
+        fast = asyncio.ensure_future(store.create_chat("u", "c", "C", "2024-01-01T00:00:02"))
+        await fast
+        # The newer write landed, but the older one hasn't: nothing past it is visible
+        assert await store.get_version("u") == before
+        assert published[-1] == before
+
+        release.set()
+        await slow
+        assert await store.get_version("u") == before + 2
+        assert published[-1] == before + 2
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_version_stops_holding_readers_back():
+    async def scenario():
+        store = make_store([])
+        store.pending_ttl = 0.05
+        await store.create_chat("u", "a", "A", "2024-01-01T00:00:00")
+        # A writer that died between allocating its version and finishing
+        await store._begin_version("u")
+        assert await store.get_version("u") == 1
+        await asyncio.sleep(0.1)
+        assert await store.get_version("u") == 2
+
+    asyncio.run(scenario())
+
+
+def test_append_to_missing_chat_does_not_publish():
+    async def scenario():
+        published = []
+        store = make_store(published)
+        assert await store.append_messages("u", "missing", [message("hi", "2024-01-01T00:00:01")]) is None
+        assert published == []
+        assert await store.get_version("u") == 1
+
+    asyncio.run(scenario())
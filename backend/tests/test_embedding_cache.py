@@ -0,0 +1,78 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from utils.embedding_cache import EmbeddingCache
+
+DIMENSION = 4
+
+
+def make_embed(calls, delay=0.0):
+    async def embed(texts):
+        calls.append(list(texts))
+        await asyncio.sleep(delay)
+        return np.ones((len(texts), DIMENSION), dtype="float32")
+    return embed
+
+
+def test_cancelled_lookup_releases_its_texts():
+    async def scenario():
+        cache = EmbeddingCache("test-model", DIMENSION)
+        calls = []
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(cache.get_many(["hello"], make_embed(calls, delay=1)), 0.05)
+        assert cache._inflight == {}
+        # The text is embedded again instead of waiting on the abandoned lookup
+        vectors = await asyncio.wait_for(cache.get_many(["hello"], make_embed(calls)), 1)
+        assert vectors.shape == (1, DIMENSION)
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_waiter_takes_over_when_owner_is_cancelled():
+    async def scenario():
+        cache = EmbeddingCache("test-model", DIMENSION)
+        calls = []
+        owner = asyncio.ensure_future(cache.get_many(["hello"], make_embed(calls, delay=1)))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_many(["hello"], make_embed(calls)))
+        await asyncio.sleep(0)
+        owner.cancel()
+        vectors = await asyncio.wait_for(waiter, 1)
+        assert vectors.shape == (1, DIMENSION)
+        assert cache._inflight == {}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_owner_running():
+    async def scenario():
+        cache = EmbeddingCache("test-model", DIMENSION)
+        calls = []
+        owner = asyncio.ensure_future(cache.get_many(["hello"], make_embed(calls, delay=0.05)))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_many(["hello"], make_embed(calls)))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        vectors = await asyncio.wait_for(owner, 1)
+        assert vectors.shape == (1, DIMENSION)
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_lookup_propagates_to_waiters():
+    async def failing(texts):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        cache = EmbeddingCache("test-model", DIMENSION)
+        results = await asyncio.gather(cache.get_many(["hello"], failing), cache.get_many(["hello"], failing),
+                                       return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert cache._inflight == {}
+
+    asyncio.run(scenario())
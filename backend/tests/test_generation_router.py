@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from utils.admission import BACKGROUND, admission_context
+from utils.generation_router import (
+    HEDGE_MIN_SAMPLES, CircuitBreaker, GenerationEndpoint, GenerationError, GenerationRouter,
+)
+
+
+class FakeClient:
+    """Stands in for AsyncInferenceClient: each endpoint name maps to an async behaviour"""
+
+    def __init__(self, behaviours):
+        self.behaviours = behaviours
+        self.calls = []
+        self.cancelled = []
+        self.closed_streams = []
+
+    async def post_json(self, url, payload, upstream=None):
+        self.calls.append(upstream)
+        try:
+            reply = await self.behaviours[upstream]()
+        except asyncio.CancelledError:
+            self.cancelled.append(upstream)
+            raise
+        return [{"generated_text": reply}]
+
+    async def stream_json(self, url, payload, upstream=None):
+        self.calls.append(upstream)
+        try:
+            for token in await self.behaviours[upstream]():
+                yield {"token": {"text": token}}
+        finally:
+            self.closed_streams.append(upstream)
+
+
+def reply(text, delay=0.0):
+    async def behaviour():
+        await asyncio.sleep(delay)
+        return text
+    return behaviour
+
+
+def failure(message="upstream error"):
+    async def behaviour():
+        raise RuntimeError(message)
+    return behaviour
+
+
+def endpoint(name, fallback=False, latency=None, **options):
+    e = GenerationEndpoint(f"http://models.test/{name}", fallback=fallback, **options)
+    if latency is not None:
+        # Enough history for its percentile to set the hedge delay
+        for _ in range(HEDGE_MIN_SAMPLES):
+            e.record_success(latency, streaming=False)
+            e.record_success(latency, streaming=True)
+    return e
+
+
+def make_router(behaviours, endpoints, fallbacks=(), **options):
+    options = {"timeout": 5, "attempt_timeout": 5, "hedge": False, "hedge_min_delay_ms": 10, "hedge_budget": 1,
+               **options}
+    client = FakeClient(behaviours)
+    return GenerationRouter(client, endpoints=list(endpoints), fallbacks=list(fallbacks), **options), client
+
+
+def test_breaker_opens_probes_once_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=10)
+    assert not breaker.record_failure(0)
+    assert breaker.record_failure(1) and breaker.state == CircuitBreaker.OPEN
+    assert not breaker.available(5) and breaker.retry_after(5) == 6
+
+    # After the cooldown exactly one probe goes through
+    assert breaker.allow(11) and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow(11)
+    breaker.release()
+    assert breaker.allow(12)
+
+    # A failed probe reopens it at once; a successful one closes it
+    assert breaker.record_failure(12) and breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow(22)
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_fails_over_and_uses_fallback_only_after_every_primary():
+    async def scenario():
+        behaviours = {"a": failure(), "b": reply("from b"), "local": reply("from local")}
+        router, client = make_router(behaviours, [endpoint("a"), endpoint("b")], [endpoint("local", fallback=True)])
+        assert await router.generate("hi", {}) == "from b"
+        assert client.calls == ["a", "b"]
+
+        behaviours["b"] = failure()
+        client.calls.clear()
+        assert await router.generate("hi", {}) == "from local"
+        assert client.calls[-1] == "local" and set(client.calls[:-1]) == {"a", "b"}
+
+    asyncio.run(scenario())
+
+
+def test_open_primaries_are_skipped_and_all_open_is_503():
+    async def scenario():
+        primary = endpoint("a", failure_threshold=1, cooldown=60)
+        fallback = endpoint("local", fallback=True, failure_threshold=1, cooldown=60)
+        router, client = make_router({"a": failure(), "local": failure()}, [primary], [fallback])
+        with pytest.raises(GenerationError):
+            await router.generate("hi", {})
+        assert primary.breaker.state == fallback.breaker.state == CircuitBreaker.OPEN
+
+        client.calls.clear()
+        with pytest.raises(GenerationError) as raised:
+            await router.generate("hi", {})
+        assert raised.value.status_code == 503 and raised.value.retry_after > 0
+        assert client.calls == []
+
+    asyncio.run(scenario())
+
+
+def test_slow_primary_is_hedged_and_the_loser_cancelled():
+    async def scenario():
+        behaviours = {"a": reply("slow", delay=1), "b": reply("fast")}
+        router, client = make_router(behaviours, [endpoint("a", latency=0.001), endpoint("b", latency=0.5)],
+                                     hedge=True)
+        assert await router.generate("hi", {}) == "fast"
+        assert router.hedges == 1 and router.hedge_wins == 1
+        assert client.cancelled == ["a"]
+
+    asyncio.run(scenario())
+
+
+def test_hedges_respect_the_budget_and_skip_background_work():
+    async def scenario():
+        behaviours = {"a": reply("slow", delay=0.05), "b": reply("fast")}
+        router, client = make_router(behaviours, [endpoint("a", latency=0.001), endpoint("b", latency=0.5)],
+                                     hedge=True, hedge_budget=0)
+        assert await router.generate("hi", {}) == "slow"
+        assert router.hedges == 0 and client.calls == ["a"]
+
+        router.hedge_budget = 1
+        with admission_context(BACKGROUND):
+            assert await router.generate("hi", {}) == "slow"
+        assert router.hedges == 0
+
+    asyncio.run(scenario())
+
+
+def test_stream_closes_a_hedge_that_finished_alongside_the_winner():
+    async def scenario():
+        first_token = asyncio.Event()
+
+        async def tokens():
+            await first_token.wait()
+            return ["Hel", "lo"]
+
+        router, client = make_router({"a": tokens}, [endpoint("a", latency=0.001)], hedge=True)
+
+        async def release():
+            # Both copies are waiting by now; they get their first token in the same loop pass
+            await asyncio.sleep(0.05)
+            first_token.set()
+
+        releaser = asyncio.ensure_future(release())
+        chunks = [text async for text in router.stream("hi", {})]
+        await releaser
+        assert "".join(chunks) == "Hello"
+        assert router.hedges == 1
+        assert client.closed_streams == ["a", "a"]
+
+    asyncio.run(scenario())
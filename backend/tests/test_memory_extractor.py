@@ -0,0 +1,26 @@
+import pytest
+
+from utils.memory_extractor import extract_facts
+
+
+@pytest.mark.parametrize("message,facts", [
+    ("I love hiking in the Alps. What about you?", ['The user said: "I love hiking in the Alps."']),
+    ("Hi! My sister lives in Berlin", ['The user said: "My sister lives in Berlin"']),
+    ("i'm a nurse and I work nights", ['The user said: "i\'m a nurse and I work nights"']),
+    ("My name is Sam.", ['The user said: "My name is Sam."']),
+    ("I've got two cats", ['The user said: "I\'ve got two cats"']),
+])
+def test_facts_are_stored_as_what_the_user_said(message, facts):
+    assert extract_facts(message) == facts
+
+
+@pytest.mark.parametrize("message", [
+    "I need help",
+    "my day was long",
+    "Oh my god that is so funny",
+    "I want pizza tonight",
+    "I feel a bit tired",
+    "Do you like my jokes?",
+])
+def test_passing_remarks_are_not_facts(message):
+    assert extract_facts(message) == []
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from utils.embedding_backends import EmbeddingBackend
+from utils.memory_manager import MemoryManager
+from utils.memory_store import UserMemoryStore
+
+DIMENSION = 8
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    name = "hash"
+    model_name = "test-hash"
+    dimension = DIMENSION
+
+    async def embed(self, texts):
+        vectors = np.stack([np.random.default_rng(abs(hash(text))).standard_normal(DIMENSION) for text in texts])
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype("float32")
+
+
+def make_manager(path):
+    return MemoryManager(index_dir=str(path), embedding_backend=HashEmbeddingBackend())
+
+
+def test_appends_run_off_the_event_loop(tmp_path, monkeypatch):
+    threads = []
+    append_many = UserMemoryStore.append_many
+
+    def recording_append_many(self, texts, vectors):
+        threads.append(threading.current_thread())
+        append_many(self, texts, vectors)
+
+    monkeypatch.setattr(UserMemoryStore, "append_many", recording_append_many)
+
+    async def scenario():
+        manager = make_manager(tmp_path)
+        await asyncio.gather(*(manager.add_memories("alice", [f"memory {i}", f"other {i}"]) for i in range(10)))
+        index, store = await manager._resident("alice")
+        assert len(store) == index.ntotal == 20
+        assert await manager.get_relevant_memories("alice", "memory 3", k=1) == ["memory 3"]
+        manager.close()
+
+    asyncio.run(scenario())
+    assert threads and threading.main_thread() not in threads
+
+
+def test_process_safe_reader_picks_up_other_writers(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEMORY_PROCESS_SAFE", "true")
+    monkeypatch.setenv("MEMORY_MAX_STALENESS_MS", "0")
+
+    async def scenario():
+        writer, reader = make_manager(tmp_path), make_manager(tmp_path)
+        await reader.add_memories("alice", ["likes tea"])
+        await writer.add_memories("alice", ["has a cat named Miso"])
+        assert await reader.get_relevant_memories("alice", "has a cat named Miso", k=1) == ["has a cat named Miso"]
+        index, store = await reader._resident("alice")
+        assert len(store) == index.ntotal == 2
+        writer.close()
+        reader.close()
+
+    asyncio.run(scenario())
+
+
+def write_legacy_json(path, texts, vectors):
+    import json
+
+    import faiss
+
+    index = faiss.IndexFlatIP(DIMENSION)
+    index.add(vectors)
+    with open(path, "w") as f:
+        json.dump({"index_data": faiss.serialize_index(index).tobytes().hex(), "memories": texts}, f)
+
+
+def test_legacy_memories_are_migrated(tmp_path):
+    vectors = np.eye(DIMENSION, dtype="float32")[:2]
+    write_legacy_json(tmp_path / "alice.json", ["likes tea", "has a cat"], vectors)
+
+    async def scenario():
+        manager = make_manager(tmp_path)
+        index, store = await manager._resident("alice")
+        assert [store[i] for i in range(len(store))] == ["likes tea", "has a cat"]
+        assert index.ntotal == 2
+        manager.close()
+
+    asyncio.run(scenario())
+    assert (tmp_path / "alice.json.migrated").exists()
+
+
+def test_unmigratable_legacy_memories_are_set_aside(tmp_path):
+    vectors = np.eye(DIMENSION, dtype="float32")[:2]
+    write_legacy_json(tmp_path / "alice.json", ["likes tea", "has a cat", "no vector"], vectors)
+
+    async def scenario():
+        manager = make_manager(tmp_path)
+        index, store = await manager._resident("alice")
+        assert len(store) == index.ntotal == 0
+        manager.close()
+
+    asyncio.run(scenario())
+    assert not (tmp_path / "alice.json").exists()
+    assert (tmp_path / "alice.json.failed").exists()
@@ -0,0 +1,37 @@
+import errno
+
+import numpy as np
+import pytest
+
+from utils.memory_store import OFFSETS_FILE, VECTORS_FILE, UserMemoryStore
+
+DIMENSION = 4
+
+
+def rows(*values):
+    return np.array([[value] * DIMENSION for value in values], dtype="float32")
+
+
+# A torn texts.idx write still commits the records whose entries landed whole
+@pytest.mark.parametrize("failing_file,kept,kept_values", [(VECTORS_FILE, [], []), (OFFSETS_FILE, ["lost one"], [2])])
+def test_failed_append_leaves_later_appends_aligned(tmp_path, monkeypatch, failing_file, kept, kept_values):
+    store = UserMemoryStore(str(tmp_path), DIMENSION, fsync=False)
+    store.append_many(["first"], rows(1))
+
+    append = store._append
+
+    def torn_append(name, data):
+        if name == failing_file:
+            append(name, data[:len(data) // 2 + 1])
+            raise OSError(errno.ENOSPC, "No space left on device")
+        append(name, data)
+
+    monkeypatch.setattr(store, "_append", torn_append)
+    with pytest.raises(OSError):
+        store.append_many(["lost one", "lost two"], rows(2, 3))
+    monkeypatch.setattr(store, "_append", append)
+
+    store.append_many(["second"], rows(4))
+    for view in (store, UserMemoryStore(str(tmp_path), DIMENSION, fsync=False)):
+        assert [view[i] for i in range(len(view))] == ["first", *kept, "second"]
+        assert np.array_equal(view.vectors(), rows(1, *kept_values, 4))
@@ -0,0 +1,102 @@
+import asyncio
+
+import numpy as np
+
+from utils.embedding_backends import EmbeddingBackend, FallbackEmbeddingBackend, LocalEmbeddingBackend
+from utils.sentiment_backends import FallbackSentimentBackend, LocalSentimentBackend, SentimentBackend
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return 3
+
+    def encode(self, texts, batch_size, convert_to_numpy):
+        self.batches.append(list(texts))
+        return np.array([[len(text), 0, 0] for text in texts], dtype="float32")
+
+
+class FailingBackend(EmbeddingBackend, SentimentBackend):
+    name = "failing"
+
+    async def start(self):
+        raise RuntimeError("no model")
+
+    async def embed(self, texts):
+        raise RuntimeError("down")
+
+    async def classify(self, texts):
+        raise RuntimeError("down")
+
+
+class ConstantSentiment(SentimentBackend):
+    name = "constant"
+
+    async def classify(self, texts):
+        return [{"POSITIVE": 1.0} for _ in texts]
+
+
+def test_local_model_loads_once_and_batches_concurrent_calls():
+    async def scenario():
+        encoder = FakeEncoder()
+        backend = LocalEmbeddingBackend(max_batch_size=8, max_wait_ms=20)
+        loads = []
+        backend._load_model = lambda: loads.append(1) or encoder
+        first, second = await asyncio.gather(backend.embed(["a", "bb"]), backend.embed(["ccc"]))
+        await backend.close()
+        assert len(loads) == 1 and backend.dimension == 3
+        assert encoder.batches == [["a", "bb", "ccc"]]
+        assert first.shape == (2, 3) and second.shape == (1, 3)
+
+    asyncio.run(scenario())
+
+
+def test_fallback_backends_share_start_and_failover():
+    async def scenario():
+        sentiment = FallbackSentimentBackend(FailingBackend(), ConstantSentiment())
+        await sentiment.start()
+        assert sentiment.name == "failing+constant"
+        assert await sentiment.classify(["hi"]) == [{"POSITIVE": 1.0}]
+        embeddings = FallbackEmbeddingBackend(FailingBackend(), LocalEmbeddingBackend())
+        embeddings.fallback._load_model = FakeEncoder
+        assert (await embeddings.embed(["abc"])).tolist() == [[1.0, 0.0, 0.0]]
+        await embeddings.close()
+
+        local = LocalSentimentBackend()
+        local._load_model = lambda: (lambda texts, batch_size: [[{"label": "NEUTRAL", "score": 1}] for _ in texts])
+        assert await local.classify(["a", "b"]) == [{"NEUTRAL": 1.0}, {"NEUTRAL": 1.0}]
+        await local.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_load_goes_straight_to_the_fallback_until_retry():
+    async def scenario():
+        local = LocalSentimentBackend()
+        loads = []
+
+        def missing_package():
+            loads.append(1)
+            raise ImportError("SENTIMENT_BACKEND=local requires the transformers package")
+
+        local._load_model = missing_package
+        sentiment = FallbackSentimentBackend(local, ConstantSentiment())
+        await sentiment.start()
+        for _ in range(3):
+            assert await sentiment.classify(["hi"]) == [{"POSITIVE": 1.0}]
+        assert len(loads) == 1
+
+        # Once the backoff has passed the load is retried, with a longer backoff if it fails again
+        first_delay = local._retry_delay
+        local._retry_at = 0
+        assert await sentiment.classify(["hi"]) == [{"POSITIVE": 1.0}]
+        assert len(loads) == 2 and local._retry_delay == 2 * first_delay
+
+        local._retry_at = 0
+        local._load_model = lambda: (lambda texts, batch_size: [[{"label": "NEUTRAL", "score": 1}] for _ in texts])
+        assert await sentiment.classify(["hi"]) == [{"NEUTRAL": 1.0}]
+        await sentiment.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import numpy as np
+
+from utils.response_cache import SemanticResponseCache
+
+KEY = ("friend", ("playful",), "POSITIVE")
+
+
+def basis(i, dimension=8):
+    vector = np.zeros(dimension, dtype="float32")
+    vector[i] = 1
+    return vector
+
+
+def test_lookups_follow_entries_moved_by_eviction():
+    cache = SemanticResponseCache(threshold=0.9, max_entries=3, ttl=60, variants=1)
+    for i in range(5):
+        cache.put(KEY, basis(i), f"reply {i}", 1.0)
+    # The two oldest were evicted; the survivors' rows were moved into their places
+    assert cache.get(KEY, basis(0)) is None
+    assert cache.get(KEY, basis(1)) is None
+    assert [cache.get(KEY, basis(i)) for i in (2, 3, 4)] == ["reply 2", "reply 3", "reply 4"]
+    assert len(cache.buckets[KEY]) == 3
+
+
+def test_bucket_grows_and_expires():
+    cache = SemanticResponseCache(threshold=0.9, max_entries=100, ttl=60, variants=1)
+    for i in range(40):
+        cache.put(KEY, basis(i, dimension=64), f"reply {i}", 1.0)
+    assert cache.get(KEY, basis(37, dimension=64)) == "reply 37"
+
+    cache.ttl = -1
+    assert cache.get(KEY, basis(37, dimension=64)) is None
+    assert KEY not in cache.buckets and len(cache.lru) == 0
@@ -0,0 +1,28 @@
+import pytest
+
+from utils.response_cleaner import StreamingResponseCleaner, clean_response
+
+CONTINUED_DIALOGUE = "You: Aw, that sounds lovely! What did you see?\nUser: mostly trees\nYou: Nice!"
+
+
+def stream(text, size):
+    cleaner = StreamingResponseCleaner()
+    sent = "".join(cleaner.feed(text[i:i + size]) for i in range(0, len(text), size)) + cleaner.finish()
+    return sent, cleaner.text
+
+
+def test_clean_response_cuts_at_the_users_next_turn():
+    assert clean_response(CONTINUED_DIALOGUE) == "Aw, that sounds lovely! What did you see?"
+    assert clean_response("### Response: You: Hi there!") == "Hi there!"
+    assert clean_response("Hey! ### Instructions: be nice") == "Hey!"
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 100])
+def test_streaming_cleaner_matches_clean_response(size):
+    sent, text = stream(CONTINUED_DIALOGUE, size)
+    assert sent.strip() == text == clean_response(CONTINUED_DIALOGUE)
+
+
+def test_streaming_cleaner_keeps_you_inside_the_reply():
+    sent, text = stream("Yours truly, and you: always", 2)
+    assert text == "Yours truly, and you: always"
@@ -0,0 +1,60 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from utils.shared_memory_index import USERS_FILE, MemoryShard, SharedMemoryIndex, decode_id
+
+DIMENSION = 8
+
+
+def unit_vectors(seed, n):
+    vectors = np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_searches_only_see_the_callers_memories(tmp_path):
+    async def scenario():
+        index = SharedMemoryIndex(str(tmp_path), DIMENSION, num_shards=1, fsync=False)
+        alice, bob = unit_vectors(0, 3), unit_vectors(1, 2)
+        await asyncio.gather(index.add_many("alice", ["a0", "a1", "a2"], alice),
+                             index.add_many("bob", ["b0", "b1"], bob))
+        expected = [f"a{i}" for i in np.argsort(-(alice @ bob[0]))]
+        assert await index.search("alice", bob[0], 10) == expected
+        assert await index.search("bob", bob[1], 1) == ["b1"]
+        assert await index.search("carol", bob[1], 1) == []
+        similarities = await index.max_similarity("bob", alice[:1])
+        assert similarities[0] == pytest.approx(max(float(alice[0] @ v) for v in bob), abs=1e-5)
+        index.close()
+
+    asyncio.run(scenario())
+
+
+def test_rows_and_ids_survive_reopen(tmp_path):
+    shard = MemoryShard(str(tmp_path), DIMENSION, fsync=False)
+    assert shard.add_many(0, ["a0", "a1"], unit_vectors(0, 2)) == [0, 1]
+    assert [decode_id(i) for i in shard.add_many(1, ["b0"], unit_vectors(1, 1))] == [(1, 0)]
+    shard.close()
+
+    reopened = MemoryShard(str(tmp_path), DIMENSION, fsync=False)
+    assert reopened.rows == {0: [0, 1], 1: [2]}
+    assert [decode_id(i) for i in reopened.add_many(0, ["a2"], unit_vectors(2, 1))] == [(0, 2)]
+    assert reopened.search(0, unit_vectors(2, 1)[0], 1) == ["a2"]
+    assert reopened.search(1, unit_vectors(2, 1)[0], 5) == ["b0"]
+
+
+def test_user_numbers_are_never_reused_after_a_torn_write(tmp_path):
+    (tmp_path / USERS_FILE).write_text("alice\t0\nbob\t2\ncarol\t")
+
+    async def scenario():
+        index = SharedMemoryIndex(str(tmp_path), DIMENSION, num_shards=1, fsync=False)
+        assert index.user_nums == {"alice": 0, "bob": 2}
+        await index.add_many("dave", ["d0"], unit_vectors(3, 1))
+        assert index.user_nums["dave"] == 3
+        index.close()
+
+    asyncio.run(scenario())
+    assert (tmp_path / USERS_FILE).read_text() == "alice\t0\nbob\t2\ndave\t3\n"
+    assert SharedMemoryIndex(str(tmp_path), DIMENSION, num_shards=1).user_nums["dave"] == 3
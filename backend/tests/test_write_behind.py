@@ -0,0 +1,218 @@
+import asyncio
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from utils.chat_store import ChatStore
+from utils.write_behind import WriteBehindChatStore
+
+
+def message(text, timestamp):
+    return {"role": "user", "text": text, "timestamp": timestamp}
+
+
+def make_stores(tmp_path, published=None):
+    db = mongomock_motor.AsyncMongoMockClient().userdb
+    on_change = (lambda user_id, version: published.append(version)) if published is not None else None
+    # flush_interval is long so tests decide when flushes happen
+    store = WriteBehindChatStore(db, on_change=on_change, wal_dir=str(tmp_path / "wal"), flush_interval=60,
+                                 fsync=False)
+    # Stands in for another worker process sharing the database
+    return store, ChatStore(db)
+
+
+def test_append_to_chat_deleted_before_flush_leaves_no_messages(tmp_path):
+    async def scenario():
+        store, other = make_stores(tmp_path)
+        await store.start()
+        await other.create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+        await store.append_messages("u", "c", [message("hi", "2024-01-01T00:00:01")])
+        assert await other.delete_chat("u", "c")
+        await store.flush()
+        assert await store.messages.count_documents({"chat_id": "c"}) == 0
+        changes = await other.changes_since("u", 0)
+        assert changes["messages"] == []
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_version_is_committed_after_messages_land(tmp_path):
+    async def scenario():
+        published = []
+        store, other = make_stores(tmp_path, published)
+        await store.start()
+        await other.create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+        before = await other.get_version("u")
+        await store.append_messages("u", "c", [message("hi", "2024-01-01T00:00:01")])
+
+        release = asyncio.Event()
+        bulk_write = store.messages.bulk_write
+
+        async def held(*args, **kwargs):
+            await release.wait()
+            return await bulk_write(*args, **kwargs)
+
+        store.messages.bulk_write = held
+        flush = asyncio.ensure_future(store.flush())
+        await asyncio.sleep(0.01)
+        assert await other.get_version("u") == before
+
+        release.set()
+        await flush
+        assert await other.get_version("u") == before + 1
+        assert published[-1] == before + 1
+        changes = await other.changes_since("u", before)
+        assert [m["text"] for m in changes["messages"]] == ["hi"]
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_reapplying_a_batch_is_idempotent(tmp_path):
+    async def scenario():
+        store, other = make_stores(tmp_path)
+        await store.start()
+        await other.create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+        await store.append_messages("u", "c", [message("hi", "2024-01-01T00:00:01")])
+        batch = list(store.pending)
+        await store.flush()
+        # As a replay after a crash between the Mongo writes and the WAL cleanup would
+        await store._apply(batch)
+        assert await store.messages.count_documents({"chat_id": "c"}) == 1
+        context = await other.get_context("u", "c")
+        assert context["message_count"] == 1
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def make_worker(db, wal_dir, worker_id):
+    return WriteBehindChatStore(db, wal_dir=str(wal_dir), flush_interval=60, fsync=False, worker_id=worker_id)
+
+
+async def crash(store):
+    """Stop a store's tasks and drop its WAL lock without flushing, as if its process died"""
+    for task in store._tasks:
+        task.cancel()
+    await asyncio.gather(*store._tasks, return_exceptions=True)
+    store._tasks = []
+    store._owner_lock.close()
+
+
+def test_workers_log_to_their_own_wal(tmp_path):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().userdb
+        await ChatStore(db).create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+        first, second = make_worker(db, tmp_path, "1"), make_worker(db, tmp_path, "2")
+        await first.start()
+        await second.start()
+        await first.append_messages("u", "c", [message("from first", "2024-01-01T00:00:01")])
+        await second.append_messages("u", "c", [message("from second", "2024-01-01T00:00:02")])
+        # The first worker's flush must not delete the second's unflushed entries
+        await first.flush()
+        assert second._segments() != []
+        await crash(second)
+
+        third = make_worker(db, tmp_path, "3")
+        await third.start()
+        assert third.adopted_entries == 1
+        assert not (tmp_path / "worker-2").exists()
+        await third.flush()
+        texts = sorted(m["text"] for m in await db.messages.find({"chat_id": "c"}).to_list(length=None))
+        assert texts == ["from first", "from second"]
+        await first.close()
+        await third.close()
+
+    asyncio.run(scenario())
+
+
+def test_live_worker_wal_is_not_adopted(tmp_path):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().userdb
+        await ChatStore(db).create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+        first, second = make_worker(db, tmp_path, "1"), make_worker(db, tmp_path, "2")
+        await first.start()
+        await first.append_messages("u", "c", [message("hi", "2024-01-01T00:00:01")])
+        await second.start()
+        assert await second.adopt_orphans() == 0
+        assert first._segments() != []
+        with pytest.raises(RuntimeError):
+            await make_worker(db, tmp_path, "1").start()
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_interleaved_workers_apply_every_entry_once(tmp_path):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().userdb
+        reader = ChatStore(db)
+        await reader.create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+        first, second = make_worker(db, tmp_path, "1"), make_worker(db, tmp_path, "2")
+        await first.start()
+        await second.start()
+        await first.append_messages("u", "c", [message("older", "2024-01-01T00:00:01")])
+        await second.append_messages("u", "c", [message("newer", "2024-01-01T00:00:02")])
+        older = list(first.pending)
+        # The newer entry lands first; the older one must not be mistaken for already applied
+        await second.flush()
+        await first.flush()
+        await first._apply(older)
+        context = await reader.get_context("u", "c")
+        assert context["message_count"] == 2
+        assert await db.messages.count_documents({"chat_id": "c"}) == 2
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_replays_own_wal_after_restart(tmp_path):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().userdb
+        await ChatStore(db).create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+        store = make_worker(db, tmp_path, "1")
+        await store.start()
+        await store.append_messages("u", "c", [message("hi", "2024-01-01T00:00:01")])
+        await crash(store)
+
+        restarted = make_worker(db, tmp_path, "1")
+        await restarted.start()
+        assert len(restarted.pending) == 1
+        await restarted.close()
+        assert await db.messages.count_documents({"chat_id": "c"}) == 1
+        assert not (tmp_path / "worker-1").exists()
+
+    asyncio.run(scenario())
+
+
+def test_failed_wal_write_keeps_the_exchange_out_of_mongo(tmp_path):
+    async def scenario():
+        store, other = make_stores(tmp_path)
+        await store.start()
+        await other.create_chat("u", "c", "Chat", "2024-01-01T00:00:00")
+
+        write_wal = store._write_wal
+
+        def full_disk(segment, data):
+            raise OSError("No space left on device")
+
+        store._write_wal = full_disk
+        # Flushing while the write is in flight must not take the entry either
+        append = asyncio.ensure_future(store.append_messages("u", "c", [message("lost", "2024-01-01T00:00:01")]))
+        await asyncio.sleep(0)
+        await store.flush()
+        with pytest.raises(OSError):
+            await append
+        store._write_wal = write_wal
+
+        await store.append_messages("u", "c", [message("kept", "2024-01-01T00:00:02")])
+        await store.flush()
+        assert [m["text"] async for m in store.messages.find({"chat_id": "c"})] == ["kept"]
+        assert store.pending == []
+        await store.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,281 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+from cachetools import LRUCache
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers get slots first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "inference_queue_wait_seconds", "Time upstream inference calls waited for a slot", ["upstream", "priority"]
+)
+REJECTIONS = REGISTRY.counter(
+    "inference_rejections_total", "Upstream inference calls refused by admission control",
+    ["upstream", "priority", "reason"]
+)
+IN_FLIGHT = REGISTRY.gauge("inference_in_flight", "Upstream inference calls holding a slot", ["upstream"])
+
+
+class Overloaded(Exception):
+    """Admission control refused an upstream call; worth retrying after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Inference overloaded ({reason}), retry after {retry_after:.2f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Spend a token: 0.0 if one was available, else the seconds until one is (nothing is spent)"""
+        # now may predate a bucket created after it was read
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class Caller:
+    """Who the current upstream calls are for: a user (for their rate limit) and a priority"""
+
+    def __init__(self, user: Optional[str] = None, priority: int = INTERACTIVE):
+        self.user = user
+        self.priority = priority
+        # Upstreams already charged up front by admit(upfront=True)
+        self.admitted: Set[str] = set()
+
+
+_current_caller: contextvars.ContextVar = contextvars.ContextVar("admission_caller", default=None)
+
+
+def current_caller() -> Caller:
+    return _current_caller.get() or Caller()
+
+
+def identify_caller(user: str) -> None:
+    """Make the rest of this request (and tasks it starts) an interactive caller for user"""
+    _current_caller.set(Caller(user))
+
+
+_SAME_USER = object()
+
+
+@contextmanager
+def admission_context(priority: int, user=_SAME_USER):
+    """Run the block's upstream calls, and tasks created in it, at priority.
+
+    The user defaults to the current caller's, so background work a request
+    kicks off still counts against that user's rate limit; None means no user.
+    """
+    token = _current_caller.set(Caller(current_caller().user if user is _SAME_USER else user, priority))
+    try:
+        yield
+    finally:
+        _current_caller.reset(token)
+
+
+class Lane:
+    """Slots and the wait queue for one upstream"""
+
+    def __init__(self, name: str, slots: int):
+        self.name = name
+        self.slots = slots
+        self.active = 0
+        # Heap of (priority, deadline, sequence, future)
+        self.waiters: List[Tuple[int, float, int, asyncio.Future]] = []
+        # Moving average of how long a call holds its slot
+        self.service_seconds: Optional[float] = None
+
+    def expected_wait(self, ahead: int) -> Optional[float]:
+        if self.service_seconds is None:
+            return None
+        return (ahead + 1) / self.slots * self.service_seconds
+
+
+class AdmissionController:
+    """Admission control and priority scheduling in front of the inference upstreams.
+
+    Every upstream is a lane with max_concurrency slots. A call is first
+    charged to token buckets (per upstream, and per user per upstream),
+    then waits for a slot in a bounded queue served by priority
+    (interactive before background) and deadline. Rather than queueing
+    work that can't finish in time, calls are refused with Overloaded when
+    a bucket is empty, when the queue is full (evicting a lower-priority
+    waiter instead if there is one), or when the expected wait already
+    exceeds the priority's max wait; waiters that reach it are dropped.
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue: Optional[int] = None,
+                 global_rate: Optional[float] = None, global_burst: Optional[float] = None,
+                 user_rate: Optional[float] = None, user_burst: Optional[float] = None,
+                 max_wait: Optional[Dict[int, float]] = None, user_buckets: int = 10000):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("INFERENCE_MAX_QUEUE", "64"))
+        # Calls per second per upstream; 0 disables the limit
+        self.global_rate = global_rate if global_rate is not None else float(os.getenv("INFERENCE_GLOBAL_RATE", "0"))
+        self.global_burst = global_burst or float(os.getenv("INFERENCE_GLOBAL_BURST", "0")) or max(1.0, 2 * self.global_rate)
+        self.user_rate = user_rate if user_rate is not None else float(os.getenv("INFERENCE_USER_RATE", "0"))
+        self.user_burst = user_burst or float(os.getenv("INFERENCE_USER_BURST", "0")) or max(1.0, 2 * self.user_rate)
+        self.max_wait = max_wait or {
+            INTERACTIVE: float(os.getenv("INFERENCE_MAX_WAIT_INTERACTIVE", "2")),
+            BACKGROUND: float(os.getenv("INFERENCE_MAX_WAIT_BACKGROUND", "30")),
+        }
+        self.lanes: Dict[str, Lane] = {}
+        self.global_buckets: Dict[str, TokenBucket] = {}
+        self.user_buckets = LRUCache(maxsize=user_buckets)
+        self._sequence = itertools.count()
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    def lane(self, upstream: str) -> Lane:
+        if upstream not in self.lanes:
+            self.lanes[upstream] = Lane(upstream, self.max_concurrency)
+        return self.lanes[upstream]
+
+    def _reject(self, upstream: str, priority: int, reason: str, retry_after: float) -> Overloaded:
+        REJECTIONS.inc(upstream=upstream, priority=PRIORITY_NAMES[priority], reason=reason)
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return Overloaded(reason, retry_after)
+
+    def admit(self, upstream: str, upfront: bool = False) -> None:
+        """Charge one call to upstream against the rate limits, or raise Overloaded.
+
+        With upfront=True the charge covers the current caller's next call to
+        upstream, so a route can refuse an overloaded request before doing
+        any other work.
+        """
+        caller = current_caller()
+        if upstream in caller.admitted:
+            caller.admitted.discard(upstream)
+            return
+        lane = self.lane(upstream)
+        if len(lane.waiters) >= self.max_queue and all(entry[0] <= caller.priority for entry in lane.waiters):
+            raise self._reject(upstream, caller.priority, "queue_full", lane.expected_wait(len(lane.waiters)) or 1.0)
+
+        now = time.monotonic()
+        user_bucket = None
+        if self.user_rate and caller.user is not None:
+            key = (upstream, caller.user)
+            user_bucket = self.user_buckets.get(key)
+            if user_bucket is None:
+                user_bucket = self.user_buckets[key] = TokenBucket(self.user_rate, self.user_burst)
+            wait = user_bucket.take(now)
+            if wait:
+                raise self._reject(upstream, caller.priority, "user_rate", wait)
+        if self.global_rate:
+            bucket = self.global_buckets.get(upstream)
+            if bucket is None:
+                bucket = self.global_buckets[upstream] = TokenBucket(self.global_rate, self.global_burst)
+            wait = bucket.take(now)
+            if wait:
+                if user_bucket is not None:
+                    user_bucket.refund()
+                raise self._reject(upstream, caller.priority, "global_rate", wait)
+        self.admitted += 1
+        if upfront:
+            caller.admitted.add(upstream)
+
+    @asynccontextmanager
+    async def slot(self, upstream: str):
+        """Hold one of upstream's concurrency slots for the block, waiting by priority"""
+        priority = current_caller().priority
+        lane = self.lane(upstream)
+        start = time.monotonic()
+        max_wait = self.max_wait[priority]
+
+        if lane.active < lane.slots and not lane.waiters:
+            lane.active += 1
+        else:
+            ahead = sum(1 for entry in lane.waiters if entry[0] <= priority)
+            expected = lane.expected_wait(ahead)
+            if expected is not None and expected > max_wait:
+                raise self._reject(upstream, priority, "deadline", expected)
+            if len(lane.waiters) >= self.max_queue:
+                worst = max(lane.waiters)
+                if worst[0] <= priority:
+                    raise self._reject(upstream, priority, "queue_full", expected or 1.0)
+                # Make room by dropping the lowest-priority, latest-deadline waiter
+                lane.waiters.remove(worst)
+                heapq.heapify(lane.waiters)
+                worst[3].set_exception(self._reject(upstream, worst[0], "evicted", expected or 1.0))
+
+            future = asyncio.get_running_loop().create_future()
+            entry = (priority, start + max_wait, next(self._sequence), future)
+            heapq.heappush(lane.waiters, entry)
+            # Not wait_for: on Python < 3.12 it swallows a cancellation that races the grant
+            try:
+                done, _ = await asyncio.wait((future,), timeout=max_wait)
+            except BaseException:
+                self._remove(lane, entry)
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    # Granted just as we were cancelled: pass the slot on
+                    self._release(lane)
+                future.cancel()
+                raise
+            if not done:
+                self._remove(lane, entry)
+                future.cancel()
+                raise self._reject(upstream, priority, "deadline", lane.expected_wait(ahead) or max_wait)
+            # Raises Overloaded if a higher-priority call evicted us
+            future.result()
+
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - start, upstream=upstream, priority=PRIORITY_NAMES[priority])
+        acquired = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - acquired
+            lane.service_seconds = held if lane.service_seconds is None else 0.9 * lane.service_seconds + 0.1 * held
+            self._release(lane)
+
+    def _remove(self, lane: Lane, entry) -> None:
+        if entry in lane.waiters:
+            lane.waiters.remove(entry)
+            heapq.heapify(lane.waiters)
+
+    def _release(self, lane: Lane) -> None:
+        lane.active -= 1
+        while lane.waiters and lane.active < lane.slots:
+            _, _, _, future = heapq.heappop(lane.waiters)
+            if not future.done():
+                lane.active += 1
+                future.set_result(None)
+
+    def stats(self) -> Dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "upstreams": {
+                name: {
+                    "in_flight": lane.active,
+                    "queued": len(lane.waiters),
+                    "slots": lane.slots,
+                    "service_ms": round(lane.service_seconds * 1000, 1) if lane.service_seconds is not None else None,
+                }
+                for name, lane in self.lanes.items()
+            },
+        }
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import Dict, Optional
+
+import httpx
+from cachetools import LRUCache
+from jose import JWTError, jwt
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+GOOGLE_JWKS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class TokenVerifier:
+    """Verifies our own access tokens, remembering recent successes.
+
+    Successful decodes are kept in an LRU keyed by the token's sha256 digest
+    (never the raw token). A cache hit skips the HMAC and claims parsing but
+    still enforces `exp`.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str, maxsize: int = None):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        maxsize = maxsize if maxsize is not None else int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+        self.cache = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token: str) -> Dict:
+        """Return the token's claims; raises JWTError if invalid or expired"""
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self.cache.get(key)
+        if claims is not None:
+            if claims.get("exp") is not None and claims["exp"] <= time.time():
+                self.cache.pop(key, None)
+                raise JWTError("Signature has expired.")
+            self.hits += 1
+            return claims
+
+        self.misses += 1
+        claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        self.cache[key] = claims
+        return claims
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class GoogleAuth:
+    """Google OAuth code exchange and ID token verification over one pooled client.
+
+    Google's signing keys (JWKS) are cached for as long as their
+    Cache-Control max-age allows and refreshed in the background shortly
+    before they expire, so verifying an ID token never waits on a cert
+    download except on a cold start or an unknown key id.
+    """
+
+    def __init__(self, client_id: Optional[str] = None, client_secret: Optional[str] = None,
+                 jwks_url: Optional[str] = None, token_url: Optional[str] = None):
+        self.client_id = client_id or os.getenv("CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("CLIENT_SECRET")
+        self.jwks_url = jwks_url or os.getenv("GOOGLE_JWKS_URL", GOOGLE_JWKS_URL)
+        self.token_url = token_url or os.getenv("GOOGLE_TOKEN_URL", GOOGLE_TOKEN_URL)
+        self.keys: Dict[str, Dict] = {}
+        self.keys_expire_at = 0.0
+        self.jwks_fetches = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Open the pooled HTTP client and start the background key refresh"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(10, connect=5))
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_keys(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(10, connect=5))
+        response = await self._client.get(self.jwks_url)
+        response.raise_for_status()
+        self.jwks_fetches += 1
+        self.keys = {key["kid"]: key for key in response.json()["keys"]}
+        match = MAX_AGE_PATTERN.search(response.headers.get("cache-control", ""))
+        self.keys_expire_at = time.time() + (int(match.group(1)) if match else 3600)
+
+    async def refresh_keys(self, force: bool = False) -> None:
+        async with self._refresh_lock:
+            # Another caller may have refreshed while we waited for the lock
+            if force or time.time() >= self.keys_expire_at:
+                await self._fetch_keys()
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh_keys()
+                # Refresh at ~90% of the advertised lifetime
+                delay = max(60.0, (self.keys_expire_at - time.time()) * 0.9)
+            except Exception as e:
+                logger.error(f"Google JWKS refresh failed: {str(e)}")
+                delay = 60.0
+            await asyncio.sleep(delay)
+
+    async def _key_for(self, token: str) -> Dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if time.time() >= self.keys_expire_at:
+            await self.refresh_keys()
+        if kid not in self.keys:
+            # Key rotation: the token may be signed with a key newer than our copy
+            await self.refresh_keys(force=True)
+        if kid not in self.keys:
+            raise JWTError("Unknown signing key")
+        return self.keys[kid]
+
+    async def verify_id_token(self, token: str, access_token: Optional[str] = None) -> Dict:
+        """Verify a Google ID token's signature, audience, issuer and expiry"""
+        key = await self._key_for(token)
+        return jwt.decode(
+            token, key, algorithms=[key.get("alg", "RS256")],
+            audience=self.client_id, issuer=GOOGLE_ISSUERS, access_token=access_token
+        )
+
+    async def exchange_code(self, code: str, redirect_uri: str) -> httpx.Response:
+        if self._client is None:
+            await self.start()
+        return await self._client.post(
+            self.token_url,
+            data={
+                "code": code,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "redirect_uri": redirect_uri,
+                "grant_type": "authorization_code",
+            },
+            headers={"Accept": "application/json"},
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "jwks_keys": len(self.keys),
+            "jwks_fetches": self.jwks_fetches,
+            "jwks_expires_in": max(0, round(self.keys_expire_at - time.time())),
+        }
@@ -0,0 +1,291 @@
+import asyncio
+import base64
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROJECTION = {"_id": 0, "user_id": 0, "version": 0, "recent": 0, "summary": 0, "wal_seq": 0,
+                      "wal_seqs": 0}
+CONTEXT_PROJECTION = {"_id": 0, "recent": 1, "summary": 1, "message_count": 1}
+MESSAGE_PROJECTION = {"user_id": 0, "chat_id": 0, "version": 0}
+DELTA_MESSAGE_PROJECTION = {"_id": 0, "user_id": 0}
+
+
+def encode_cursor(timestamp: str, message_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp}|{message_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    """Raises ValueError for a malformed cursor"""
+    timestamp, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+    try:
+        return timestamp, ObjectId(message_id)
+    except InvalidId as e:
+        raise ValueError(str(e)) from e
+
+
+class SyncNotifier:
+    """Wakes up push-channel listeners when a user's sync version changes (in-process only)"""
+
+    def __init__(self):
+        self.listeners: Dict[str, List[asyncio.Queue]] = {}
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=1)
+        self.listeners.setdefault(user_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self.listeners.get(user_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self.listeners.pop(user_id, None)
+
+    def publish(self, user_id: str, version: int) -> None:
+        for queue in self.listeners.get(user_id, []):
+            # Only the latest version matters, so drop a pending older one
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(version)
+
+
+class ChatStore:
+    """Chat summaries and messages in their own collections.
+
+    `chats` holds one small summary document per chat; `messages` holds one
+    document per message, so no document grows with conversation length.
+
+    Every change takes the next per-user sync version (in `sync_state`) and
+    stamps it on the chat/message it touched, so clients can ask for only
+    what changed since the version they last saw. Deleted chats are kept as
+    tombstones for the same reason. A version stays pending until its
+    writes have landed, and readers (and the push channel) only see the
+    committed version: the highest one with no pending version at or below
+    it. So data read after the version always includes every write up to it.
+
+    Each summary document also carries the chat's rolling context: the last
+    `context_size` messages (`recent`, capped with $slice on every append)
+    and a running `summary` of everything older, so building a prompt's
+    history is one small read however long the chat is.
+    """
+
+    def __init__(self, db, on_change: Optional[Callable[[str, int], None]] = None,
+                 context_size: Optional[int] = None, pending_ttl: Optional[float] = None):
+        self.chats = db.chats
+        self.messages = db.messages
+        self.sync_state = db.sync_state
+        self.on_change = on_change
+        self.context_size = context_size or int(os.getenv("CHAT_CONTEXT_MESSAGES", "12"))
+        # A version pending this long belongs to a writer that died; stop holding readers back for it
+        self.pending_ttl = pending_ttl or float(os.getenv("SYNC_PENDING_TTL", "60"))
+
+    async def start(self) -> None:
+        """Nothing to start for direct writes; see WriteBehindChatStore"""
+
+    async def close(self) -> None:
+        """Nothing to flush for direct writes; see WriteBehindChatStore"""
+
+    def _committed(self, state: Optional[Dict]) -> int:
+        if not state:
+            return 0
+        cutoff = time.time() - self.pending_ttl
+        pending = [entry["v"] for entry in state.get("pending", []) if entry["at"] > cutoff]
+        return min(pending) - 1 if pending else state["version"]
+
+    async def get_version(self, user_id: str) -> int:
+        """The committed sync version: every write stamped with it or lower has landed"""
+        return self._committed(await self.sync_state.find_one({"_id": user_id}, {"version": 1, "pending": 1}))
+
+    async def _begin_version(self, user_id: str) -> int:
+        """Allocate the next sync version for a write, pending until _end_version"""
+        while True:
+            state = await self.sync_state.find_one({"_id": user_id}) or {"version": 0}
+            version = state["version"] + 1
+            now = time.time()
+            pending = [entry for entry in state.get("pending", []) if entry["at"] > now - self.pending_ttl]
+            # Compare-and-set on the whole state, so a concurrent begin or end makes us retry
+            expected = {"_id": user_id, "version": state["version"],
+                        "pending": state["pending"] if "pending" in state else {"$exists": False}}
+            try:
+                result = await self.sync_state.update_one(
+                    expected, {"$set": {"version": version, "pending": pending + [{"v": version, "at": now}]}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # The state changed since we read it, so the upsert tried to insert a second one
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                return version
+
+    async def _end_version(self, user_id: str, version: int) -> int:
+        """Mark a version's writes as landed (or abandoned); returns the committed version"""
+        state = await self.sync_state.find_one_and_update(
+            {"_id": user_id}, {"$pull": {"pending": {"v": version}}}, return_document=ReturnDocument.AFTER
+        )
+        return self._committed(state)
+
+    def _changed(self, user_id: str, version: int) -> None:
+        if self.on_change is not None:
+            self.on_change(user_id, version)
+
+    async def ensure_indexes(self) -> None:
+        await self.chats.create_index([("user_id", ASCENDING), ("chat_id", ASCENDING)], unique=True)
+        await self.chats.create_index([("user_id", ASCENDING), ("updated_at", DESCENDING)])
+        await self.chats.create_index([("user_id", ASCENDING), ("version", ASCENDING)])
+        await self.messages.create_index(
+            [("user_id", ASCENDING), ("chat_id", ASCENDING), ("timestamp", ASCENDING)]
+        )
+        await self.messages.create_index([("user_id", ASCENDING), ("version", ASCENDING)])
+
+    async def create_chat(self, user_id: str, chat_id: str, chat_title: str, timestamp: str) -> Dict:
+        summary = {
+            "chat_id": chat_id,
+            "chat_title": chat_title,
+            "created_at": timestamp,
+            "updated_at": timestamp,
+            "message_count": 0,
+            "preview": None,
+        }
+        version = await self._begin_version(user_id)
+        try:
+            await self.chats.insert_one({"user_id": user_id, "version": version, **summary})
+        finally:
+            committed = await self._end_version(user_id, version)
+        self._changed(user_id, committed)
+        return summary
+
+    async def list_chats(self, user_id: str) -> List[Dict]:
+        cursor = self.chats.find(
+            {"user_id": user_id, "deleted": {"$ne": True}}, SUMMARY_PROJECTION
+        ).sort("updated_at", DESCENDING)
+        return await cursor.to_list(length=None)
+
+    def _append_pipeline(self, messages: List[Dict], version: int) -> List[Dict]:
+        """Aggregation-pipeline update that bumps a chat summary and its context window"""
+        first_user_text = next((m["text"] for m in messages if m["role"] == "user"), None)
+        turns = [{"role": m["role"], "text": m["text"]} for m in messages]
+        # $literal keeps user text that starts with "$" from being read as a field path
+        return [{"$set": {
+            "version": version,
+            "updated_at": messages[-1]["timestamp"],
+            "message_count": {"$add": ["$message_count", len(messages)]},
+            "preview": {"$ifNull": ["$preview", {"$literal": first_user_text}]},
+            "recent": {"$slice": [
+                {"$concatArrays": [{"$ifNull": ["$recent", []]}, {"$literal": turns}]},
+                -self.context_size
+            ]},
+        }}]
+
+    async def append_messages(self, user_id: str, chat_id: str, messages: List[Dict],
+                              context: Optional[Dict] = None) -> Optional[Dict]:
+        """Insert messages and bump the chat summary and context window.
+
+        Returns the updated context ({recent, summary, message_count}), or
+        None if the chat doesn't exist. `context`, the chat's context as read
+        before this turn, is only used by write-behind stores.
+        """
+        version = await self._begin_version(user_id)
+        try:
+            context = await self.chats.find_one_and_update(
+                {"user_id": user_id, "chat_id": chat_id, "deleted": {"$ne": True}},
+                self._append_pipeline(messages, version),
+                projection=CONTEXT_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+            if context is not None:
+                await self.messages.insert_many(
+                    [{"user_id": user_id, "chat_id": chat_id, "version": version, **message} for message in messages]
+                )
+        finally:
+            committed = await self._end_version(user_id, version)
+        if context is None:
+            return None
+        self._changed(user_id, committed)
+        return context
+
+    async def get_context(self, user_id: str, chat_id: str) -> Optional[Dict]:
+        """The chat's rolling context ({recent, summary, message_count}), or None if it doesn't exist"""
+        context = await self.chats.find_one(
+            {"user_id": user_id, "chat_id": chat_id, "deleted": {"$ne": True}}, CONTEXT_PROJECTION
+        )
+        if context is not None:
+            context.setdefault("recent", [])
+            context.setdefault("summary", None)
+        return context
+
+    async def set_summary(self, user_id: str, chat_id: str, summary: str) -> None:
+        await self.chats.update_one({"user_id": user_id, "chat_id": chat_id}, {"$set": {"summary": summary}})
+
+    async def get_messages(self, user_id: str, chat_id: str, limit: int = 50,
+                           before: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Return up to `limit` messages older than `before`, oldest first, plus the next cursor"""
+        query = {"user_id": user_id, "chat_id": chat_id}
+        if before:
+            timestamp, message_id = decode_cursor(before)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": message_id}},
+            ]
+        cursor = self.messages.find(query, MESSAGE_PROJECTION).sort(
+            [("timestamp", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit + 1)
+        page = await cursor.to_list(length=limit + 1)
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1]["timestamp"], page[-1]["_id"])
+        page.reverse()
+        for message in page:
+            message.pop("_id")
+        return page, next_cursor
+
+    async def delete_chat(self, user_id: str, chat_id: str) -> bool:
+        """Delete a chat's messages and leave a tombstone for delta sync"""
+        version = await self._begin_version(user_id)
+        try:
+            result = await self.chats.update_one(
+                {"user_id": user_id, "chat_id": chat_id, "deleted": {"$ne": True}},
+                {"$set": {"deleted": True, "version": version},
+                 "$unset": {"preview": "", "chat_title": ""}}
+            )
+            if result.matched_count:
+                await self.messages.delete_many({"user_id": user_id, "chat_id": chat_id})
+        finally:
+            committed = await self._end_version(user_id, version)
+        if result.matched_count == 0:
+            return False
+        self._changed(user_id, committed)
+        return True
+
+    async def changes_since(self, user_id: str, since: int, message_limit: int = 500) -> Dict:
+        """Chats and messages changed after version `since`.
+
+        Deleted chats come back as {"chat_id", "deleted": True}. If more than
+        message_limit messages changed, `truncated` tells the client to do a
+        full reload instead.
+        """
+        chats = await self.chats.find(
+            {"user_id": user_id, "version": {"$gt": since}}, SUMMARY_PROJECTION
+        ).to_list(length=None)
+        messages = await self.messages.find(
+            {"user_id": user_id, "version": {"$gt": since}}, DELTA_MESSAGE_PROJECTION
+        ).sort([("version", ASCENDING), ("timestamp", ASCENDING)]).limit(message_limit + 1).to_list(length=message_limit + 1)
+        truncated = len(messages) > message_limit
+        return {
+            "chats": [
+                {"chat_id": chat["chat_id"], "deleted": True} if chat.get("deleted") else chat
+                for chat in chats
+            ],
+            "messages": messages[:message_limit],
+            "truncated": truncated,
+        }
@@ -0,0 +1,108 @@
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from utils.inference_client import AsyncInferenceClient
+from utils.model_backends import FallbackModel, LocalModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingBackend:
+    """Turns texts into L2-normalized float32 vectors of shape (n, dimension)"""
+
+    name = "base"
+    model_name = DEFAULT_EMBEDDING_MODEL
+    dimension = 384
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class RemoteEmbeddingBackend(EmbeddingBackend):
+    """Hosted feature-extraction endpoint on the Hugging Face Inference API"""
+
+    name = "remote"
+
+    def __init__(self, client: Optional[AsyncInferenceClient] = None, api_url: Optional[str] = None):
+        self.api_url = api_url or os.getenv(
+            "EMBEDDING_API_URL",
+            f"https://api-inference.huggingface.co/models/{DEFAULT_EMBEDDING_MODEL}"
+        )
+        self.client = client or AsyncInferenceClient()
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        embeddings = await self.client.post_json(self.api_url, {"inputs": texts})
+        vectors = np.array(embeddings, dtype='float32')
+        if vectors.shape != (len(texts), self.dimension):
+            raise ValueError(f"Unexpected embedding shape {vectors.shape}")
+        return l2_normalize(vectors)
+
+
+class LocalEmbeddingBackend(LocalModel, EmbeddingBackend):
+    """In-process sentence-transformers model with micro-batched inference.
+
+    Requires the optional sentence-transformers package.
+    """
+
+    task = "embedding"
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        super().__init__(
+            model_name,
+            max_batch_size=max_batch_size or int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32")),
+            max_wait_ms=max_wait_ms or float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")),
+        )
+
+    def _load_model(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=local requires the sentence-transformers package") from e
+        return SentenceTransformer(self.model_name, device="cpu")
+
+    def _loaded(self) -> None:
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def _run_batch(self, texts: List[str]) -> List[np.ndarray]:
+        vectors = self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+        return list(l2_normalize(vectors))
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return np.vstack(await self._submit_many(texts))
+
+
+class FallbackEmbeddingBackend(FallbackModel, EmbeddingBackend):
+    task = "embedding"
+
+    def __init__(self, primary: EmbeddingBackend, fallback: EmbeddingBackend):
+        super().__init__(primary, fallback)
+        self.dimension = primary.dimension
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return await self._call("embed", texts)
+
+
+def create_embedding_backend(client: Optional[AsyncInferenceClient] = None) -> EmbeddingBackend:
+    """Build the backend selected by EMBEDDING_BACKEND (remote, local)"""
+    remote = RemoteEmbeddingBackend(client=client)
+    if os.getenv("EMBEDDING_BACKEND", "remote") == "local":
+        return FallbackEmbeddingBackend(LocalEmbeddingBackend(), remote)
+    return remote
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils.file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost on top of the vector itself (key, dict slot, array header)
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class EmbeddingAbandoned(Exception):
+    """The caller embedding a text was cancelled first; whoever was waiting on it should embed it"""
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache.
+
+    Keys are sha256(model name + normalized text). The memory tier is an LRU
+    bounded by max_bytes; the optional disk tier is an append-only file of
+    fixed-width records (32-byte key + float32 vector) read through np.memmap.
+    """
+
+    def __init__(self, model_name: str, dimension: int, max_bytes: int = 32 * 1024 * 1024, cache_dir: Optional[str] = None):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+
+        self.record_dtype = np.dtype([("key", "S32"), ("vector", "<f4", (dimension,))])
+        self.disk_path = None
+        self.disk_rows: Dict[bytes, int] = {}
+        self._disk_map = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+            self.disk_path = os.path.join(cache_dir, f"{safe_name}-{dimension}.f32")
+            self._open_disk()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode()).digest()
+
+    def _open_disk(self) -> None:
+        if not os.path.exists(self.disk_path):
+            open(self.disk_path, "wb").close()
+        # Exclusive against other processes' appends, which hold the lock shared
+        with file_lock(f"{self.disk_path}.lock"):
+            size = os.path.getsize(self.disk_path)
+            # Drop a torn trailing record left by a crash mid-append
+            usable = size - size % self.record_dtype.itemsize
+            if usable != size:
+                with open(self.disk_path, "r+b") as f:
+                    f.truncate(usable)
+        self._remap()
+        if self._disk_map is not None:
+            self.disk_rows = {bytes(k): row for row, k in enumerate(self._disk_map["key"])}
+        logger.info(f"Embedding cache opened with {len(self.disk_rows)} records on disk")
+
+    def _remap(self) -> None:
+        if os.path.getsize(self.disk_path) == 0:
+            self._disk_map = None
+        else:
+            self._disk_map = np.memmap(self.disk_path, dtype=self.record_dtype, mode="r")
+
+    def _read_disk(self, key: bytes) -> Optional[np.ndarray]:
+        row = self.disk_rows.get(key)
+        if row is None:
+            return None
+        if self._disk_map is None or row >= len(self._disk_map):
+            self._remap()
+        return np.array(self._disk_map[row]["vector"])
+
+    def _write_disk(self, key: bytes, vector: np.ndarray) -> None:
+        record = np.zeros(1, dtype=self.record_dtype)
+        record["key"] = key
+        record["vector"] = vector
+        with file_lock(f"{self.disk_path}.lock", shared=True), open(self.disk_path, "ab") as f:
+            f.write(record.tobytes())
+            f.flush()
+            # Other processes may append to the same file, so our row is wherever our write landed
+            row = f.tell() // self.record_dtype.itemsize - 1
+        self.disk_rows[key] = row
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        self.entries[key] = vector
+        self.current_bytes += vector.nbytes + ENTRY_OVERHEAD_BYTES
+        while self.current_bytes > self.max_bytes and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes + ENTRY_OVERHEAD_BYTES
+            self.evictions += 1
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        vector = self.entries.get(key)
+        if vector is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return vector
+        if self.disk_path:
+            vector = self._read_disk(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._remember(key, vector)
+                return vector
+        self.misses += 1
+        return None
+
+    def put(self, text: str, vector: np.ndarray) -> None:
+        key = self.key(text)
+        vector = np.asarray(vector, dtype="float32")
+        self._remember(key, vector)
+        if self.disk_path and key not in self.disk_rows:
+            try:
+                self._write_disk(key, vector)
+            except OSError as e:
+                logger.error(f"Error writing embedding cache: {str(e)}")
+
+    async def get_many(self, texts: List[str], embed: Callable[[List[str]], Awaitable[np.ndarray]]) -> np.ndarray:
+        """Return embeddings for texts, calling embed() only for uncached ones.
+
+        Identical texts - within the batch or already being embedded by a
+        concurrent caller - share a single upstream computation.
+        """
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        waiting: Dict[int, asyncio.Future] = {}
+        owned: Dict[bytes, List[int]] = {}
+        loop = asyncio.get_running_loop()
+
+        for i, text in enumerate(texts):
+            key = self.key(text)
+            if key in owned:
+                owned[key].append(i)
+                continue
+            if key in self._inflight:
+                waiting[i] = self._inflight[key]
+                continue
+            vector = self.get(text)
+            if vector is not None:
+                results[i] = vector
+            else:
+                owned[key] = [i]
+                self._inflight[key] = loop.create_future()
+
+        if owned:
+            miss_texts = [texts[indices[0]] for indices in owned.values()]
+            try:
+                vectors = await embed(miss_texts)
+                if len(vectors) != len(miss_texts):
+                    raise ValueError(f"Expected {len(miss_texts)} embeddings, got {len(vectors)}")
+                for (key, indices), text, vector in zip(owned.items(), miss_texts, vectors):
+                    self.put(text, vector)
+                    self._inflight.pop(key).set_result(vector)
+                    for i in indices:
+                        results[i] = vector
+            except BaseException as e:
+                # Including cancellation (a stage timeout): every future this call still owns
+                # must be settled and dropped, or later lookups of its text wait forever
+                error = EmbeddingAbandoned() if isinstance(e, asyncio.CancelledError) else e
+                for key in owned:
+                    future = self._inflight.pop(key, None)
+                    if future is not None and not future.done():
+                        future.set_exception(error)
+                        # Mark retrieved so waiter-less futures don't log "exception never retrieved"
+                        future.exception()
+                raise
+
+        for i, future in waiting.items():
+            try:
+                # Shielded: a waiter being cancelled must not cancel the owner's future
+                results[i] = await asyncio.shield(future)
+            except EmbeddingAbandoned:
+                # Its owner was cancelled before embedding it; do it ourselves
+                results[i] = (await self.get_many([texts[i]], embed))[0]
+
+        return np.vstack(results)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.current_bytes,
+            "disk_records": len(self.disk_rows),
+        }
+
+
+def create_embedding_cache(model_name: str, dimension: int) -> EmbeddingCache:
+    """Build the cache configured by EMBEDDING_CACHE_BYTES / EMBEDDING_CACHE_DIR"""
+    return EmbeddingCache(
+        model_name=model_name,
+        dimension=dimension,
+        max_bytes=int(os.getenv("EMBEDDING_CACHE_BYTES", str(32 * 1024 * 1024))),
+        cache_dir=os.getenv("EMBEDDING_CACHE_DIR") or None,
+    )
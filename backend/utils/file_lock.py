@@ -0,0 +1,48 @@
+import logging
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so stores are only safe within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """Hold an advisory flock on path (created if missing) for the with block.
+
+    Locks are per open file, so they exclude other processes and other
+    threads of this one alike. Without fcntl this is a no-op.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def try_lock(path: str) -> Optional[IO]:
+    """Take an exclusive flock on path without waiting, held until the returned file is closed.
+
+    None if another open file holds it (or path's directory is gone).
+    Without fcntl the lock always succeeds.
+    """
+    try:
+        f = open(path, "a")
+    except OSError:
+        return None
+    if fcntl is None:
+        return f
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
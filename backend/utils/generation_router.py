@@ -0,0 +1,473 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from utils.admission import BACKGROUND, Overloaded, current_caller
+from utils.inference_client import AsyncInferenceClient, upstream_name
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GENERATION_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.3"
+
+# Latency samples an endpoint needs before its percentile is trusted as a hedge delay
+HEDGE_MIN_SAMPLES = 20
+
+GENERATION_ATTEMPTS = REGISTRY.counter(
+    "generation_attempts_total", "Generation attempts per endpoint by outcome", ["endpoint", "outcome"]
+)
+GENERATION_HEDGES = REGISTRY.counter(
+    "generation_hedges_total", "Hedged duplicate generations by which copy answered first", ["winner"]
+)
+BREAKER_OPEN = REGISTRY.gauge(
+    "generation_breaker_open", "1 while a generation endpoint's circuit breaker is open", ["endpoint"]
+)
+
+
+class GenerationError(Exception):
+    """No endpoint produced a generation; status_code is what the API should answer with"""
+
+    def __init__(self, message: str, status_code: int = 502, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops sending to an endpoint after consecutive failures, then lets one probe through per cooldown"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def available(self, now: float) -> bool:
+        """Whether allow() would let a call through, without taking the probe"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return now >= self.opened_at + self.cooldown
+        return not self.probing
+
+    def allow(self, now: float) -> bool:
+        if not self.available(now):
+            return False
+        if self.state != self.CLOSED:
+            self.state = self.HALF_OPEN
+            self.probing = True
+        return True
+
+    def retry_after(self, now: float) -> float:
+        return max(0.0, self.opened_at + self.cooldown - now) if self.state == self.OPEN else 0.0
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self, now: float) -> bool:
+        """Count a failure; True if it opened the breaker"""
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = now
+            return True
+        return False
+
+    def release(self) -> None:
+        """The call allow() let through ended without a verdict (cancelled or refused locally)"""
+        self.probing = False
+
+
+class GenerationEndpoint:
+    """A Hugging Face text-generation endpoint, and its health as seen by the router"""
+
+    protocol = "hf"
+
+    def __init__(self, url: str, model: Optional[str] = None, fallback: bool = False,
+                 failure_threshold: int = 3, cooldown: float = 30, window: int = 200):
+        self.url = url
+        self.model = model
+        self.fallback = fallback
+        self.name = self._name()
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        # Successful attempt latencies: whole replies, and first tokens of streams
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.first_token_latencies: Deque[float] = deque(maxlen=window)
+        self.latency_ewma: Optional[float] = None
+        self.success_ewma = 1.0
+        self.attempts = 0
+        self.failures = 0
+
+    def _name(self) -> str:
+        return upstream_name(self.url)
+
+    def payload(self, prompt: str, parameters: Dict) -> Dict:
+        return {"inputs": prompt, "parameters": parameters}
+
+    def parse(self, data: Any) -> str:
+        return data[0]["generated_text"]
+
+    def event_text(self, event: Dict) -> Optional[str]:
+        token = event.get("token") or {}
+        if token.get("special"):
+            return None
+        return token.get("text", "")
+
+    def cost(self) -> float:
+        """Health score as expected seconds per successful reply; unmeasured endpoints go first"""
+        if self.latency_ewma is None:
+            return 0.0
+        return self.latency_ewma / max(self.success_ewma, 0.05)
+
+    def percentile(self, q: float, streaming: bool) -> Optional[float]:
+        samples = self.first_token_latencies if streaming else self.latencies
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def record_success(self, seconds: float, streaming: bool) -> None:
+        self.attempts += 1
+        (self.first_token_latencies if streaming else self.latencies).append(seconds)
+        if not streaming:
+            self.latency_ewma = seconds if self.latency_ewma is None else 0.9 * self.latency_ewma + 0.1 * seconds
+        self.success_ewma = 0.9 * self.success_ewma + 0.1
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            logger.info(f"Generation endpoint {self.name} recovered")
+        self.breaker.record_success()
+
+    def record_failure(self, now: float) -> None:
+        self.attempts += 1
+        self.failures += 1
+        self.success_ewma *= 0.9
+        if self.breaker.record_failure(now):
+            logger.warning(f"Generation endpoint {self.name} failing, circuit open for {self.breaker.cooldown:.0f}s")
+
+    def stats(self) -> Dict:
+        p95 = self.percentile(0.95, streaming=False)
+        return {
+            "url": self.url,
+            "protocol": self.protocol,
+            "fallback": self.fallback,
+            "breaker": self.breaker.state,
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "success_rate": round(self.success_ewma, 3),
+            "latency_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class CompletionsEndpoint(GenerationEndpoint):
+    """An OpenAI-compatible /v1/completions endpoint, as served by llama.cpp's server, Ollama or vLLM"""
+
+    protocol = "openai"
+
+    def _name(self) -> str:
+        return self.model or urlsplit(self.url).netloc
+
+    def payload(self, prompt: str, parameters: Dict) -> Dict:
+        payload = {key: value for key, value in parameters.items() if key != "max_new_tokens"}
+        payload.update(prompt=prompt, max_tokens=parameters.get("max_new_tokens"))
+        if self.model:
+            payload["model"] = self.model
+        return payload
+
+    def parse(self, data: Any) -> str:
+        return data["choices"][0]["text"]
+
+    def event_text(self, event: Dict) -> Optional[str]:
+        choices = event.get("choices") or [{}]
+        return choices[0].get("text", "")
+
+
+PROTOCOLS = {endpoint.protocol: endpoint for endpoint in (GenerationEndpoint, CompletionsEndpoint)}
+
+
+def parse_endpoints(spec: str, fallback: bool = False, **options) -> List[GenerationEndpoint]:
+    """Endpoints from a comma-separated list of [protocol+]url[#model] entries.
+
+    The protocol is hf (the default) or openai, e.g.
+    "openai+http://localhost:11434/v1/completions#mistral" for a local Ollama.
+    """
+    endpoints = []
+    for entry in filter(None, (entry.strip() for entry in spec.split(","))):
+        protocol, _, url = entry.partition("+")
+        if protocol not in PROTOCOLS or not url:
+            protocol, url = "hf", entry
+        url, _, model = url.partition("#")
+        endpoints.append(PROTOCOLS[protocol](url, model=model or None, fallback=fallback, **options))
+    return endpoints
+
+
+class GenerationRouter:
+    """Routes text generation across model endpoints with hedging and failover.
+
+    Primaries are tried in order of health (expected seconds per successful
+    reply). A primary that is slower than its own p95 (or the configured
+    percentile) gets a hedged duplicate sent to the next primary, or to
+    itself when it is the only one, and whichever answers first wins; the
+    other is cancelled. A failed attempt fails over to the next endpoint.
+    Each endpoint has a circuit breaker, and the fallback endpoints are only
+    used once every primary is open or has failed for the request. Hedges
+    are capped at a fraction of requests so a slow upstream doesn't get
+    twice the load, and background work is never hedged.
+    """
+
+    def __init__(self, client: Optional[AsyncInferenceClient] = None,
+                 endpoints: Optional[List[GenerationEndpoint]] = None,
+                 fallbacks: Optional[List[GenerationEndpoint]] = None,
+                 timeout: Optional[float] = None, attempt_timeout: Optional[float] = None,
+                 hedge: Optional[bool] = None, hedge_percentile: Optional[float] = None,
+                 hedge_min_delay_ms: Optional[float] = None, hedge_budget: Optional[float] = None):
+        self.client = client or AsyncInferenceClient()
+        options = {
+            "failure_threshold": int(os.getenv("GENERATION_BREAKER_FAILURES", "3")),
+            "cooldown": float(os.getenv("GENERATION_BREAKER_COOLDOWN", "30")),
+        }
+        self.endpoints = endpoints if endpoints is not None else parse_endpoints(
+            os.getenv("GENERATION_ENDPOINTS") or os.getenv("HUGGINGFACE_API_URL", DEFAULT_GENERATION_URL), **options
+        )
+        self.fallbacks = fallbacks if fallbacks is not None else parse_endpoints(
+            os.getenv("GENERATION_FALLBACK", ""), fallback=True, **options
+        )
+        if not self.endpoints:
+            raise ValueError("GENERATION_ENDPOINTS has no endpoints")
+        # Whole request, and one endpoint's attempt (for streams: until the first token)
+        self.timeout = timeout if timeout is not None else float(os.getenv("GENERATION_TIMEOUT", "30"))
+        self.attempt_timeout = (attempt_timeout if attempt_timeout is not None
+                                else float(os.getenv("GENERATION_ATTEMPT_TIMEOUT", "20")))
+        self.hedge = hedge if hedge is not None else os.getenv("GENERATION_HEDGE", "true").lower() == "true"
+        self.hedge_percentile = (hedge_percentile if hedge_percentile is not None
+                                 else float(os.getenv("GENERATION_HEDGE_PERCENTILE", "95"))) / 100
+        self.hedge_min_delay = (hedge_min_delay_ms if hedge_min_delay_ms is not None
+                                else float(os.getenv("GENERATION_HEDGE_MIN_DELAY_MS", "50"))) / 1000
+        # At most this fraction of requests get a hedge
+        self.hedge_budget = hedge_budget if hedge_budget is not None else float(os.getenv("GENERATION_HEDGE_BUDGET", "0.1"))
+        self.requests = 0
+        # Upstream attempts started, hedges and failovers included
+        self.attempts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failed = 0
+
+    def _ranked(self, now: float) -> List[GenerationEndpoint]:
+        """Available primaries by health (ties in configured order), then available fallbacks"""
+        primaries = sorted((e for e in self.endpoints if e.breaker.available(now)), key=GenerationEndpoint.cost)
+        return primaries + [e for e in self.fallbacks if e.breaker.available(now)]
+
+    def primary_upstream(self) -> Optional[str]:
+        """Admission-control name of the endpoint the next generation will most likely use"""
+        ranked = self._ranked(time.monotonic())
+        return ranked[0].name if ranked else None
+
+    async def generate(self, prompt: str, parameters: Dict) -> str:
+        """The reply to prompt from the first endpoint that answers, or GenerationError/Overloaded"""
+        async def call(endpoint):
+            data = await self.client.post_json(endpoint.url, endpoint.payload(prompt, parameters),
+                                               upstream=endpoint.name)
+            return endpoint.parse(data)
+
+        _, text = await self._race(call, streaming=False)
+        return text
+
+    async def stream(self, prompt: str, parameters: Dict) -> AsyncIterator[str]:
+        """Yield text chunks of the reply; hedging and failover apply until the first token"""
+        async def call(endpoint):
+            chunks = self._texts(endpoint, prompt, parameters)
+            try:
+                return await chunks.__anext__(), chunks
+            except StopAsyncIteration:
+                return "", None
+            except BaseException:
+                await chunks.aclose()
+                raise
+
+        async def discard(result):
+            _, chunks = result
+            if chunks is not None:
+                await chunks.aclose()
+
+        endpoint, (first, chunks) = await self._race(call, streaming=True, discard=discard)
+        if first:
+            yield first
+        if chunks is None:
+            return
+        try:
+            async for text in chunks:
+                yield text
+        except Overloaded:
+            raise
+        except Exception as e:
+            # Too late to fail over without repeating text the client already has
+            endpoint.record_failure(time.monotonic())
+            GENERATION_ATTEMPTS.inc(endpoint=endpoint.name, outcome="error")
+            raise GenerationError(f"Stream from {endpoint.name} broke off: {str(e)}") from e
+        finally:
+            await chunks.aclose()
+
+    async def _texts(self, endpoint: GenerationEndpoint, prompt: str, parameters: Dict) -> AsyncIterator[str]:
+        events = self.client.stream_json(endpoint.url, endpoint.payload(prompt, parameters), upstream=endpoint.name)
+        try:
+            async for event in events:
+                text = endpoint.event_text(event)
+                if text:
+                    yield text
+        finally:
+            # Closing this generator must close the upstream stream too, releasing its admission slot
+            await events.aclose()
+
+    async def _attempt(self, endpoint: GenerationEndpoint, call: Callable, streaming: bool):
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(call(endpoint), self.attempt_timeout)
+        except asyncio.CancelledError:
+            endpoint.breaker.release()
+            GENERATION_ATTEMPTS.inc(endpoint=endpoint.name, outcome="cancelled")
+            raise
+        except Overloaded:
+            # Refused by our own admission control: says nothing about the endpoint
+            endpoint.breaker.release()
+            GENERATION_ATTEMPTS.inc(endpoint=endpoint.name, outcome="overloaded")
+            raise
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            logger.warning(f"Generation attempt on {endpoint.name} "
+                           f"{'timed out' if timed_out else 'failed'}: {str(e) or type(e).__name__}")
+            endpoint.record_failure(time.monotonic())
+            GENERATION_ATTEMPTS.inc(endpoint=endpoint.name, outcome="timeout" if timed_out else "error")
+            raise
+        endpoint.record_success(time.monotonic() - started, streaming)
+        GENERATION_ATTEMPTS.inc(endpoint=endpoint.name, outcome="ok")
+        return result
+
+    def _hedge_at(self, lead: GenerationEndpoint, started: float, streaming: bool) -> Optional[float]:
+        if not self.hedge or lead.fallback or current_caller().priority == BACKGROUND:
+            return None
+        delay = lead.percentile(self.hedge_percentile, streaming)
+        if delay is None:
+            return None
+        return started + max(self.hedge_min_delay, delay)
+
+    async def _race(self, call: Callable, streaming: bool,
+                    discard: Optional[Callable] = None) -> Tuple[GenerationEndpoint, Any]:
+        """The first successful call(endpoint) and its endpoint.
+
+        discard(result) is awaited for any other attempt that also succeeded,
+        e.g. a hedge that finished alongside the winner, to release it.
+        """
+        self.requests += 1
+        now = time.monotonic()
+        deadline = now + self.timeout
+        queue = self._ranked(now)
+        if not queue:
+            self.failed += 1
+            retry_after = min(e.breaker.retry_after(now) for e in self.endpoints + self.fallbacks)
+            raise GenerationError("Every generation endpoint is unavailable", 503, retry_after=retry_after)
+
+        running: Dict[asyncio.Task, GenerationEndpoint] = {}
+        errors: List[Exception] = []
+        hedge_task: Optional[asyncio.Task] = None
+        hedge_at: Optional[float] = None
+
+        def launch(endpoint: GenerationEndpoint) -> Optional[asyncio.Task]:
+            if not endpoint.breaker.allow(time.monotonic()):
+                # Another request holds its half-open probe
+                return None
+            self.attempts += 1
+            task = asyncio.ensure_future(self._attempt(endpoint, call, streaming))
+            running[task] = endpoint
+            return task
+
+        def launch_next() -> Optional[GenerationEndpoint]:
+            while queue:
+                endpoint = queue.pop(0)
+                if launch(endpoint) is not None:
+                    return endpoint
+            return None
+
+        try:
+            lead = launch_next()
+            if lead is not None:
+                hedge_at = self._hedge_at(lead, time.monotonic(), streaming)
+            while running:
+                wait = deadline - time.monotonic()
+                if hedge_at is not None:
+                    wait = min(wait, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(running, timeout=max(0.0, wait), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if time.monotonic() >= deadline:
+                        self.failed += 1
+                        raise GenerationError(f"No reply within {self.timeout:.0f}s", 504)
+                    hedge_at = None
+                    if self.hedges < self.hedge_budget * self.requests:
+                        hedge_task = self._launch_hedge(queue, running, launch)
+                    continue
+                for task in done:
+                    endpoint = running.pop(task)
+                    if task.exception() is None:
+                        if hedge_task is not None:
+                            won = task is hedge_task
+                            self.hedge_wins += won
+                            GENERATION_HEDGES.inc(winner="hedge" if won else "primary")
+                        return endpoint, task.result()
+                    errors.append(task.exception())
+                if not running:
+                    lead = launch_next()
+                    if lead is not None and hedge_task is None:
+                        hedge_at = self._hedge_at(lead, time.monotonic(), streaming)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                results = await asyncio.gather(*running, return_exceptions=True)
+                if discard is not None:
+                    # Losers that finished alongside the winner (a stream holds its admission slot until closed)
+                    for result in results:
+                        if not isinstance(result, BaseException):
+                            await discard(result)
+
+        self.failed += 1
+        if errors and all(isinstance(error, Overloaded) for error in errors):
+            raise errors[0]
+        if not errors:
+            raise GenerationError("Every generation endpoint is busy probing, try again", 503, retry_after=1.0)
+        if all(isinstance(error, asyncio.TimeoutError) for error in errors):
+            raise GenerationError(f"Generation timed out on {len(errors)} endpoint(s)", 504)
+        raise GenerationError(f"Generation failed on {len(errors)} endpoint(s): {str(errors[-1])}")
+
+    def _launch_hedge(self, queue: List[GenerationEndpoint], running: Dict[asyncio.Task, GenerationEndpoint],
+                      launch: Callable) -> Optional[asyncio.Task]:
+        # The next primary, else another copy on the (only) primary that's running
+        candidates = [e for e in queue if not e.fallback] or [e for e in running.values() if not e.fallback]
+        for endpoint in candidates:
+            task = launch(endpoint)
+            if task is not None:
+                if endpoint in queue:
+                    queue.remove(endpoint)
+                self.hedges += 1
+                return task
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "attempts": self.attempts,
+            "failed": self.failed,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": {endpoint.name: endpoint.stats() for endpoint in self.endpoints + self.fallbacks},
+        }
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from utils.admission import AdmissionController
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 503}
+
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Upstream inference request duration per attempt", ["upstream"]
+)
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    "upstream_responses_total", "Upstream inference responses by status code", ["upstream", "status"]
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "upstream_retries_total", "Upstream inference attempts retried after a 429/503", ["upstream", "status"]
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "upstream_errors_total", "Upstream inference calls that failed for good", ["upstream", "reason"]
+)
+
+
+def upstream_name(url: str) -> str:
+    """Metric label for an endpoint: the model name at the end of its URL"""
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+
+class UpstreamError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AsyncInferenceClient:
+    """Shared, connection-pooled client for the Hugging Face inference endpoints"""
+
+    def __init__(self, token: Optional[str] = None):
+        self.headers = {"Authorization": f"Bearer {token or os.getenv('HF_TOKEN')}"}
+        self.timeout = httpx.Timeout(
+            float(os.getenv("INFERENCE_READ_TIMEOUT", "30")),
+            connect=float(os.getenv("INFERENCE_CONNECT_TIMEOUT", "5")),
+        )
+        self.max_concurrency = int(os.getenv("INFERENCE_MAX_CONCURRENCY", "16"))
+        self.max_retries = int(os.getenv("INFERENCE_MAX_RETRIES", "3"))
+        self.backoff_base = float(os.getenv("INFERENCE_BACKOFF_BASE", "0.25"))
+        self.backoff_max = float(os.getenv("INFERENCE_BACKOFF_MAX", "4"))
+        self._client: Optional[httpx.AsyncClient] = None
+        # Rate limits, plus max_concurrency slots per upstream model so a slow model can't starve the others
+        self.admission = AdmissionController(max_concurrency=self.max_concurrency)
+
+    async def start(self) -> None:
+        """Open the pooled HTTP client (called once at app startup)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency * 4,
+                    max_keepalive_connections=self.max_concurrency * 2,
+                ),
+            )
+            logger.info("Inference client started")
+
+    async def close(self) -> None:
+        """Close the pooled HTTP client (called once at app shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("Inference client closed")
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter: uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def post_json(self, url: str, payload: Dict, upstream: Optional[str] = None) -> Any:
+        """POST a JSON payload to an upstream, retrying 429/503 with jittered backoff.
+
+        upstream names the endpoint for metrics and admission control
+        (default: the model name at the end of the URL). Raises Overloaded if
+        admission control refuses the call.
+        """
+        if self._client is None:
+            await self.start()
+
+        upstream = upstream or upstream_name(url)
+        self.admission.admit(upstream)
+        for attempt in range(self.max_retries + 1):
+            async with self.admission.slot(upstream):
+                start = time.perf_counter()
+                try:
+                    response = await self._client.post(url, json=payload)
+                except httpx.HTTPError as e:
+                    UPSTREAM_ERRORS.inc(upstream=upstream, reason=type(e).__name__)
+                    raise UpstreamError(f"Request to {url} failed: {e}") from e
+                finally:
+                    UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=upstream)
+            UPSTREAM_RESPONSES.inc(upstream=upstream, status=response.status_code)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                logger.warning(f"Upstream {url} returned {response.status_code}, retrying in {delay:.2f}s")
+                UPSTREAM_RETRIES.inc(upstream=upstream, status=response.status_code)
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code != 200:
+                UPSTREAM_ERRORS.inc(upstream=upstream, reason=str(response.status_code))
+                raise UpstreamError(
+                    f"Upstream {url} returned {response.status_code}",
+                    status_code=response.status_code,
+                )
+            return response.json()
+
+    async def stream_json(self, url: str, payload: Dict, upstream: Optional[str] = None) -> AsyncIterator[Dict]:
+        """POST with streaming enabled and yield each server-sent event as JSON.
+
+        Retries on 429/503 only happen before the first event is received.
+        Raises Overloaded if admission control refuses the call.
+        """
+        if self._client is None:
+            await self.start()
+
+        upstream = upstream or upstream_name(url)
+        self.admission.admit(upstream)
+        for attempt in range(self.max_retries + 1):
+            async with self.admission.slot(upstream):
+                start = time.perf_counter()
+                try:
+                    async with self._client.stream("POST", url, json={**payload, "stream": True}) as response:
+                        UPSTREAM_RESPONSES.inc(upstream=upstream, status=response.status_code)
+                        if response.status_code == 200:
+                            async for line in response.aiter_lines():
+                                if line.startswith("data:"):
+                                    data = line[len("data:"):].strip()
+                                    if data and data != "[DONE]":
+                                        yield json.loads(data)
+                            return
+                        retry_after = response.headers.get("Retry-After")
+                        status_code = response.status_code
+                except httpx.HTTPError as e:
+                    UPSTREAM_ERRORS.inc(upstream=upstream, reason=type(e).__name__)
+                    raise UpstreamError(f"Stream from {url} failed: {e}") from e
+                finally:
+                    UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=upstream)
+
+            if status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff(attempt, retry_after)
+                logger.warning(f"Upstream {url} returned {status_code}, retrying in {delay:.2f}s")
+                UPSTREAM_RETRIES.inc(upstream=upstream, status=status_code)
+                await asyncio.sleep(delay)
+                continue
+
+            UPSTREAM_ERRORS.inc(upstream=upstream, reason=str(status_code))
+            raise UpstreamError(f"Upstream {url} returned {status_code}", status_code=status_code)
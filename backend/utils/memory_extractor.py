@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+# First-person statements of lasting facts: who the user is, what they like, where they live and work,
+# their name, family and favourites (a bare "my", or passing wants and feelings, don't count)
+SELF_DISCLOSURE = re.compile(
+    r"\b(i am|i'm) (a|an|from|allergic|married|single|engaged|divorced|retired|\d+)\b"
+    r"|\bi( have|'ve got) (a|an|two|three|\d+)\b"
+    r"|\bi (really |absolutely )?(like|love|hate|enjoy|prefer|adore)\b"
+    r"|\bi (work|live|study|grew up|was born)\b"
+    r"|\bmy (name|job|birthday|hometown|favou?rite|family|parents|mom|mum|dad|mother|father|sister|brother|"
+    r"wife|husband|partner|boyfriend|girlfriend|son|daughter|kids|children|dog|cat|pet)\b",
+    re.IGNORECASE,
+)
+MIN_FACT_WORDS = 3
+MAX_FACT_WORDS = 40
+
+
+def extract_facts(user_text: str) -> List[str]:
+    """Pick the self-disclosing sentences out of a user message (no model call).
+
+    Facts are stored as what the user said, in the user's words, so the
+    prompt never presents "I love hiking" as the companion's own memory.
+    """
+    facts = []
+    for sentence in SENTENCE_SPLIT.split(user_text or ""):
+        sentence = " ".join(sentence.split())
+        words = len(sentence.split())
+        if sentence.endswith("?") or not MIN_FACT_WORDS <= words <= MAX_FACT_WORDS:
+            continue
+        if SELF_DISCLOSURE.search(sentence):
+            facts.append(f'The user said: "{sentence}"')
+    return facts
+
+
+async def extract_facts_heuristic(user_text: str, bot_text: str) -> List[str]:
+    return extract_facts(user_text)
+
+
+class MemoryExtractionWorker:
+    """Turns finished exchanges into memories in the background.
+
+    submit() never waits: exchanges go on a bounded queue and are dropped
+    (and counted) when it is full, so a slow embedder or disk can't push
+    back on the request path. The worker drains up to `batch_size`
+    exchanges at a time, extracts facts, and adds them per user with one
+    embedding batch, deduplicated against existing memories.
+    """
+
+    def __init__(self, memory_manager, extract: Callable[[str, str], Awaitable[List[str]]] = extract_facts_heuristic,
+                 max_queue: Optional[int] = None, batch_size: Optional[int] = None,
+                 dedupe_threshold: Optional[float] = None, window: int = 1000):
+        self.memory_manager = memory_manager
+        self.extract = extract
+        self.max_queue = max_queue or int(os.getenv("MEMORY_QUEUE_SIZE", "1000"))
+        self.batch_size = batch_size or int(os.getenv("MEMORY_BATCH_SIZE", "32"))
+        self.dedupe_threshold = dedupe_threshold or float(os.getenv("MEMORY_DEDUPE_THRESHOLD", "0.9"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.lags: Deque[float] = deque(maxlen=window)
+        self.submitted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.facts_extracted = 0
+        self.memories_added = 0
+        self.duplicates_skipped = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.create_task(self._run())
+
+    async def close(self, drain_timeout: float = 5.0) -> None:
+        """Give queued exchanges up to drain_timeout seconds, then stop"""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping memory extraction with {self._queue.qsize()} exchanges still queued")
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def submit(self, user_id: str, user_text: str, bot_text: str) -> bool:
+        """Queue an exchange for extraction; False if the queue is full and it was dropped"""
+        self.start()
+        try:
+            self._queue.put_nowait((user_id, user_text, bot_text, time.monotonic()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    async def _collect(self) -> List[Tuple[str, str, str, float]]:
+        batch = [await self._queue.get()]
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _process(self, batch: List[Tuple[str, str, str, float]]) -> None:
+        by_user: Dict[str, List[str]] = {}
+        for user_id, user_text, bot_text, _ in batch:
+            try:
+                facts = await self.extract(user_text, bot_text)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Memory extraction failed: {str(e)}")
+                continue
+            self.facts_extracted += len(facts)
+            by_user.setdefault(user_id, []).extend(facts)
+
+        for user_id, facts in by_user.items():
+            try:
+                added = await self.memory_manager.add_memories(user_id, facts, dedupe_threshold=self.dedupe_threshold)
+                self.memories_added += len(added)
+                self.duplicates_skipped += len(facts) - len(added)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error storing extracted memories for user {user_id}: {str(e)}")
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._process(batch)
+            finally:
+                now = time.monotonic()
+                self.lags.extend(now - queued_at for *_, queued_at in batch)
+                self.processed += len(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def stats(self) -> Dict:
+        lags = sorted(self.lags)
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "facts_extracted": self.facts_extracted,
+            "memories_added": self.memories_added,
+            "duplicates_skipped": self.duplicates_skipped,
+            "failures": self.failures,
+            "lag_p50_ms": round(lags[len(lags) // 2] * 1000, 1) if lags else 0.0,
+            "lag_p95_ms": round(lags[max(0, int(len(lags) * 0.95) - 1)] * 1000, 1) if lags else 0.0,
+            "lag_max_ms": round(lags[-1] * 1000, 1) if lags else 0.0,
+        }
@@ -1,109 +1,233 @@
-import httpx
 import numpy as np
-from typing import List, Dict
-import json
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import contextlib
 import os
-import faiss
+import time
 import logging
+import weakref
+
+from utils.embedding_backends import EmbeddingBackend, create_embedding_backend
+from utils.embedding_cache import EmbeddingCache, create_embedding_cache
+from utils.file_lock import file_lock
+from utils.memory_store import UserMemoryStore, migrate_legacy_json
+from utils.residency import ResidencyManager
+from utils.tiered_index import TieredIndex, normalized_copy
+from utils.shared_memory_index import SharedMemoryIndex
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
 class MemoryManager:
-    def __init__(self, index_dir='memories'):
-        self.api_url = "https://api-inference.huggingface.co/models/sentence-transformers/all-MiniLM-L6-v2"
-        self.headers = {"Authorization": f"Bearer {os.getenv('HF_TOKEN')}"}
-        self.dimension = 384
+    def __init__(self, index_dir='memories', embedding_backend: Optional[EmbeddingBackend] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None):
+        self.embedding_backend = embedding_backend or create_embedding_backend()
+        self.dimension = self.embedding_backend.dimension
+        self.embedding_cache = embedding_cache or create_embedding_cache(
+            self.embedding_backend.model_name, self.dimension
+        )
         self.index_dir = index_dir
-        self.user_indices = {}
-        self.user_memories = {}
+        self.fsync = os.getenv("MEMORY_STORE_FSYNC", "1") == "1"
+        # Resident (index, store) pairs per user, LRU-evicted beyond the budget
+        self.residency = ResidencyManager(
+            max_users=int(os.getenv("MEMORY_MAX_RESIDENT_USERS", "1000")),
+            max_bytes=int(os.getenv("MEMORY_MAX_RESIDENT_BYTES", str(512 * 1024 * 1024))),
+        )
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Serializes each user's store appends and syncs, which run in the executor
+        self._user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
         
         os.makedirs(self.index_dir, exist_ok=True)
 
+        # "per_user": one index + directory per user; "shared": all users in a few sharded indices
+        self.storage_mode = os.getenv("MEMORY_STORAGE_MODE", "per_user")
+        # Several processes (e.g. uvicorn --workers) sharing index_dir: lock appends, re-read others' writes
+        self.process_safe = os.getenv("MEMORY_PROCESS_SAFE", "false").lower() == "true"
+        # How stale a resident user's memories may be before a read checks the disk for other processes' writes
+        self.max_staleness = float(os.getenv("MEMORY_MAX_STALENESS_MS", "1000")) / 1000
+        if self.process_safe and self.storage_mode == "shared":
+            raise ValueError("MEMORY_PROCESS_SAFE requires MEMORY_STORAGE_MODE=per_user")
+        self.shared_index = None
+        if self.storage_mode == "shared":
+            self.shared_index = SharedMemoryIndex(
+                os.path.join(self.index_dir, "shared"),
+                self.dimension,
+                num_shards=int(os.getenv("MEMORY_SHARDS", "16")),
+                fsync=self.fsync,
+            )
+
     async def get_embedding(self, text: str) -> np.ndarray:
-        """Get embeddings from HuggingFace API"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json={"inputs": text}
-                )
-                
-                if response.status_code != 200:
-                    raise Exception("API request failed")
-                    
-                embeddings = response.json()
-                return np.array(embeddings[0])
-        except Exception as e:
-            logger.error(f"Error getting embeddings: {str(e)}")
-            return np.zeros(self.dimension)
+        """Get the L2-normalized embedding for a single text"""
+        return (await self.get_embeddings([text]))[0]
+
+    async def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get L2-normalized embeddings for a batch of texts.
+
+        Cached texts never reach the embedding model. Raises on failure
+        rather than returning zero vectors, which would otherwise be written
+        into the index.
+        """
+        with span("memory.embed"):
+            return await self.embedding_cache.get_many(texts, self.embedding_backend.embed)
 
     async def add_memory(self, user_id: str, memory_text: str) -> None:
         """Add a new memory for a specific user"""
-        if user_id not in self.user_indices:
-            self.user_indices[user_id] = faiss.IndexFlatL2(self.dimension)
-            self.user_memories[user_id] = []
+        await self.add_memories(user_id, [memory_text])
 
-        embedding = await self.get_embedding(memory_text)
-        self.user_indices[user_id].add(np.array([embedding]).astype('float32'))
-        self.user_memories[user_id].append(memory_text)
-        
-        await self.save_memories(user_id)
+    async def add_memories(self, user_id: str, texts: List[str], dedupe_threshold: Optional[float] = None) -> List[str]:
+        """Add several memories for a user with one embedding batch and one store write.
+
+        With a dedupe_threshold, texts whose cosine similarity to an existing
+        memory (or to an earlier text in the same batch) reaches it are
+        skipped. Returns the texts actually added.
+        """
+        if not texts:
+            return []
+        vectors = await self.get_embeddings(texts)
+
+        keep = list(range(len(texts)))
+        if dedupe_threshold is not None:
+            keep = []
+            for i in range(len(texts)):
+                if all(float(vectors[i] @ vectors[j]) < dedupe_threshold for j in keep):
+                    keep.append(i)
+            if self.shared_index is not None:
+                similarities = await self.shared_index.max_similarity(user_id, vectors[keep])
+            else:
+                index, store = await self._resident(user_id)
+                similarities = index.search(vectors[keep], 1)[0][:, 0] if len(store) else np.full(len(keep), -1.0)
+            keep = [i for i, similarity in zip(keep, similarities) if similarity < dedupe_threshold]
+        if not keep:
+            return []
+
+        added = [texts[i] for i in keep]
+        if self.shared_index is not None:
+            await self.shared_index.add_many(user_id, added, vectors[keep])
+            return added
+
+        index, store = await self._resident(user_id)
+        async with self._user_lock(user_id):
+            # Persist first so the index never holds a vector the disk doesn't. The fsyncs (and the
+            # flock when process_safe) would otherwise block the event loop
+            await asyncio.get_running_loop().run_in_executor(None, store.append_many, added, vectors[keep])
+            # Index everything new in the store: ours plus, when process_safe, other processes' records
+            index.add(store.vectors()[index.ntotal:])
+        self.residency.touch(user_id)
+        return added
 
     async def get_relevant_memories(self, user_id: str, query: str, k: int = 3) -> List[str]:
         """Get relevant memories for a specific user"""
-        if user_id not in self.user_indices:
-            await self.load_memories(user_id)
-            
-        index = self.user_indices.get(user_id)
-        memories = self.user_memories.get(user_id, [])
+        if self.shared_index is not None:
+            return await self._get_shared_memories(user_id, query, k)
+
+        try:
+            index, memories = await self._resident(user_id)
+        except Exception:
+            return []
         
-        if not memories or not index:
+        if not memories:
             return []
 
-        query_vector = await self.get_embedding(query)
-        D, I = index.search(np.array([query_vector]).astype('float32'), min(k, len(memories)))
+        try:
+            query_vector = await self.get_embedding(query)
+        except Exception as e:
+            logger.error(f"Error getting embeddings: {str(e)}")
+            return []
+        with span("memory.search"):
+            D, I = index.search(np.array([query_vector]).astype('float32'), min(k, len(memories)))
         
-        return [memories[i] for i in I[0] if i < len(memories)]
+        return [memories[i] for i in I[0] if 0 <= i < len(memories)]
 
-    async def save_memories(self, user_id: str) -> None:
-        """Save user memories to disk"""
-        if user_id not in self.user_indices:
-            return
-
-        file_path = os.path.join(self.index_dir, f'{user_id}.json')
-        
+    async def _get_shared_memories(self, user_id: str, query: str, k: int) -> List[str]:
         try:
-            data = {
-                'memories': self.user_memories[user_id],
-                'index_data': faiss.serialize_index(self.user_indices[user_id]).tobytes().hex()
-            }
-            with open(file_path, 'w') as f:
-                json.dump(data, f)
-            logger.info(f"Saved memories for user {user_id}")
+            query_vector = await self.get_embedding(query)
         except Exception as e:
-            logger.error(f"Error saving memories for user {user_id}: {str(e)}")
+            logger.error(f"Error getting embeddings: {str(e)}")
+            return []
+        with span("memory.search"):
+            return await self.shared_index.search(user_id, query_vector, k)
+
+    def _store_path(self, user_id: str) -> str:
+        return os.path.join(self.index_dir, user_id)
+
+    def _build_index(self, store: UserMemoryStore) -> TieredIndex:
+        return TieredIndex(self.dimension, normalized_copy(store.vectors()), source=store.vectors)
+
+    async def _resident(self, user_id: str) -> Tuple[TieredIndex, UserMemoryStore]:
+        """Return the user's (index, store), loading it from disk if evicted.
+
+        Concurrent misses for the same user share a single load.
+        """
+        while True:
+            entry = self.residency.get(user_id)
+            if entry is not None:
+                if self.process_safe:
+                    await self._sync_if_stale(user_id, *entry)
+                return entry
+            if user_id not in self._loading:
+                self._loading[user_id] = asyncio.ensure_future(self.load_memories(user_id))
+            try:
+                loaded = await asyncio.shield(self._loading[user_id])
+            finally:
+                self._loading.pop(user_id, None)
+            if not loaded:
+                raise RuntimeError(f"Memories for user {user_id} could not be loaded")
+
+    def _user_lock(self, user_id: str) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def _sync_if_stale(self, user_id: str, index: TieredIndex, store: UserMemoryStore) -> None:
+        """Index records other processes appended, checking the disk at most once per max_staleness"""
+        if time.monotonic() - store.synced_at < self.max_staleness:
+            return
+        lock = self._user_lock(user_id)
+        if lock.locked():
+            # An append is in flight and syncs before writing; don't hold the read up behind it
+            return
+        async with lock:
+            if await asyncio.get_running_loop().run_in_executor(None, store.sync):
+                index.add(store.vectors()[index.ntotal:])
+                self.residency.touch(user_id)
+
+    def _open_user(self, user_id: str) -> Tuple[TieredIndex, UserMemoryStore]:
+        store_path = self._store_path(user_id)
+        legacy_path = os.path.join(self.index_dir, f'{user_id}.json')
+        store = None
+        if not os.path.isdir(store_path) and os.path.exists(legacy_path):
+            with file_lock(f"{store_path}.migrate.lock") if self.process_safe else contextlib.nullcontext():
+                # Another process may have migrated it while we waited
+                if not os.path.isdir(store_path) and os.path.exists(legacy_path):
+                    # Errors propagate, so the load fails and the migration is retried next time
+                    store = migrate_legacy_json(legacy_path, store_path, self.dimension,
+                                                process_safe=self.process_safe)
+                    if store is None:
+                        # Unmigratable: set it aside for manual recovery instead of hiding it behind an empty store
+                        os.rename(legacy_path, f"{legacy_path}.failed")
+                        logger.error(f"Moved unmigratable legacy memories for user {user_id} to {legacy_path}.failed")
+        if store is None:
+            store = UserMemoryStore(store_path, self.dimension, fsync=self.fsync, process_safe=self.process_safe)
+        return self._build_index(store), store
 
     async def load_memories(self, user_id: str) -> bool:
-        """Load user memories from disk"""
-        file_path = os.path.join(self.index_dir, f'{user_id}.json')
-        
+        """Load user memories from disk (off the event loop) and make them resident"""
+        start = time.perf_counter()
         try:
-            if os.path.exists(file_path):
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
-                    self.user_memories[user_id] = data['memories']
-                    index_bytes = bytes.fromhex(data['index_data'])
-                    self.user_indices[user_id] = faiss.deserialize_index(index_bytes)
-                logger.info(f"Loaded memories for user {user_id}")
-                return True
-            else:
-                self.user_indices[user_id] = faiss.IndexFlatL2(self.dimension)
-                self.user_memories[user_id] = []
-                logger.info(f"Created new index for user {user_id}")
-                return False
+            with span("memory.load"):
+                index, store = await asyncio.get_running_loop().run_in_executor(None, self._open_user, user_id)
         except Exception as e:
             logger.error(f"Error loading memories for user {user_id}: {str(e)}")
-            self.user_indices[user_id] = faiss.IndexFlatL2(self.dimension)
-            self.user_memories[user_id] = []
             return False
+        self.residency.put(user_id, index, store, load_seconds=time.perf_counter() - start)
+        # Large stores start on the exact tier and upgrade in the background
+        index.schedule_rebuild()
+        logger.info(f"Loaded {len(store)} memories for user {user_id}")
+        return True
+
+    def close(self) -> None:
+        """Flush and release every resident user"""
+        self.residency.close()
+        if self.shared_index is not None:
+            self.shared_index.close()
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from utils.file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+TEXTS_FILE = "texts.log"
+OFFSETS_FILE = "texts.idx"
+LOCK_FILE = "store.lock"
+
+# (offset, length) of each text inside texts.log
+OFFSET_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u8")])
+
+
+def _map(path: str, dtype, shape=None):
+    if os.path.getsize(path) == 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class UserMemoryStore:
+    """Append-only on-disk memories for one user.
+
+    Layout of memories/{user_id}/:
+      vectors.f32  float32 rows of `dimension` values
+      texts.log    UTF-8 memory texts, back to back
+      texts.idx    (offset, length) uint64 pairs into texts.log
+
+    Each append writes the text, then the vector, then the offset entry, so a
+    record only counts once its texts.idx entry is complete. On open, any
+    partial tail left by a crash is truncated away. Nothing is parsed at load
+    time: vectors are memory-mapped on demand, the offset table (16 bytes
+    per memory) is read straight into an array and texts are read by offset
+    when needed. No file handles or maps are held between calls, so
+    thousands of resident stores don't exhaust file descriptors.
+
+    With process_safe, several processes may share the directory: opening
+    and appending hold an exclusive flock on store.lock, and each append
+    first picks up whatever other processes committed. Readers need no
+    lock (a record is complete once its texts.idx entry is); sync() brings
+    this process's view up to date.
+    """
+
+    def __init__(self, path: str, dimension: int, fsync: bool = True, process_safe: bool = False):
+        self.path = path
+        self.dimension = dimension
+        self.fsync = fsync
+        self.process_safe = process_safe
+        self.vector_bytes = dimension * 4
+        os.makedirs(path, exist_ok=True)
+        with self.write_lock():
+            for name in (VECTORS_FILE, TEXTS_FILE, OFFSETS_FILE):
+                file_path = os.path.join(path, name)
+                if not os.path.exists(file_path):
+                    open(file_path, "wb").close()
+            self.count = self._recover()
+            self.texts_size = os.path.getsize(self._file(TEXTS_FILE))
+            self._offsets = np.fromfile(self._file(OFFSETS_FILE), dtype=OFFSET_DTYPE)
+        self.synced_at = time.monotonic()
+        self.dirty = False
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def write_lock(self) -> Iterator[None]:
+        """Exclude other processes' opens and appends (a no-op unless process_safe)"""
+        if not self.process_safe:
+            yield
+            return
+        with file_lock(self._file(LOCK_FILE)):
+            yield
+
+    def _recover(self) -> int:
+        """Truncate the three files back to the last complete record"""
+        offsets_size = os.path.getsize(self._file(OFFSETS_FILE))
+        vectors_size = os.path.getsize(self._file(VECTORS_FILE))
+        texts_size = os.path.getsize(self._file(TEXTS_FILE))
+
+        count = min(offsets_size // OFFSET_DTYPE.itemsize, vectors_size // self.vector_bytes)
+        offsets = _map(self._file(OFFSETS_FILE), OFFSET_DTYPE, (count,)) if count else None
+        while count and int(offsets[count - 1]["offset"] + offsets[count - 1]["length"]) > texts_size:
+            count -= 1
+        texts_end = int(offsets[count - 1]["offset"] + offsets[count - 1]["length"]) if count else 0
+        del offsets
+
+        for name, size in ((OFFSETS_FILE, count * OFFSET_DTYPE.itemsize),
+                           (VECTORS_FILE, count * self.vector_bytes),
+                           (TEXTS_FILE, texts_end)):
+            if os.path.getsize(self._file(name)) != size:
+                logger.warning(f"Truncating torn tail of {self._file(name)}")
+                with open(self._file(name), "r+b") as f:
+                    f.truncate(size)
+        return count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        offset, length = int(self._offsets[i]["offset"]), int(self._offsets[i]["length"])
+        with open(self._file(TEXTS_FILE), "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8")
+
+    def sync(self) -> int:
+        """Pick up records other processes have committed; returns how many"""
+        self.synced_at = time.monotonic()
+        committed = os.path.getsize(self._file(OFFSETS_FILE)) // OFFSET_DTYPE.itemsize
+        if committed <= self.count:
+            return 0
+        with open(self._file(OFFSETS_FILE), "rb") as f:
+            f.seek(self.count * OFFSET_DTYPE.itemsize)
+            entries = np.fromfile(f, dtype=OFFSET_DTYPE, count=committed - self.count)
+        self._extend_offsets(entries)
+        self.texts_size = max(self.texts_size, int(entries[-1]["offset"] + entries[-1]["length"]))
+        return len(entries)
+
+    def _extend_offsets(self, entries: np.ndarray) -> None:
+        needed = self.count + len(entries)
+        if needed > len(self._offsets):
+            # Grow the in-memory offset table geometrically
+            grown = np.zeros(max(16, 2 * self.count, needed), dtype=OFFSET_DTYPE)
+            grown[:self.count] = self._offsets[:self.count]
+            self._offsets = grown
+        self._offsets[self.count:needed] = entries
+        self.count = needed
+
+    def vectors(self) -> np.ndarray:
+        """All stored vectors as a read-only (count, dimension) memmap"""
+        if self.count == 0:
+            return np.zeros((0, self.dimension), dtype="float32")
+        return _map(self._file(VECTORS_FILE), "<f4", (self.count, self.dimension))
+
+    def _append(self, name: str, data: bytes) -> None:
+        with open(self._file(name), "ab") as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def flush(self) -> None:
+        """fsync appends that were left to the OS page cache (fsync=False)"""
+        if not self.dirty:
+            return
+        for name in (TEXTS_FILE, VECTORS_FILE, OFFSETS_FILE):
+            with open(self._file(name), "rb+") as f:
+                os.fsync(f.fileno())
+        self.dirty = False
+
+    def close(self) -> None:
+        """Flush pending appends before the store is dropped"""
+        self.flush()
+
+    def append(self, text: str, vector: np.ndarray) -> None:
+        """Append one memory; O(1) regardless of how many are stored"""
+        self.append_many([text], np.asarray(vector).reshape(1, self.dimension))
+
+    def append_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """Append several memories with one write (and fsync) per file.
+
+        With process_safe, records other processes committed first come
+        before these, so call sync() (or compare len()) to see them.
+        """
+        if not texts:
+            return
+        encoded = [text.encode("utf-8") for text in texts]
+        vectors = np.ascontiguousarray(vectors, dtype="<f4").reshape(len(texts), self.dimension)
+        lengths = np.array([len(e) for e in encoded], dtype="<u8")
+        entries = np.zeros(len(encoded), dtype=OFFSET_DTYPE)
+        entries["length"] = lengths
+
+        with self.write_lock():
+            if self.process_safe:
+                # Drop a torn tail left by a writer that crashed, then catch up on the others' records
+                self._recover()
+                self.sync()
+                self.texts_size = os.path.getsize(self._file(TEXTS_FILE))
+            entries["offset"] = self.texts_size + np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+            try:
+                self._append(TEXTS_FILE, b"".join(encoded))
+                self._append(VECTORS_FILE, vectors.tobytes())
+                # The offset entries commit the records
+                self._append(OFFSETS_FILE, entries.tobytes())
+            except BaseException:
+                # A torn record would shift the offsets of every later append: cut back to the
+                # last committed one (keeping ours if its offsets landed) and resync from disk
+                self._recover()
+                self.sync()
+                self.texts_size = os.path.getsize(self._file(TEXTS_FILE))
+                raise
+
+        self._extend_offsets(entries)
+        self.texts_size += int(lengths.sum())
+        self.dirty = self.dirty or not self.fsync
+
+    @classmethod
+    def write_new(cls, path: str, dimension: int, texts, vectors: np.ndarray, fsync: bool = True,
+                  process_safe: bool = False) -> "UserMemoryStore":
+        """Atomically create a store at path from existing texts and vectors.
+
+        Files are written to a sibling temp directory which is then renamed
+        into place, so readers never see a half-written store.
+        """
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        encoded = [text.encode("utf-8") for text in texts]
+        lengths = np.array([len(e) for e in encoded], dtype="<u8")
+        offsets = np.zeros(len(encoded), dtype=OFFSET_DTYPE)
+        offsets["length"] = lengths
+        offsets["offset"] = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(encoded) else []
+
+        for name, data in ((TEXTS_FILE, b"".join(encoded)),
+                           (VECTORS_FILE, np.ascontiguousarray(vectors, dtype="<f4").tobytes()),
+                           (OFFSETS_FILE, offsets.tobytes())):
+            with open(os.path.join(tmp_path, name), "wb") as f:
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        os.rename(tmp_path, path)
+        return cls(path, dimension, fsync=fsync, process_safe=process_safe)
+
+
+def migrate_legacy_json(json_path: str, store_path: str, dimension: int,
+                        process_safe: bool = False) -> Optional[UserMemoryStore]:
+    """Convert a hex-encoded {user_id}.json file into a UserMemoryStore.
+
+    The legacy file is renamed to *.json.migrated rather than deleted.
+    """
+    import faiss
+
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    index = faiss.deserialize_index(np.frombuffer(bytes.fromhex(data["index_data"]), dtype=np.uint8))
+    memories = data["memories"]
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, dimension), dtype="float32")
+    if len(memories) != len(vectors):
+        logger.error(f"Legacy memory file {json_path} has {len(memories)} texts but {len(vectors)} vectors")
+        return None
+
+    store = UserMemoryStore.write_new(store_path, dimension, memories, vectors, process_safe=process_safe)
+    os.rename(json_path, f"{json_path}.migrated")
+    logger.info(f"Migrated {len(memories)} memories from {json_path}")
+    return store
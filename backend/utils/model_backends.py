@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from typing import Any, List
+
+from utils.micro_batcher import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+# Backoff between attempts to load a local model that failed to load
+LOAD_RETRY_SECONDS = 30
+LOAD_RETRY_MAX_SECONDS = 600
+
+
+class ModelUnavailable(RuntimeError):
+    """The local model failed to load and is not due for another attempt yet"""
+
+
+class LocalModel:
+    """Base for in-process model backends with micro-batched inference.
+
+    The model is loaded once, off the event loop, in start() (or on first
+    use), and concurrent calls share forward passes. Subclasses implement
+    _load_model() and _run_batch(), both run in worker threads.
+
+    A failed load is remembered: calls raise ModelUnavailable straight
+    away and the load is retried with exponential backoff, so a missing
+    package or unreachable model hub doesn't cost every call a load.
+    """
+
+    name = "local"
+    task = "model"
+
+    def __init__(self, model_name: str, max_batch_size: int, max_wait_ms: float):
+        self.model_name = model_name
+        self.model = None
+        self.batcher = MicroBatcher(self._run_batch, max_batch_size=max_batch_size, max_wait=max_wait_ms / 1000)
+        self._load_lock = asyncio.Lock()
+        self._retry_delay = 0.0
+        self._retry_at = 0.0
+
+    def _check_retry(self) -> None:
+        if self.model is None and time.monotonic() < self._retry_at:
+            raise ModelUnavailable(f"Local {self.task} model {self.model_name} is unavailable, "
+                                   f"next load attempt in {self._retry_at - time.monotonic():.0f}s")
+
+    async def start(self) -> None:
+        self._check_retry()
+        async with self._load_lock:
+            if self.model is None:
+                # Callers queued behind a load that just failed don't repeat it
+                self._check_retry()
+                loop = asyncio.get_running_loop()
+                try:
+                    self.model = await loop.run_in_executor(None, self._load_model)
+                except Exception as e:
+                    self._retry_delay = min(2 * self._retry_delay or LOAD_RETRY_SECONDS, LOAD_RETRY_MAX_SECONDS)
+                    self._retry_at = time.monotonic() + self._retry_delay
+                    logger.error(f"Failed to load local {self.task} model {self.model_name}, "
+                                 f"retrying in {self._retry_delay:.0f}s: {str(e)}")
+                    raise
+                self._retry_delay = 0.0
+                self._loaded()
+                logger.info(f"Loaded local {self.task} model {self.model_name}")
+
+    async def close(self) -> None:
+        await self.batcher.close()
+
+    def _load_model(self):
+        raise NotImplementedError
+
+    def _loaded(self) -> None:
+        """Hook to read model properties once it is loaded"""
+
+    def _run_batch(self, inputs: List[Any]) -> List[Any]:
+        raise NotImplementedError
+
+    async def _submit_many(self, inputs: List[Any]) -> List[Any]:
+        if self.model is None:
+            await self.start()
+        return list(await asyncio.gather(*(self.batcher.submit(item) for item in inputs)))
+
+
+class FallbackModel:
+    """Base for backends that use the primary, falling back to the secondary when it fails"""
+
+    task = "model"
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+        self.model_name = primary.model_name
+
+    async def start(self) -> None:
+        try:
+            await self.primary.start()
+        except Exception as e:
+            logger.error(f"Primary {self.task} backend failed to start: {str(e)}")
+        await self.fallback.start()
+
+    async def close(self) -> None:
+        await self.primary.close()
+        await self.fallback.close()
+
+    async def _call(self, method: str, *args):
+        try:
+            return await getattr(self.primary, method)(*args)
+        except ModelUnavailable:
+            # Already logged when the load failed
+            return await getattr(self.fallback, method)(*args)
+        except Exception as e:
+            logger.warning(f"Primary {self.task} backend failed, using fallback: {str(e)}")
+            return await getattr(self.fallback, method)(*args)
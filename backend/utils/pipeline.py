@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict
+
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+_NO_FALLBACK = object()
+
+
+async def run_stage(
+    name: str,
+    awaitable: Awaitable,
+    timeout: float,
+    timings: Dict[str, float],
+    fallback: Any = _NO_FALLBACK,
+) -> Any:
+    """Await one pipeline stage with a timeout, recording its duration and a span.
+
+    If a fallback is given, a late or failing stage degrades to it instead of
+    failing the request; otherwise the error propagates.
+    """
+    start = time.perf_counter()
+    try:
+        with span(name):
+            return await asyncio.wait_for(awaitable, timeout)
+    except Exception as e:
+        if fallback is _NO_FALLBACK:
+            raise
+        if isinstance(e, asyncio.TimeoutError):
+            logger.warning(f"Stage {name} timed out after {timeout}s, using fallback")
+        else:
+            logger.error(f"Stage {name} failed, using fallback: {str(e)}")
+        return fallback
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Format stage timings as a Server-Timing header value (milliseconds)"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+class StageStats:
+    """Rolling window of per-stage latencies for percentile reporting"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.samples: Dict[str, Deque[float]] = {}
+
+    def record(self, timings: Dict[str, float]) -> None:
+        for name, seconds in timings.items():
+            self.samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            stats[name] = {
+                "count": len(ordered),
+                "p50_ms": self._percentile(ordered, 0.50) * 1000,
+                "p95_ms": self._percentile(ordered, 0.95) * 1000,
+                "p99_ms": self._percentile(ordered, 0.99) * 1000,
+            }
+        return stats
+
+    @staticmethod
+    def _percentile(ordered, q: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+from cachetools import TTLCache
+from pymongo import ASCENDING
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PROJECTION = {"_id": 0, "user_id": 1, "relationship_stage": 1, "personality_traits": 1}
+
+
+class ProfileCache:
+    """Read-through cache of the small per-user profile, keyed by email.
+
+    Only the fields the request path needs are fetched. Entries expire after
+    `ttl` seconds (bounding staleness across workers) and are invalidated
+    locally on writes; concurrent misses for the same email share one read.
+    """
+
+    def __init__(self, collection, ttl: float = None, maxsize: int = None):
+        self.collection = collection
+        ttl = ttl if ttl is not None else float(os.getenv("PROFILE_CACHE_TTL", "60"))
+        maxsize = maxsize if maxsize is not None else int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.db_reads = 0
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("email", ASCENDING)])
+
+    async def _fetch(self, email: str) -> Optional[Dict]:
+        task = asyncio.current_task()
+        try:
+            self.db_reads += 1
+            profile = await self.collection.find_one({"email": email}, PROFILE_PROJECTION)
+            # Missing users aren't cached: they may sign in a moment later. A read
+            # that raced with invalidate() may be stale, so it isn't cached either.
+            if profile is not None and self._inflight.get(email) is task:
+                self.cache[email] = profile
+            return profile
+        finally:
+            if self._inflight.get(email) is task:
+                del self._inflight[email]
+
+    async def get(self, email: str) -> Optional[Dict]:
+        """The cached profile, or None if there is no such user"""
+        profile = self.cache.get(email)
+        if profile is not None:
+            self.hits += 1
+            return profile
+
+        task = self._inflight.get(email)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(email))
+            self._inflight[email] = task
+        else:
+            self.coalesced += 1
+        # Shielded so a caller's timeout doesn't cancel the read other callers share
+        return await asyncio.shield(task)
+
+    def invalidate(self, email: str) -> None:
+        self.cache.pop(email, None)
+        self._inflight.pop(email, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "db_reads": self.db_reads,
+            "db_reads_per_lookup": round(self.db_reads / lookups, 4) if lookups else 0.0,
+        }
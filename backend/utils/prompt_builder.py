@@ -1,6 +1,21 @@
-from typing import List, Dict
+import os
+from typing import List, Dict, Optional, Tuple
+
+from utils.token_counter import TokenCounter
+from utils.tracing import span
 
 class PromptBuilder:
+    """Builds the system prompt within a token budget.
+
+    The stage/personality sections are rendered and counted once per
+    (stage, traits) combination, so per request only the mood line is
+    formatted (plus the chat's running summary, if any). The budget left
+    after those and the user's message is filled
+    with memories (most relevant first) and recent turns (newest first).
+    Pieces are counted separately, which matches counting the joined prompt
+    to within a token or two per piece.
+    """
+
     RELATIONSHIP_STAGES = {
         "acquaintance": {
             "tone": "friendly but professional",
@@ -16,23 +31,28 @@ class PromptBuilder:
         }
     }
 
-    def build_prompt(self, relationship_stage: str, memories: List[str], sentiment: Dict, personality_traits: List[str]) -> str:
-        stage_info = self.RELATIONSHIP_STAGES.get(relationship_stage, self.RELATIONSHIP_STAGES["acquaintance"])
-        
-        # Clean sentiment values
-        emotion = sentiment.get('dominant', 'NEUTRAL').replace('LABEL_', '')
-        confidence = sentiment.get('confidence', 1.0)
-        
-        # Format memories with better indentation
-        memory_text = "\n".join(f"• {memory}" for memory in memories) if memories else "No previous memories."
-        
-        prompt = f"""You are a caring AI companion speaking in a {stage_info['tone']} manner.
+    NO_MEMORIES = "No previous memories."
+    # Share of the free budget memories may take before recent turns get a turn
+    MEMORY_SHARE = 0.5
+
+    def __init__(self, token_counter: Optional[TokenCounter] = None, token_budget: Optional[int] = None):
+        self.token_counter = token_counter or TokenCounter()
+        self.token_budget = token_budget or int(os.getenv("PROMPT_TOKEN_BUDGET", "1024"))
+        self._sections: Dict[Tuple, Tuple[str, str, int]] = {}
+
+    def _static_sections(self, relationship_stage: str, personality_traits: List[str]) -> Tuple[str, str, int]:
+        # Recounted once the real tokenizer replaces the estimate
+        key = (relationship_stage, tuple(personality_traits), self.token_counter.exact)
+        sections = self._sections.get(key)
+        if sections is None:
+            stage_info = self.RELATIONSHIP_STAGES.get(relationship_stage, self.RELATIONSHIP_STAGES["acquaintance"])
+            head = f"""You are a caring AI companion speaking in a {stage_info['tone']} manner.
 
 Context:
 • Relationship: {relationship_stage}
-• User's Mood: {emotion} ({confidence:.0%} confidence)
-• Previous Interactions:
-{memory_text}
+• Personality: {", ".join(personality_traits)}
+"""
+            tail = f"""
 
 Remember to:
 1. Be natural and engaging
@@ -42,5 +62,61 @@ Remember to:
 5. Stay consistent in personality
 
 Your response should be warm yet appropriate for our current relationship stage."""
+            tokens = self.token_counter.count(head) + self.token_counter.count(tail) + self.token_counter.count(
+                "• Previous Interactions:\n\n\nRecent conversation:\n"
+            )
+            sections = self._sections[key] = (head, tail, tokens)
+        return sections
+
+    def _fit(self, lines: List[str], budget: int, contiguous: bool = False) -> Tuple[List[str], int]:
+        """Take lines in order that fit the budget; returns the kept lines and tokens used.
+
+        With contiguous=True stop at the first line that doesn't fit (so
+        conversation turns never have gaps); otherwise skip it and go on.
+        """
+        kept, used = [], 0
+        for line in lines:
+            tokens = self.token_counter.count(line) + 1  # + the joining newline
+            if used + tokens <= budget:
+                kept.append(line)
+                used += tokens
+            elif contiguous:
+                break
+        return kept, used
+
+    def build_prompt(self, relationship_stage: str, memories: List[str], sentiment: Dict, personality_traits: List[str],
+                     recent_turns: Optional[List[Dict]] = None, message: str = "",
+                     token_budget: Optional[int] = None, summary: Optional[str] = None) -> str:
+        with span("prompt.build"):
+            head, tail, static_tokens = self._static_sections(relationship_stage, personality_traits)
+
+            # Clean sentiment values
+            emotion = sentiment.get('dominant', 'NEUTRAL').replace('LABEL_', '')
+            confidence = sentiment.get('confidence', 1.0)
+            mood = f"• User's Mood: {emotion} ({confidence:.0%} confidence)\n"
+            if summary:
+                mood += f"• Earlier in this chat: {summary}\n"
+
+            free = (token_budget or self.token_budget) - static_tokens - self.token_counter.count(mood) \
+                - self.token_counter.count(f"User: {message}")
+
+            memory_lines = [f"• {memory}" for memory in memories]
+            turn_lines = [
+                f"{'User' if turn['role'] == 'user' else 'You'}: {turn['text']}"
+                for turn in reversed(recent_turns or [])
+            ]
+            memory_budget = int(free * self.MEMORY_SHARE) if turn_lines else free
+            kept_memories, used = self._fit(memory_lines, memory_budget)
+            kept_turns, turn_tokens = self._fit(turn_lines, free - used, contiguous=True)
+            if len(kept_memories) < len(memory_lines):
+                # Recent turns left room over; give it back to the remaining memories
+                leftover = [line for line in memory_lines if line not in kept_memories]
+                kept_memories += self._fit(leftover, free - used - turn_tokens)[0]
+                kept_memories.sort(key=memory_lines.index)
 
-        return prompt
+            # Format memories with better indentation
+            memory_text = "\n".join(kept_memories) if kept_memories else self.NO_MEMORIES
+            prompt = f"{head}{mood}• Previous Interactions:\n{memory_text}"
+            if kept_turns:
+                prompt += "\n\nRecent conversation:\n" + "\n".join(reversed(kept_turns))
+            return prompt + tail
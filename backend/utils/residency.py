@@ -0,0 +1,86 @@
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def index_nbytes(index) -> int:
+    """Approximate resident size of a FAISS index (stored vectors dominate)"""
+    return getattr(index, "nbytes", index.ntotal * index.d * 4)
+
+
+class ResidencyManager:
+    """LRU of per-user (index, store) pairs bounded by user count and bytes.
+
+    Evicted stores are flushed before they are dropped; the caller reloads
+    them lazily from disk on the next access.
+    """
+
+    def __init__(self, max_users: int = 1000, max_bytes: int = 512 * 1024 * 1024):
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[Any, Any]]" = OrderedDict()
+        self.sizes: Dict[str, int] = {}
+        self.resident_bytes = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_latencies = deque(maxlen=1000)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self.entries
+
+    def get(self, user_id: str) -> Optional[Tuple[Any, Any]]:
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            self.entries.move_to_end(user_id)
+        return entry
+
+    def put(self, user_id: str, index, store, load_seconds: Optional[float] = None) -> None:
+        if user_id in self.entries:
+            self.resident_bytes -= self.sizes[user_id]
+        self.entries[user_id] = (index, store)
+        self.entries.move_to_end(user_id)
+        self.sizes[user_id] = index_nbytes(index)
+        self.resident_bytes += self.sizes[user_id]
+        if load_seconds is not None:
+            self.loads += 1
+            self.load_latencies.append(load_seconds)
+        self._enforce(keep=user_id)
+
+    def touch(self, user_id: str) -> None:
+        """Re-account a user's size after their index grew"""
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            self.put(user_id, *entry)
+
+    def _enforce(self, keep: str) -> None:
+        while len(self.entries) > 1 and (len(self.entries) > self.max_users or self.resident_bytes > self.max_bytes):
+            user_id = next(iter(self.entries))
+            if user_id == keep:
+                break
+            self.evict(user_id)
+
+    def evict(self, user_id: str) -> None:
+        index, store = self.entries.pop(user_id)
+        self.resident_bytes -= self.sizes.pop(user_id)
+        try:
+            store.close()
+        except Exception as e:
+            logger.error(f"Error flushing memories for user {user_id}: {str(e)}")
+        self.evictions += 1
+
+    def close(self) -> None:
+        for user_id in list(self.entries):
+            self.evict(user_id)
+
+    def stats(self) -> Dict:
+        latencies = sorted(self.load_latencies)
+        return {
+            "resident_users": len(self.entries),
+            "resident_bytes": self.resident_bytes,
+            "evictions": self.evictions,
+            "loads": self.loads,
+            "load_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            "load_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        }
@@ -0,0 +1,169 @@
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CachedReply:
+    def __init__(self, reply: str, generation_seconds: float):
+        self.replies: List[str] = [reply]
+        self.generation_seconds = generation_seconds
+
+
+class CacheBucket:
+    """The entries of one context key, their vectors kept in one contiguous matrix.
+
+    Row i of `vectors` and `created` belongs to entry `ids[i]`. The arrays
+    grow geometrically, and removing an entry moves the last row into its
+    place, so a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, dimension: int):
+        self.vectors = np.zeros((16, dimension), dtype="float32")
+        self.created = np.zeros(16)
+        self.ids: List[int] = []
+        self.rows: Dict[int, int] = {}
+        self.entries: Dict[int, CachedReply] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, entry_id: int) -> CachedReply:
+        return self.entries[entry_id]
+
+    def add(self, entry_id: int, vector: np.ndarray, entry: CachedReply) -> None:
+        row = len(self.ids)
+        if row == len(self.vectors):
+            self.vectors = np.concatenate((self.vectors, np.zeros_like(self.vectors)))
+            self.created = np.concatenate((self.created, np.zeros_like(self.created)))
+        self.vectors[row] = vector
+        self.created[row] = time.monotonic()
+        self.ids.append(entry_id)
+        self.rows[entry_id] = row
+        self.entries[entry_id] = entry
+
+    def remove(self, entry_id: int) -> None:
+        row = self.rows.pop(entry_id)
+        del self.entries[entry_id]
+        last_id = self.ids.pop()
+        if last_id != entry_id:
+            last = len(self.ids)
+            self.vectors[row] = self.vectors[last]
+            self.created[row] = self.created[last]
+            self.ids[row] = last_id
+            self.rows[last_id] = row
+
+    def expired(self, now: float, ttl: float) -> List[int]:
+        return [self.ids[row] for row in np.flatnonzero(now - self.created[:len(self.ids)] > ttl)]
+
+    def nearest(self, vector: np.ndarray) -> Tuple[int, float]:
+        similarities = self.vectors[:len(self.ids)] @ vector
+        best = int(np.argmax(similarities))
+        return self.ids[best], float(similarities[best])
+
+
+class SemanticResponseCache:
+    """Replies to near-duplicate messages, reused across users with the same persona.
+
+    Entries are grouped by (relationship_stage, traits, dominant sentiment)
+    and matched on the cosine similarity of the message embedding. Each
+    entry collects up to `variants` generated replies before it starts
+    serving them, picked at random, so common greetings don't always get
+    the same answer. Entries expire after `ttl` seconds; beyond
+    `max_entries` the least recently used entry is dropped.
+
+    Only meant for turns with no retrieved memories: those prompts differ
+    only in the message itself.
+    """
+
+    def __init__(self, threshold: float = None, max_entries: int = None, ttl: float = None,
+                 variants: int = None):
+        self.threshold = threshold if threshold is not None else float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+        self.variants = variants if variants is not None else int(os.getenv("RESPONSE_CACHE_VARIANTS", "3"))
+        self.buckets: Dict[Tuple, CacheBucket] = {}
+        self.lru: "OrderedDict[int, Tuple]" = OrderedDict()
+        self._ids = count()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def context_key(relationship_stage: str, personality_traits: List[str], sentiment: Dict) -> Tuple:
+        return relationship_stage, tuple(sorted(personality_traits)), sentiment.get("dominant", "NEUTRAL")
+
+    def _unit(self, vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype="float32").ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _nearest(self, key: Tuple, vector: np.ndarray) -> Optional[int]:
+        bucket = self.buckets.get(key)
+        if not bucket:
+            return None
+        for entry_id in bucket.expired(time.monotonic(), self.ttl):
+            self._remove(entry_id)
+        if not bucket:
+            return None
+        entry_id, similarity = bucket.nearest(vector)
+        return entry_id if similarity >= self.threshold else None
+
+    def _remove(self, entry_id: int) -> None:
+        key = self.lru.pop(entry_id)
+        bucket = self.buckets[key]
+        bucket.remove(entry_id)
+        if not bucket:
+            del self.buckets[key]
+
+    def get(self, key: Tuple, vector: np.ndarray) -> Optional[str]:
+        """A cached reply for a similar message, once that entry's variant pool is full"""
+        entry_id = self._nearest(key, self._unit(vector))
+        if entry_id is None or len(self.buckets[key][entry_id].replies) < self.variants:
+            self.misses += 1
+            return None
+        entry = self.buckets[key][entry_id]
+        self.lru.move_to_end(entry_id)
+        self.hits += 1
+        self.seconds_saved += entry.generation_seconds
+        return random.choice(entry.replies)
+
+    def put(self, key: Tuple, vector: np.ndarray, reply: str, generation_seconds: float) -> None:
+        """Add a freshly generated reply as a new entry or as a variant of a similar one"""
+        if not reply:
+            return
+        vector = self._unit(vector)
+        entry_id = self._nearest(key, vector)
+        if entry_id is not None:
+            entry = self.buckets[key][entry_id]
+            if len(entry.replies) < self.variants and reply not in entry.replies:
+                entry.replies.append(reply)
+                # Running mean of what a generation for this entry costs
+                entry.generation_seconds += (generation_seconds - entry.generation_seconds) / len(entry.replies)
+            self.lru.move_to_end(entry_id)
+            return
+
+        entry_id = next(self._ids)
+        if key not in self.buckets:
+            self.buckets[key] = CacheBucket(len(vector))
+        self.buckets[key].add(entry_id, vector, CachedReply(reply, generation_seconds))
+        self.lru[entry_id] = key
+        while len(self.lru) > self.max_entries:
+            self._remove(next(iter(self.lru)))
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "seconds_saved": round(self.seconds_saved, 3),
+        }
@@ -0,0 +1,98 @@
+from typing import List
+
+RESPONSE_MARKER = "### Response:"
+INSTRUCTIONS_MARKER = "### Instructions:"
+# Speaker labels of the "Recent conversation" transcript in the prompt
+USER_MARKER = "User:"
+ASSISTANT_MARKER = "You:"
+
+_MARKERS = (RESPONSE_MARKER, INSTRUCTIONS_MARKER, USER_MARKER)
+
+
+def clean_response(full_response: str) -> str:
+    """Strip prompt-template artifacts from a complete generation"""
+    full_response = full_response.strip()
+
+    # Extract only the actual response part
+    if RESPONSE_MARKER in full_response:
+        actual_response = full_response.split(RESPONSE_MARKER)[-1].strip()
+    else:
+        actual_response = full_response
+
+    # Stop where the model starts inventing the user's next turn or new instructions
+    actual_response = actual_response.split(USER_MARKER)[0].strip()
+    actual_response = actual_response.split(INSTRUCTIONS_MARKER)[0].strip()
+    if actual_response.startswith(ASSISTANT_MARKER):
+        actual_response = actual_response[len(ASSISTANT_MARKER):].strip()
+
+    return actual_response
+
+
+class StreamingResponseCleaner:
+    """Applies the clean_response rules to a token stream.
+
+    Text that could be the start of a marker is held back until the next
+    token disambiguates it, so artifacts never reach the client.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.emitted: List[str] = []
+        self.done = False
+
+    def feed(self, token: str) -> str:
+        """Add a token; return the text that is now safe to emit"""
+        if self.done:
+            return ""
+        self.pending += token
+
+        # Only pending text can be dropped here; anything already sent before
+        # a late "### Response:" marker stays with the client
+        if RESPONSE_MARKER in self.pending:
+            self.pending = self.pending.split(RESPONSE_MARKER)[-1]
+        for marker in (INSTRUCTIONS_MARKER, USER_MARKER):
+            if marker in self.pending:
+                self.pending = self.pending.split(marker)[0]
+                self.done = True
+        if not self.emitted and self.pending.lstrip().startswith(ASSISTANT_MARKER):
+            self.pending = self.pending.lstrip()[len(ASSISTANT_MARKER):]
+
+        if self.done:
+            ready, self.pending = self.pending, ""
+        elif not self.emitted and ASSISTANT_MARKER.startswith(self.pending.lstrip()):
+            # Could still become a leading "You:" label
+            ready = ""
+        else:
+            hold = self._partial_marker_length(self.pending)
+            ready = self.pending[:len(self.pending) - hold]
+            self.pending = self.pending[len(self.pending) - hold:]
+        return self._emit(ready)
+
+    def finish(self) -> str:
+        """Flush whatever is left once the stream has ended"""
+        ready, self.pending = self.pending, ""
+        self.done = True
+        return self._emit(ready)
+
+    @property
+    def text(self) -> str:
+        """The full cleaned response emitted so far"""
+        return "".join(self.emitted).strip()
+
+    def _emit(self, ready: str) -> str:
+        if not self.emitted:
+            ready = ready.lstrip()
+        if ready:
+            self.emitted.append(ready)
+        return ready
+
+    @staticmethod
+    def _partial_marker_length(text: str) -> int:
+        # Longest suffix of text that is a proper prefix of some marker
+        longest = 0
+        for marker in _MARKERS:
+            for size in range(min(len(marker) - 1, len(text)), longest, -1):
+                if text.endswith(marker[:size]):
+                    longest = size
+                    break
+        return longest
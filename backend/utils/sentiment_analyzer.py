@@ -1,37 +1,138 @@
-import httpx
-from typing import Dict
+import logging
 import os
+import re
+from typing import Dict, Optional
+
+from cachetools import LRUCache
+
+from utils.embedding_cache import normalize_text
+from utils.sentiment_backends import SentimentBackend, create_sentiment_backend
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# twitter-roberta-base-sentiment's labels
+NEGATIVE, NEUTRAL, POSITIVE = "LABEL_0", "LABEL_1", "LABEL_2"
+
+# Words, emoticons like :) or ;-D, and single symbols/emoji
+WORD = re.compile(r"[:;]-?[()dp]|[a-z']+|[^\w\s]", re.IGNORECASE)
+POSITIVE_WORDS = {
+    "hi", "hello", "hey", "hiya", "morning", "thanks", "thank", "thx", "ty", "yay", "yes", "yeah", "yep", "sure",
+    "ok", "okay", "cool", "nice", "great", "awesome", "love", "lovely", "good", "glad", "happy", "haha", "lol",
+    "lmao", "cute", "sweet", "perfect", "amazing", "wonderful", "excited", "fun",
+    "♥", "❤", "😊", "😀", "😁", "😂", "😍", "🥰", "😘", "👍", "🙂", "😄", ":)", ":-)", ";)", ";-)", ":d", ":-d", ";d", ":p",
+}
+NEGATIVE_WORDS = {
+    "sad", "bad", "awful", "terrible", "hate", "angry", "upset", "tired", "lonely", "bored", "ugh", "sorry",
+    "sick", "hurt", "cry", "crying", "worried", "scared", "stressed", "annoyed", "depressed", "miserable",
+    "😢", "😭", "😞", "😔", "😡", "😠", "💔", "👎", "🙁", ":(", ":-(",
+}
+NEUTRAL_WORDS = {"hmm", "hm", "ah", "oh", "k", "kk", "brb", "bye", "gn", "night", "what", "why", "how", "?", ".", "!"}
+# Scores the fast path assigns; deliberately less confident than a model would be
+LEXICON_SCORES = {
+    POSITIVE: {NEGATIVE: 0.05, NEUTRAL: 0.25, POSITIVE: 0.7},
+    NEGATIVE: {NEGATIVE: 0.7, NEUTRAL: 0.25, POSITIVE: 0.05},
+    NEUTRAL: {NEGATIVE: 0.1, NEUTRAL: 0.8, POSITIVE: 0.1},
+}
+
+
+def neutral_sentiment() -> Dict:
+    return {
+        'scores': {'NEUTRAL': 1.0},
+        'dominant': 'NEUTRAL',
+        'confidence': 1.0
+    }
+
+
+def to_sentiment(scores: Dict[str, float]) -> Dict:
+    dominant = max(scores, key=scores.get)
+    return {
+        'scores': dict(scores),
+        'dominant': dominant,
+        'confidence': scores[dominant]
+    }
+
+
+def lexicon_sentiment(text: str, max_words: int) -> Optional[Dict[str, float]]:
+    """Scores for short messages made only of known words ("hi!", "thanks 😊", "ugh"), else None.
+
+    Anything with an unknown word (negations included), mixed polarity or
+    more than max_words tokens goes to the model.
+    """
+    tokens = WORD.findall(text.lower())
+    if len(tokens) > max_words:
+        return None
+    positive = negative = 0
+    for token in tokens:
+        if token in POSITIVE_WORDS:
+            positive += 1
+        elif token in NEGATIVE_WORDS:
+            negative += 1
+        elif token not in NEUTRAL_WORDS:
+            return None
+    if positive and negative:
+        return None
+    label = POSITIVE if positive else NEGATIVE if negative else NEUTRAL
+    return dict(LEXICON_SCORES[label])
+
 
 class SentimentAnalyzer:
-    def __init__(self):
-        self.api_url = "https://api-inference.huggingface.co/models/cardiffnlp/twitter-roberta-base-sentiment"
-        self.headers = {"Authorization": f"Bearer {os.getenv('HF_TOKEN')}"}
+    """Sentiment for a user message as {'scores', 'dominant', 'confidence'}.
+
+    Lookups go through an LRU keyed on the normalized text, then the lexicon
+    fast path for short trivial messages, and only then the model backend
+    (remote over the pooled inference client, or a local micro-batched
+    model). Failures degrade to neutral_sentiment() and are not cached.
+    """
+
+    def __init__(self, backend: Optional[SentimentBackend] = None, cache_size: Optional[int] = None,
+                 fast_path_words: Optional[int] = None):
+        self.backend = backend or create_sentiment_backend()
+        self.cache = LRUCache(maxsize=cache_size or int(os.getenv("SENTIMENT_CACHE_SIZE", "10000")))
+        self.fast_path_words = fast_path_words if fast_path_words is not None else int(
+            os.getenv("SENTIMENT_FAST_PATH_WORDS", "4")
+        )
+        self.hits = 0
+        self.fast_path = 0
+        self.model_calls = 0
+        self.failures = 0
+
+    async def start(self) -> None:
+        await self.backend.start()
+
+    async def close(self) -> None:
+        await self.backend.close()
 
     async def analyze(self, text: str) -> Dict:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json={"inputs": text}
-                )
-                
-                if response.status_code != 200:
-                    raise Exception("API request failed")
-                    
-                results = response.json()[0]
-                sentiment_scores = {item['label']: item['score'] for item in results}
-                dominant = max(results, key=lambda x: x['score'])
-                
-                return {
-                    'scores': sentiment_scores,
-                    'dominant': dominant['label'],
-                    'confidence': dominant['score']
-                }
-        except Exception as e:
-            print(f"Error in sentiment analysis: {str(e)}")
-            return {
-                'scores': {'NEUTRAL': 1.0},
-                'dominant': 'NEUTRAL',
-                'confidence': 1.0
-            }
+        key = normalize_text(text or "")
+        scores = self.cache.get(key)
+        if scores is not None:
+            self.hits += 1
+            return to_sentiment(scores)
+
+        scores = lexicon_sentiment(key, self.fast_path_words) if self.fast_path_words else None
+        if scores is not None:
+            self.fast_path += 1
+        else:
+            self.model_calls += 1
+            try:
+                with span("sentiment.model"):
+                    scores = (await self.backend.classify([key]))[0]
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error in sentiment analysis: {str(e)}")
+                return neutral_sentiment()
+        self.cache[key] = scores
+        return to_sentiment(scores)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.fast_path + self.model_calls
+        return {
+            "backend": self.backend.name,
+            "size": len(self.cache),
+            "hits": self.hits,
+            "fast_path": self.fast_path,
+            "model_calls": self.model_calls,
+            "failures": self.failures,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,91 @@
+import logging
+import os
+from typing import Dict, List, Optional
+
+from utils.inference_client import AsyncInferenceClient
+from utils.model_backends import FallbackModel, LocalModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SENTIMENT_MODEL = "cardiffnlp/twitter-roberta-base-sentiment"
+
+
+class SentimentBackend:
+    """Scores texts as {label: probability}, one dict per text, with the model's labels"""
+
+    name = "base"
+    model_name = DEFAULT_SENTIMENT_MODEL
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def classify(self, texts: List[str]) -> List[Dict[str, float]]:
+        raise NotImplementedError
+
+
+class RemoteSentimentBackend(SentimentBackend):
+    """Hosted text-classification endpoint on the Hugging Face Inference API, over the pooled client"""
+
+    name = "remote"
+
+    def __init__(self, client: Optional[AsyncInferenceClient] = None, api_url: Optional[str] = None):
+        self.api_url = api_url or os.getenv(
+            "SENTIMENT_API_URL",
+            f"https://api-inference.huggingface.co/models/{DEFAULT_SENTIMENT_MODEL}"
+        )
+        self.client = client or AsyncInferenceClient()
+
+    async def classify(self, texts: List[str]) -> List[Dict[str, float]]:
+        results = await self.client.post_json(self.api_url, {"inputs": texts})
+        if len(results) != len(texts):
+            raise ValueError(f"Expected {len(texts)} classifications, got {len(results)}")
+        return [{item["label"]: item["score"] for item in result} for result in results]
+
+
+class LocalSentimentBackend(LocalModel, SentimentBackend):
+    """In-process transformers text-classification model with micro-batched inference.
+
+    Requires the optional transformers (and torch) packages.
+    """
+
+    task = "sentiment"
+
+    def __init__(self, model_name: str = DEFAULT_SENTIMENT_MODEL, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        super().__init__(
+            model_name,
+            max_batch_size=max_batch_size or int(os.getenv("SENTIMENT_MAX_BATCH_SIZE", "32")),
+            max_wait_ms=max_wait_ms or float(os.getenv("SENTIMENT_MAX_WAIT_MS", "5")),
+        )
+
+    def _load_model(self):
+        try:
+            from transformers import pipeline
+        except ImportError as e:
+            raise ImportError("SENTIMENT_BACKEND=local requires the transformers package") from e
+        return pipeline("text-classification", model=self.model_name, device=-1, top_k=None, truncation=True)
+
+    def _run_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        results = self.model(texts, batch_size=len(texts))
+        return [{item["label"]: float(item["score"]) for item in result} for result in results]
+
+    async def classify(self, texts: List[str]) -> List[Dict[str, float]]:
+        return await self._submit_many(texts)
+
+
+class FallbackSentimentBackend(FallbackModel, SentimentBackend):
+    task = "sentiment"
+
+    async def classify(self, texts: List[str]) -> List[Dict[str, float]]:
+        return await self._call("classify", texts)
+
+
+def create_sentiment_backend(client: Optional[AsyncInferenceClient] = None) -> SentimentBackend:
+    """Build the backend selected by SENTIMENT_BACKEND (remote, local)"""
+    remote = RemoteSentimentBackend(client=client)
+    if os.getenv("SENTIMENT_BACKEND", "remote") == "local":
+        return FallbackSentimentBackend(LocalSentimentBackend(), remote)
+    return remote
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import time
+from functools import cached_property
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Built on first use (or by prewarm()); the rest are built in start()
+LAZY_COMPONENTS = ("memory_manager", "memory_worker", "sentiment_analyzer", "prompt_builder", "response_cache")
+
+
+def import_heavy_modules() -> None:
+    import utils.memory_manager
+    import utils.memory_extractor
+    import utils.sentiment_analyzer
+    import utils.response_cache
+
+
+class Services:
+    """The app's long-lived components, owned by the FastAPI lifespan.
+
+    Nothing here connects or loads at import time, so importing main is
+    cheap and needs no configuration. start() opens the MongoDB, Google and
+    inference connections and builds the light components. The heavy ones
+    (the memory manager with faiss/numpy and the embedding backend, the
+    sentiment analyzer and its model, the prompt tokenizer, the response
+    cache) are built on first use, or all up front by prewarm() when
+    PREWARM=true. close() tears down only what was built.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str,
+                 extract_facts: Optional[Callable[[str, str], Awaitable[List[str]]]] = None,
+                 prewarm: Optional[bool] = None):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        # None: the heuristic extractor
+        self.extract_facts = extract_facts
+        self.prewarm_enabled = prewarm if prewarm is not None else os.getenv("PREWARM", "false").lower() == "true"
+        self.started = False
+        self.prewarmed = False
+        self.startup_seconds: Optional[float] = None
+        self.prewarm_seconds: Optional[float] = None
+        self._prewarm_task: Optional[asyncio.Task] = None
+        self._token_counter_load: Optional[asyncio.Future] = None
+
+    def build_database_client(self):
+        connection_string = os.getenv("MONGO_URI")
+        if not connection_string:
+            raise ValueError("MONGO_URI environment variable is not set")
+        import motor.motor_asyncio
+        # Direct connection string with retryWrites and proper timeout settings
+        return motor.motor_asyncio.AsyncIOMotorClient(
+            connection_string,
+            serverSelectionTimeoutMS=5000,  # 5 second timeout
+            connectTimeoutMS=5000,
+            socketTimeoutMS=5000,
+            retryWrites=True,
+            retryReads=True,
+            maxPoolSize=50,
+            minPoolSize=10
+        )
+
+    async def start(self) -> None:
+        from cachetools import TTLCache
+        from utils.auth import GoogleAuth, TokenVerifier
+        from utils.chat_store import ChatStore, SyncNotifier
+        from utils.generation_router import GenerationRouter
+        from utils.inference_client import AsyncInferenceClient
+        from utils.profile_cache import ProfileCache
+
+        started = time.perf_counter()
+        try:
+            self.client = self.build_database_client()
+        except Exception as e:
+            logger.error(f"MongoDB connection error: {str(e)}")
+            raise
+        self.db = self.client.userdb  # Use your database name
+        self.users_collection = self.db.users
+        self.profile_cache = ProfileCache(self.users_collection)
+        self.sync_notifier = SyncNotifier()
+        # "write_behind" acknowledges messages once they are in a local WAL and batches the Mongo writes
+        self.write_behind = os.getenv("CHAT_WRITE_MODE", "sync") == "write_behind"
+        if self.write_behind:
+            from utils.write_behind import WriteBehindChatStore
+            self.chat_store = WriteBehindChatStore(self.db, on_change=self.sync_notifier.publish)
+        else:
+            self.chat_store = ChatStore(self.db, on_change=self.sync_notifier.publish)
+        # OAuth codes are single-use; this only absorbs duplicate callbacks (e.g. React StrictMode)
+        self.auth_cache = TTLCache(maxsize=int(os.getenv("AUTH_CODE_CACHE_SIZE", "10000")), ttl=300)
+        self.token_verifier = TokenVerifier(self.secret_key, self.algorithm)
+        self.google_auth = GoogleAuth()
+        self.inference_client = AsyncInferenceClient(token=os.getenv("HF_TOKEN"))
+        self.generation_router = GenerationRouter(self.inference_client)
+
+        await self.chat_store.ensure_indexes()
+        # Replays any write-behind WAL left by a crash
+        await self.chat_store.start()
+        await self.profile_cache.ensure_indexes()
+        await self.google_auth.start()
+        await self.inference_client.start()
+        self.started = True
+        self.startup_seconds = time.perf_counter() - started
+        logger.info(f"Services started in {self.startup_seconds * 1000:.0f}ms")
+
+        if self.prewarm_enabled:
+            # In the background so /health answers while models load; /ready waits for it
+            self._prewarm_task = asyncio.create_task(self.prewarm())
+
+    async def prewarm(self) -> None:
+        """Build every lazy component and load its models now instead of on first use"""
+        started = time.perf_counter()
+        try:
+            # Import faiss, numpy etc. off the event loop so /health keeps answering meanwhile
+            await asyncio.get_running_loop().run_in_executor(None, import_heavy_modules)
+            # Loads the local embedding model once, if EMBEDDING_BACKEND=local
+            await self.memory_manager.embedding_backend.start()
+            # Likewise the local sentiment model, if SENTIMENT_BACKEND=local
+            await self.sentiment_analyzer.start()
+            # Touching the others is enough to build them
+            self.prompt_builder
+            await self._token_counter_load
+            self.memory_worker
+            self.response_cache
+        except Exception as e:
+            # Whatever failed is retried on first use
+            logger.error(f"Prewarm failed: {str(e)}")
+        self.prewarmed = True
+        self.prewarm_seconds = time.perf_counter() - started
+        logger.info(f"Prewarmed in {self.prewarm_seconds * 1000:.0f}ms")
+
+    @property
+    def ready(self) -> bool:
+        return self.started and (self.prewarmed or not self.prewarm_enabled)
+
+    def loaded(self, name: str):
+        """The lazy component if it has been built, else None (without building it)"""
+        return self.__dict__.get(name)
+
+    @cached_property
+    def memory_manager(self):
+        from utils.embedding_backends import create_embedding_backend
+        from utils.memory_manager import MemoryManager
+        return MemoryManager(embedding_backend=create_embedding_backend(self.inference_client))
+
+    @cached_property
+    def memory_worker(self):
+        from utils.admission import BACKGROUND, admission_context
+        from utils.memory_extractor import MemoryExtractionWorker, extract_facts_heuristic
+        worker = MemoryExtractionWorker(self.memory_manager, extract=self.extract_facts or extract_facts_heuristic)
+        # The worker task keeps the context it starts in: its embeddings and extractions queue as background work
+        with admission_context(BACKGROUND, user=None):
+            worker.start()
+        return worker
+
+    @cached_property
+    def sentiment_analyzer(self):
+        from utils.sentiment_analyzer import SentimentAnalyzer
+        from utils.sentiment_backends import create_sentiment_backend
+        return SentimentAnalyzer(backend=create_sentiment_backend(self.inference_client))
+
+    @cached_property
+    def prompt_builder(self):
+        from utils.prompt_builder import PromptBuilder
+        builder = PromptBuilder()
+        # Exact prompt token counts once the tokenizer is loaded; estimates until then
+        self._token_counter_load = asyncio.get_running_loop().run_in_executor(None, builder.token_counter.load)
+        return builder
+
+    @cached_property
+    def response_cache(self):
+        # Opt-in: reuse replies to near-identical messages for turns without memories
+        if os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() != "true":
+            return None
+        from utils.response_cache import SemanticResponseCache
+        return SemanticResponseCache()
+
+    def stats(self) -> Dict:
+        return {
+            "started": self.started,
+            "ready": self.ready,
+            "prewarm": self.prewarm_enabled,
+            "prewarmed": self.prewarmed,
+            "startup_ms": round(self.startup_seconds * 1000, 1) if self.startup_seconds is not None else None,
+            "prewarm_ms": round(self.prewarm_seconds * 1000, 1) if self.prewarm_seconds is not None else None,
+            "loaded": [name for name in LAZY_COMPONENTS if name in self.__dict__],
+        }
+
+    async def close(self) -> None:
+        if self._prewarm_task is not None:
+            self._prewarm_task.cancel()
+            try:
+                await self._prewarm_task
+            except asyncio.CancelledError:
+                pass
+        worker = self.loaded("memory_worker")
+        if worker is not None:
+            # Drain queued extractions before the memory stores are closed
+            await worker.close()
+        memory_manager = self.loaded("memory_manager")
+        if memory_manager is not None:
+            memory_manager.close()
+        if not self.started:
+            return
+        await self.chat_store.close()
+        if memory_manager is not None:
+            await memory_manager.embedding_backend.close()
+        sentiment_analyzer = self.loaded("sentiment_analyzer")
+        if sentiment_analyzer is not None:
+            await sentiment_analyzer.close()
+        await self.inference_client.close()
+        await self.google_auth.close()
+        self.started = False
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import zlib
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from utils.memory_store import UserMemoryStore
+
+logger = logging.getLogger(__name__)
+
+# 64-bit ids: user number in the high bits, per-user memory sequence in the low 24
+SEQ_BITS = 24
+USERS_FILE = "users.tsv"
+IDS_FILE = "ids.i64"
+
+
+def encode_id(user_num: int, seq: int) -> int:
+    return (user_num << SEQ_BITS) | seq
+
+
+def decode_id(memory_id: int):
+    return memory_id >> SEQ_BITS, memory_id & ((1 << SEQ_BITS) - 1)
+
+
+class MemoryShard:
+    """One shard of the shared index: an IndexFlatIP plus its on-disk store.
+
+    Row i of the store, ids.i64 and the FAISS index all describe the same
+    memory. ids.i64 is appended before the store record that commits it, so
+    on open any extra trailing id is dropped. In memory each user's rows are
+    kept in a list, so adding and filtering cost what the user has rather
+    than what the shard has.
+    """
+
+    def __init__(self, path: str, dimension: int, fsync: bool = True):
+        self.path = path
+        self.dimension = dimension
+        self.fsync = fsync
+        self.store = UserMemoryStore(path, dimension, fsync=fsync)
+        self.ids_path = os.path.join(path, IDS_FILE)
+        ids = np.fromfile(self.ids_path, dtype="<i8") if os.path.exists(self.ids_path) else np.zeros(0, "<i8")
+        if len(ids) != len(self.store):
+            ids = ids[:len(self.store)]
+            ids.tofile(self.ids_path)
+        self.rows: Dict[int, List[int]] = {}
+        for row, user_num in enumerate((ids >> SEQ_BITS).tolist()):
+            self.rows.setdefault(user_num, []).append(row)
+        self.index = faiss.IndexFlatIP(dimension)
+        if len(ids):
+            self.index.add(np.ascontiguousarray(self.store.vectors()))
+
+    def persist(self, user_num: int, texts: List[str], vectors: np.ndarray) -> List[int]:
+        """Write a user's new memories to disk with one write per file; returns their ids.
+
+        Only touches files, so it can run off the event loop while searches
+        continue; index_persisted() then makes the memories searchable.
+        """
+        seq = len(self.rows.get(user_num, ()))
+        memory_ids = [encode_id(user_num, seq + i) for i in range(len(texts))]
+        with open(self.ids_path, "ab") as f:
+            f.write(np.array(memory_ids, dtype="<i8").tobytes())
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self.store.append_many(texts, vectors)
+        return memory_ids
+
+    def index_persisted(self, user_num: int, vectors: np.ndarray) -> None:
+        first = self.index.ntotal
+        self.index.add(np.ascontiguousarray(vectors, dtype="float32").reshape(-1, self.dimension))
+        self.rows.setdefault(user_num, []).extend(range(first, self.index.ntotal))
+
+    def add_many(self, user_num: int, texts: List[str], vectors: np.ndarray) -> List[int]:
+        memory_ids = self.persist(user_num, texts, vectors)
+        self.index_persisted(user_num, vectors)
+        return memory_ids
+
+    def _search_rows(self, user_num: int, vectors: np.ndarray, k: int):
+        rows = self.rows.get(user_num)
+        if not rows:
+            return None, None
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(rows, dtype=np.int64)))
+        return self.index.search(
+            np.asarray(vectors, dtype="float32").reshape(-1, self.dimension), min(k, len(rows)), params=params
+        )
+
+    def search(self, user_num: int, vector: np.ndarray, k: int) -> List[str]:
+        _, found = self._search_rows(user_num, vector, k)
+        if found is None:
+            return []
+        return [self.store[int(row)] for row in found[0] if row >= 0]
+
+    def max_similarity(self, user_num: int, vectors: np.ndarray) -> np.ndarray:
+        """Best inner product of each vector against this user's memories (-1 if they have none)"""
+        scores, _ = self._search_rows(user_num, vectors, 1)
+        if scores is None:
+            return np.full(len(vectors), -1.0, dtype="float32")
+        return scores[:, 0]
+
+    def close(self) -> None:
+        self.store.close()
+
+
+class SharedMemoryIndex:
+    """All users' memories in a fixed number of sharded indices.
+
+    Users are assigned a stable number (persisted in users.tsv) and hashed
+    to a shard; every query is filtered to the caller's own ids.
+    """
+
+    def __init__(self, path: str, dimension: int, num_shards: int = 16, fsync: bool = True):
+        self.path = path
+        self.dimension = dimension
+        self.num_shards = num_shards
+        self.fsync = fsync
+        self.shards: Dict[int, MemoryShard] = {}
+        self._shard_locks: Dict[int, asyncio.Lock] = {}
+        os.makedirs(path, exist_ok=True)
+        self.users_path = os.path.join(path, USERS_FILE)
+        self.user_nums: Dict[str, int] = self._read_users()
+        self.next_user_num = max(self.user_nums.values(), default=-1) + 1
+        self._users_lock = asyncio.Lock()
+
+    def _read_users(self) -> Dict[str, int]:
+        if not os.path.exists(self.users_path):
+            return {}
+        with open(self.users_path, "rb") as f:
+            data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            # A crash mid-append left a partial line; its user was never acknowledged
+            logger.warning(f"Truncating torn tail of {self.users_path}")
+            with open(self.users_path, "r+b") as f:
+                f.truncate(complete)
+        user_nums = {}
+        for line in data[:complete].decode("utf-8").splitlines():
+            parts = line.split("\t")
+            if len(parts) == 2:
+                user_nums[parts[0]] = int(parts[1])
+        return user_nums
+
+    def _write_user(self, user_id: str, user_num: int) -> None:
+        with open(self.users_path, "a") as f:
+            f.write(f"{user_id}\t{user_num}\n")
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    async def _assign_user_num(self, user_id: str) -> int:
+        """The user's number, persisting a new one (never a reused one) off the event loop if needed"""
+        async with self._users_lock:
+            user_num = self.user_nums.get(user_id)
+            if user_num is None:
+                user_num = self.next_user_num
+                await asyncio.get_running_loop().run_in_executor(None, self._write_user, user_id, user_num)
+                self.next_user_num += 1
+                self.user_nums[user_id] = user_num
+            return user_num
+
+    def _shard_id(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode()) % self.num_shards
+
+    async def _shard(self, user_id: str) -> MemoryShard:
+        shard_id = self._shard_id(user_id)
+        shard = self.shards.get(shard_id)
+        if shard is not None:
+            return shard
+        lock = self._shard_locks.setdefault(shard_id, asyncio.Lock())
+        async with lock:
+            if shard_id not in self.shards:
+                path = os.path.join(self.path, f"shard_{shard_id:03d}")
+                self.shards[shard_id] = await asyncio.get_running_loop().run_in_executor(
+                    None, MemoryShard, path, self.dimension, self.fsync
+                )
+                logger.info(f"Loaded memory shard {shard_id}")
+        return self.shards[shard_id]
+
+    async def add_many(self, user_id: str, texts: List[str], vectors: np.ndarray) -> None:
+        """Add several memories for a user with one write (and fsync) per file"""
+        shard = await self._shard(user_id)
+        user_num = await self._assign_user_num(user_id)
+        async with self._shard_locks[self._shard_id(user_id)]:
+            # The disk writes run in the executor; the FAISS index is only changed on the loop,
+            # so no search ever runs against it mid-add
+            await asyncio.get_running_loop().run_in_executor(None, shard.persist, user_num, texts, vectors)
+            shard.index_persisted(user_num, vectors)
+
+    async def search(self, user_id: str, vector: np.ndarray, k: int) -> List[str]:
+        user_num = self.user_nums.get(user_id)
+        if user_num is None:
+            return []
+        shard = await self._shard(user_id)
+        return shard.search(user_num, vector, k)
+
+    async def max_similarity(self, user_id: str, vectors: np.ndarray) -> np.ndarray:
+        user_num = self.user_nums.get(user_id)
+        if user_num is None:
+            return np.full(len(vectors), -1.0, dtype="float32")
+        shard = await self._shard(user_id)
+        return shard.max_similarity(user_num, vectors)
+
+    def close(self) -> None:
+        for shard in self.shards.values():
+            shard.close()
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self.user_nums),
+            "loaded_shards": len(self.shards),
+            "vectors": sum(shard.index.ntotal for shard in self.shards.values()),
+        }
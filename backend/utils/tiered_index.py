@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANN_THRESHOLD = int(os.getenv("MEMORY_ANN_THRESHOLD", "20000"))
+ANN_KIND = os.getenv("MEMORY_ANN_KIND", "ivf")
+HNSW_M = int(os.getenv("MEMORY_HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("MEMORY_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("MEMORY_IVF_NPROBE", "16"))
+
+
+def normalized_copy(vectors: np.ndarray) -> np.ndarray:
+    # Legacy stores may hold unnormalized vectors; inner product needs unit length
+    vectors = np.array(vectors, dtype="float32", copy=True)
+    if len(vectors):
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_flat(dimension: int, vectors: np.ndarray) -> faiss.Index:
+    index = faiss.IndexFlatIP(dimension)
+    if len(vectors):
+        index.add(vectors)
+    return index
+
+
+def build_ann(dimension: int, vectors: np.ndarray, kind: str = ANN_KIND) -> faiss.Index:
+    """Build an approximate inner-product index over already-normalized vectors"""
+    if kind == "ivf":
+        nlist = max(1, int(np.sqrt(len(vectors))))
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = IVF_NPROBE
+    else:
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    index.add(vectors)
+    return index
+
+
+class TieredIndex:
+    """Inner-product index that picks its structure by size.
+
+    Stores below the threshold use exact IndexFlatIP. Once a store crosses
+    it, an IVF (or HNSW) index is built from a snapshot of the vectors in a
+    worker thread while queries keep hitting the current index; vectors added
+    in the meantime are replayed before the new index is swapped in. IVF is
+    retrained the same way each time the store quadruples.
+    """
+
+    def __init__(self, dimension: int, vectors: np.ndarray, source: Callable[[], np.ndarray],
+                 threshold: int = ANN_THRESHOLD, kind: str = ANN_KIND):
+        self.d = dimension
+        self.source = source
+        self.threshold = threshold
+        self.kind = kind
+        self.index = build_flat(dimension, vectors)
+        self.tier = "flat"
+        self.next_rebuild_at = threshold
+        self._rebuild_task: Optional[asyncio.Task] = None
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def nbytes(self) -> int:
+        vector_bytes = self.ntotal * self.d * 4
+        if self.tier == "hnsw":
+            # Neighbour lists: ~2*M int32 links per vector on the base layer
+            return vector_bytes + self.ntotal * HNSW_M * 2 * 4
+        return vector_bytes
+
+    def add(self, vectors: np.ndarray) -> None:
+        self.index.add(normalized_copy(vectors))
+        self.schedule_rebuild()
+
+    def search(self, queries: np.ndarray, k: int):
+        return self.index.search(normalized_copy(queries), k)
+
+    def schedule_rebuild(self) -> None:
+        """Start a background rebuild if the store has outgrown the current tier"""
+        if self.next_rebuild_at is None or self.ntotal < self.next_rebuild_at:
+            return
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            return
+        try:
+            self._rebuild_task = asyncio.get_running_loop().create_task(self._rebuild())
+        except RuntimeError:
+            # No running loop (e.g. called from a worker thread); retried on the next add
+            pass
+
+    async def _rebuild(self) -> None:
+        snapshot = self.source()
+        size = len(snapshot)
+        try:
+            new_index = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: build_ann(self.d, normalized_copy(snapshot), self.kind)
+            )
+        except Exception as e:
+            logger.error(f"Background {self.kind} build failed, staying on {self.tier}: {str(e)}")
+            self.next_rebuild_at = None
+            return
+
+        # Replay vectors appended while the build was running, then swap
+        latest = self.source()
+        if len(latest) > size:
+            new_index.add(normalized_copy(latest[size:]))
+        self.index = new_index
+        self.tier = self.kind
+        self.next_rebuild_at = 4 * size if self.kind == "ivf" else None
+        logger.info(f"Switched memory index to {self.kind} at {new_index.ntotal} vectors")
@@ -0,0 +1,63 @@
+import logging
+import math
+import os
+from typing import Optional
+
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKENIZER = "mistralai/Mistral-7B-Instruct-v0.3"
+# Mistral's tokenizer averages a little under 4 characters per token on
+# English chat text; erring low keeps estimated prompts inside the budget
+CHARS_PER_TOKEN = 3.2
+
+
+class TokenCounter:
+    """Counts tokens with the generation model's own tokenizer.
+
+    Uses the optional `tokenizers` package with PROMPT_TOKENIZER (a Hub repo
+    id or a local tokenizer.json). Until load() succeeds, or if it fails,
+    counts are a conservative characters-per-token estimate. Counts are
+    memoized since memories and static prompt sections repeat.
+    """
+
+    def __init__(self, tokenizer_name: Optional[str] = None, cache_size: int = 10000):
+        self.tokenizer_name = tokenizer_name or os.getenv("PROMPT_TOKENIZER", DEFAULT_TOKENIZER)
+        self.tokenizer = None
+        self.cache = LRUCache(maxsize=cache_size)
+
+    @property
+    def exact(self) -> bool:
+        return self.tokenizer is not None
+
+    def load(self) -> bool:
+        """Load the tokenizer (blocking; run it in an executor). False if unavailable."""
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            logger.warning("tokenizers package not installed, estimating prompt token counts")
+            return False
+        try:
+            if os.path.exists(self.tokenizer_name):
+                self.tokenizer = Tokenizer.from_file(self.tokenizer_name)
+            else:
+                self.tokenizer = Tokenizer.from_pretrained(self.tokenizer_name, auth_token=os.getenv("HF_TOKEN"))
+            self.cache.clear()
+            logger.info(f"Loaded tokenizer {self.tokenizer_name}")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {self.tokenizer_name}, estimating token counts: {str(e)}")
+            return False
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokens = self.cache.get(text)
+        if tokens is None:
+            if self.tokenizer is not None:
+                tokens = len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+            else:
+                tokens = math.ceil(len(text) / CHARS_PER_TOKEN)
+            self.cache[text] = tokens
+        return tokens
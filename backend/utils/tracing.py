@@ -0,0 +1,216 @@
+import contextvars
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SPAN_SECONDS = REGISTRY.histogram("span_duration_seconds", "Duration of traced spans", ["span"])
+SPAN_ERRORS = REGISTRY.counter("span_errors_total", "Spans that ended with an exception", ["span"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request duration until the last body byte", ["method", "route", "status"]
+)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Spans recorded while handling one request"""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Dict] = []
+        self.profile: Optional[str] = None
+
+    def add(self, name: str, start: float, duration: float, error: Optional[str]) -> None:
+        # Background tasks spawned by the request may outlive it; drop their spans
+        if self.duration is None:
+            self.spans.append({
+                "name": name,
+                "offset_ms": round((start - self.start) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+                **({"error": error} if error else {}),
+            })
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or 0) * 1000, 2),
+            "spans": sorted(self.spans, key=lambda span: span["offset_ms"]),
+            **({"profile": self.profile} if self.profile else {}),
+        }
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into span_duration_seconds and the current request's trace.
+
+    Works in sync and async code alike; tasks created inside a request
+    inherit its trace through the context.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        SPAN_SECONDS.observe(duration, span=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, start, duration, error)
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds from a helper thread.
+
+    Stacks are kept in collapsed form ("outer;inner;leaf count"), which
+    flamegraph tools read directly. Profiling the event loop thread samples
+    whatever it runs, so concurrent requests show up too.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005, max_depth: int = 64):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: StackCounter = StackCounter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+class TraceRecorder:
+    """Keeps the most recent traces and logs the slow ones"""
+
+    def __init__(self, buffer_size: Optional[int] = None, slow_ms: Optional[float] = None):
+        self.traces: Deque[Trace] = deque(maxlen=buffer_size or int(os.getenv("TRACE_BUFFER_SIZE", "200")))
+        self.slow_seconds = (slow_ms or float(os.getenv("TRACE_SLOW_MS", "5000"))) / 1000
+
+    def record(self, trace: Trace) -> None:
+        self.traces.append(trace)
+        if trace.duration >= self.slow_seconds:
+            logger.info(f"Slow request {trace.name} ({trace.duration * 1000:.0f}ms): {trace.to_dict()['spans']}")
+
+    def recent(self, limit: int = 50, min_ms: float = 0) -> List[Dict]:
+        """Newest first, optionally only those that took at least min_ms"""
+        traces = [trace for trace in self.traces if trace.duration * 1000 >= min_ms]
+        return [trace.to_dict() for trace in reversed(traces[-limit:])]
+
+
+class TracingMiddleware:
+    """ASGI middleware that opens a Trace per HTTP request.
+
+    Records http_request_duration_seconds by route template (so path
+    parameters don't explode the label set) and returns the trace id in
+    X-Trace-Id. When PROFILING_TOKEN is set, a request carrying
+    `X-Profile: <token>` also runs under the sampling profiler (one request
+    at a time) and its collapsed stacks are written to
+    PROFILE_DIR/<trace_id>.txt.
+    """
+
+    def __init__(self, app, recorder: TraceRecorder, profiling_token: Optional[str] = None,
+                 profile_dir: Optional[str] = None):
+        self.app = app
+        self.recorder = recorder
+        self.profiling_token = profiling_token or os.getenv("PROFILING_TOKEN")
+        self.profile_dir = profile_dir or os.getenv("PROFILE_DIR", "profiles")
+        self._profiling = False
+
+    def _wants_profile(self, scope) -> bool:
+        if not self.profiling_token or self._profiling:
+            return False
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile":
+                return hmac.compare_digest(value, self.profiling_token.encode())
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        token = _current_trace.set(trace)
+        profiler = None
+        if self._wants_profile(scope):
+            self._profiling = True
+            profiler = SamplingProfiler()
+            profiler.start()
+            trace.profile = f"{trace.trace_id}.txt"
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", trace.trace_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            trace.finish()
+            _current_trace.reset(token)
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                trace.duration, method=scope["method"], route=getattr(route, "path", "unmatched"), status=status
+            )
+            self.recorder.record(trace)
+            if profiler is not None:
+                profiler.stop()
+                self._profiling = False
+                self._write_profile(trace, profiler)
+
+    def _write_profile(self, trace: Trace, profiler: SamplingProfiler) -> None:
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            with open(os.path.join(self.profile_dir, trace.profile), "w") as f:
+                f.write(profiler.collapsed())
+            logger.info(f"Wrote profile {trace.profile} ({profiler.samples} samples)")
+        except Exception as e:
+            logger.error(f"Error writing profile: {str(e)}")
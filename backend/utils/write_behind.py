@@ -0,0 +1,457 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.chat_store import ChatStore
+from utils.file_lock import try_lock
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+# Held by the process writing a WAL directory for as long as it runs
+OWNER_LOCK = "owner.lock"
+
+
+class WriteBehindChatStore(ChatStore):
+    """ChatStore that acknowledges appends once they are in a local WAL.
+
+    append_messages writes the exchange to a write-ahead log (group
+    committed: concurrent appends share one write + fsync) and returns; a
+    background task flushes everything queued every `flush_interval` with
+    one sync version per user and two bulk_writes (chat summaries, then
+    messages for the chats that were updated). Reads for a user first wait for that user's queued writes to
+    land, so a user always reads their own writes.
+
+    The WAL rolls to a new segment at every flush; older segments are
+    deleted once a flush succeeds. Each process (e.g. uvicorn worker) logs
+    to its own directory under `wal_dir`, locked for as long as it runs. On
+    start, and every `adopt_interval` after, a store takes over the WAL of
+    any process that died (its directory is no longer locked): it re-logs
+    the entries in its own WAL, removes the orphan and flushes them as its
+    own. Replays are idempotent: messages carry their _id from the WAL, and
+    each chat remembers the last WAL sequence number applied to it from
+    each worker (`wal_seqs`).
+
+    Read-your-writes holds within a process. With several workers, a read
+    served by another worker than the write may miss it for up to one
+    flush interval; delta sync still delivers it, since sync versions are
+    only committed once the flush lands.
+    """
+
+    def __init__(self, db, on_change=None, context_size: Optional[int] = None, wal_dir: Optional[str] = None,
+                 flush_interval: Optional[float] = None, max_pending: Optional[int] = None,
+                 fsync: Optional[bool] = None, worker_id: Optional[str] = None,
+                 adopt_interval: Optional[float] = None):
+        super().__init__(db, on_change=on_change, context_size=context_size)
+        self.wal_root = wal_dir or os.getenv("WRITE_BEHIND_WAL_DIR", "wal")
+        self.worker_id = worker_id or str(os.getpid())
+        self.wal_dir = os.path.join(self.wal_root, f"worker-{self.worker_id}")
+        self.adopt_interval = adopt_interval or float(os.getenv("WRITE_BEHIND_ADOPT_INTERVAL", "30"))
+        self.flush_interval = flush_interval or float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "50")) / 1000
+        self.max_pending = max_pending or int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+        self.fsync = fsync if fsync is not None else os.getenv("WRITE_BEHIND_FSYNC", "1") == "1"
+        self.pending: List[Dict] = []
+        self._inflight_users = set()
+        self._flush_lock = asyncio.Lock()
+        self._last_seq = 0
+        self._segment = 0
+        self._writing_segment: Optional[int] = None
+        self._wal_lines: List[str] = []
+        self._wal_waiters: List[asyncio.Future] = []
+        # Appended entries whose WAL write is still in flight, by id()
+        self._wal_pending: Dict[int, asyncio.Future] = {}
+        self._wal_ready = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._owner_lock = None
+        self._last_adopt = 0.0
+        self.flushes = 0
+        self.adopted_entries = 0
+        self.flushed_entries = 0
+        self.flush_failures = 0
+        self.wal_commits = 0
+        self.last_flush_ms = 0.0
+
+    # --- lifecycle -------------------------------------------------------
+
+    def _segment_path(self, segment: int, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.wal_dir, f"wal-{segment:08d}.jsonl")
+
+    def _segments(self, directory: Optional[str] = None) -> List[int]:
+        paths = glob.glob(os.path.join(directory or self.wal_dir, "wal-*.jsonl"))
+        return sorted(int(os.path.basename(path)[4:12]) for path in paths)
+
+    def _read_segments(self, directory: str) -> List[Dict]:
+        entries = []
+        for segment in self._segments(directory):
+            with open(self._segment_path(segment, directory), "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn tail of a write that was never acknowledged
+                        continue
+                    for message in entry["messages"]:
+                        message["_id"] = ObjectId(message["_id"])
+                    entries.append(entry)
+        return entries
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        os.makedirs(self.wal_dir, exist_ok=True)
+        self._owner_lock = try_lock(os.path.join(self.wal_dir, OWNER_LOCK))
+        if self._owner_lock is None:
+            raise RuntimeError(f"Write-behind WAL {self.wal_dir} is in use by another process")
+        segments = self._segments()
+        for entry in self._read_segments(self.wal_dir):
+            self.pending.append(entry)
+            self._last_seq = max(self._last_seq, entry["seq"])
+        self._segment = segments[-1] + 1 if segments else 0
+        if self.pending:
+            logger.info(f"Replaying {len(self.pending)} write-behind entries from {len(segments)} WAL segments")
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._wal_writer()), loop.create_task(self._flusher())]
+        await self.adopt_orphans()
+
+    def _orphan_candidates(self) -> List[str]:
+        # The root itself holds segments written before WALs were per process
+        directories = glob.glob(os.path.join(self.wal_root, "worker-*")) + [self.wal_root]
+        return [d for d in directories if os.path.abspath(d) != os.path.abspath(self.wal_dir)]
+
+    async def adopt_orphans(self) -> int:
+        """Take over the WALs of processes that are gone; returns the number of entries adopted"""
+        self._last_adopt = time.monotonic()
+        adopted = 0
+        for directory in self._orphan_candidates():
+            if not os.path.isdir(directory):
+                continue
+            lock = try_lock(os.path.join(directory, OWNER_LOCK))
+            if lock is None:
+                # Its process is alive (or another one is adopting it)
+                continue
+            try:
+                entries = self._read_segments(directory)
+                if entries:
+                    self.pending.extend(entries)
+                    # Durable in our WAL before the orphan is removed
+                    await asyncio.gather(*(self._log(entry) for entry in entries))
+                    logger.info(f"Adopted {len(entries)} write-behind entries from {directory}")
+                for segment in self._segments(directory):
+                    os.remove(self._segment_path(segment, directory))
+                if directory != self.wal_root:
+                    os.remove(os.path.join(directory, OWNER_LOCK))
+                    os.rmdir(directory)
+                adopted += len(entries)
+            except OSError as e:
+                logger.error(f"Error adopting write-behind WAL {directory}: {str(e)}")
+            finally:
+                lock.close()
+        self.adopted_entries += adopted
+        return adopted
+
+    async def close(self) -> None:
+        """Flush everything queued, then stop the background tasks"""
+        if self._wal_pending:
+            # Let in-flight appends reach the WAL before its writer is stopped
+            await asyncio.wait(list(self._wal_pending.values()))
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._wal_lines:
+            # Appends still waiting on the WAL: write them before the final flush
+            self._write_wal(self._segment, "".join(self._wal_lines))
+            for waiter in self._wal_waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._wal_lines, self._wal_waiters = [], []
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final write-behind flush failed, {len(self.pending)} entries left in the WAL: {str(e)}")
+        if self._owner_lock is not None:
+            if not self.pending and not self._segments():
+                # Nothing left to replay; anything else is adopted once the lock is released
+                os.remove(os.path.join(self.wal_dir, OWNER_LOCK))
+                os.rmdir(self.wal_dir)
+            self._owner_lock.close()
+            self._owner_lock = None
+
+    # --- WAL -------------------------------------------------------------
+
+    def _next_seq(self) -> int:
+        # Wall-clock based so sequence numbers keep increasing across restarts
+        self._last_seq = max(self._last_seq + 1, time.time_ns())
+        return self._last_seq
+
+    def _write_wal(self, segment: int, data: str) -> None:
+        with open(self._segment_path(segment), "a") as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    async def _wal_writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wal_ready.wait()
+            self._wal_ready.clear()
+            lines, waiters = self._wal_lines, self._wal_waiters
+            self._wal_lines, self._wal_waiters = [], []
+            if not lines:
+                continue
+            segment = self._writing_segment = self._segment
+            try:
+                await loop.run_in_executor(None, self._write_wal, segment, "".join(lines))
+                self.wal_commits += 1
+                for waiter in waiters:
+                    waiter.set_result(None)
+            except Exception as e:
+                for waiter in waiters:
+                    waiter.set_exception(e)
+            finally:
+                self._writing_segment = None
+
+    def _queue_log(self, entry: Dict) -> asyncio.Future:
+        record = {**entry, "messages": [{**m, "_id": str(m["_id"])} for m in entry["messages"]]}
+        waiter = asyncio.get_running_loop().create_future()
+        self._wal_lines.append(json.dumps(record) + "\n")
+        self._wal_waiters.append(waiter)
+        self._wal_ready.set()
+        return waiter
+
+    async def _log(self, entry: Dict) -> None:
+        # Shielded: a cancelled caller must not cancel the future the WAL writer resolves
+        await asyncio.shield(self._queue_log(entry))
+
+    def _logged(self, entry: Dict, waiter: asyncio.Future) -> None:
+        self._wal_pending.pop(id(entry), None)
+        if waiter.exception() is not None:
+            # Never durable and its caller got the error: it must not reach Mongo either
+            self.pending = [e for e in self.pending if e is not entry]
+
+    # --- writes ----------------------------------------------------------
+
+    async def append_messages(self, user_id: str, chat_id: str, messages: List[Dict],
+                              context: Optional[Dict] = None) -> Optional[Dict]:
+        """Queue messages and return once they are durable in the WAL.
+
+        The returned context is computed from `context` (the chat's context
+        read earlier in the request); existence of the chat was checked by
+        that read.
+        """
+        if not self._tasks:
+            await self.start()
+        if len(self.pending) >= self.max_pending:
+            # Backpressure: Mongo is falling behind, write this batch out first
+            await self.flush()
+
+        entry = {
+            "seq": self._next_seq(),
+            "worker": self.worker_id,
+            "user_id": user_id,
+            "chat_id": chat_id,
+            "messages": [{**message, "_id": ObjectId()} for message in messages],
+        }
+        waiter = self._queue_log(entry)
+        self.pending.append(entry)
+        self._wal_pending[id(entry)] = waiter
+        waiter.add_done_callback(lambda _: self._logged(entry, waiter))
+        await asyncio.shield(waiter)
+
+        context = context or {}
+        turns = [{"role": m["role"], "text": m["text"]} for m in messages]
+        return {
+            "recent": (context.get("recent", []) + turns)[-self.context_size:],
+            "summary": context.get("summary"),
+            "message_count": context.get("message_count", 0) + len(messages),
+        }
+
+    async def flush(self) -> None:
+        """Write everything queued to Mongo"""
+        async with self._flush_lock:
+            batch, self.pending = await self._durable_pending()
+            if not batch:
+                return
+            # Everything in segments up to this one is now in this batch (or already flushed)
+            rotated_at = self._segment
+            self._segment += 1
+
+            start = time.perf_counter()
+            self._inflight_users = {entry["user_id"] for entry in batch}
+            try:
+                await self._apply(batch)
+            except BaseException:
+                # Also on cancellation: anything half-applied is replayed idempotently
+                self.pending = batch + self.pending
+                self.flush_failures += 1
+                raise
+            finally:
+                self._inflight_users = set()
+            self.flushes += 1
+            self.flushed_entries += len(batch)
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+            for segment in self._segments():
+                if segment <= rotated_at and segment != self._writing_segment:
+                    os.remove(self._segment_path(segment))
+
+    async def _durable_pending(self):
+        """Split pending into the entries already in the WAL and the rest.
+
+        Waits for the WAL writes of the entries pending now, and drops those
+        that failed. Entries appended meanwhile stay queued, with everything
+        after them, so a chat's entries still reach Mongo in order.
+        """
+        logging = [self._wal_pending[id(entry)] for entry in self.pending if id(entry) in self._wal_pending]
+        if logging:
+            await asyncio.wait(logging)
+        durable = []
+        for i, entry in enumerate(self.pending):
+            waiter = self._wal_pending.get(id(entry))
+            if waiter is not None and not waiter.done():
+                return durable, self.pending[i:]
+            if waiter is None or waiter.exception() is None:
+                durable.append(entry)
+        return durable, []
+
+    async def _apply(self, batch: List[Dict]) -> None:
+        by_user: Dict[str, List[Dict]] = {}
+        for entry in batch:
+            by_user.setdefault(entry["user_id"], []).append(entry)
+        users = list(by_user)
+        # Pending until the writes below land, so readers never see these versions without their data
+        versions = await asyncio.gather(*(self._begin_version(user_id) for user_id in users))
+        try:
+            chat_ops = []
+            for user_id, version in zip(users, versions):
+                for entry in by_user[user_id]:
+                    seq_field = self._seq_field(entry)
+                    pipeline = self._append_pipeline(entry["messages"], version)
+                    pipeline[0]["$set"][seq_field] = entry["seq"]
+                    chat_ops.append(UpdateOne(
+                        {"user_id": user_id, "chat_id": entry["chat_id"], "deleted": {"$ne": True},
+                         seq_field: {"$not": {"$gte": entry["seq"]}}},
+                        pipeline
+                    ))
+            await self.chats.bulk_write(chat_ops, ordered=True)
+
+            message_ops = []
+            applied = await self._applied_chats(batch)
+            for user_id, version in zip(users, versions):
+                for entry in by_user[user_id]:
+                    # Only chats whose update matched (now or in an earlier attempt): no messages
+                    # for a chat deleted (or never created) before the entry was flushed
+                    chat = applied.get((user_id, entry["chat_id"]))
+                    if chat is None or self._applied_seq(chat, entry) < entry["seq"]:
+                        continue
+                    message_ops.extend(
+                        InsertOne({"user_id": user_id, "chat_id": entry["chat_id"], "version": version, **message})
+                        for message in entry["messages"]
+                    )
+            if message_ops:
+                try:
+                    await self.messages.bulk_write(message_ops, ordered=False)
+                except BulkWriteError as e:
+                    # Messages already written by an earlier attempt of the same entry
+                    if any(error["code"] != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                        raise
+        finally:
+            committed = await asyncio.gather(*(self._end_version(user_id, version)
+                                               for user_id, version in zip(users, versions)))
+        for user_id, version in zip(users, committed):
+            self._changed(user_id, version)
+
+    @staticmethod
+    def _seq_field(entry: Dict) -> str:
+        # Sequence numbers only increase within one worker's WAL; entries from before
+        # per-process WALs have no worker and use the old single field
+        return f"wal_seqs.{entry['worker']}" if entry.get("worker") else "wal_seq"
+
+    @staticmethod
+    def _applied_seq(chat: Dict, entry: Dict) -> int:
+        if entry.get("worker"):
+            return chat.get("wal_seqs", {}).get(entry["worker"], -1)
+        return chat.get("wal_seq", -1)
+
+    async def _applied_chats(self, batch: List[Dict]) -> Dict:
+        """(user_id, chat_id) -> the chat's applied WAL sequences, for the batch's chats that aren't deleted"""
+        keys = {(entry["user_id"], entry["chat_id"]) for entry in batch}
+        chats = await self.chats.find(
+            {"$or": [{"user_id": user_id, "chat_id": chat_id} for user_id, chat_id in keys], "deleted": {"$ne": True}},
+            {"_id": 0, "user_id": 1, "chat_id": 1, "wal_seq": 1, "wal_seqs": 1}
+        ).to_list(length=None)
+        return {(chat["user_id"], chat["chat_id"]): chat for chat in chats}
+
+    async def _flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self._last_adopt >= self.adopt_interval:
+                try:
+                    await self.adopt_orphans()
+                except Exception as e:
+                    logger.error(f"Write-behind WAL adoption failed, will retry: {str(e)}")
+            if not self.pending:
+                continue
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, will retry: {str(e)}")
+
+    # --- reads -----------------------------------------------------------
+
+    async def sync_user(self, user_id: str) -> None:
+        """Wait until this user's queued writes are in Mongo (read-your-writes).
+
+        Flushes everything rather than just this user's entries, so readers
+        arriving together share one flush instead of queueing on the lock.
+        """
+        while user_id in self._inflight_users or any(entry["user_id"] == user_id for entry in self.pending):
+            await self.flush()
+
+    async def get_version(self, user_id: str) -> int:
+        await self.sync_user(user_id)
+        return await super().get_version(user_id)
+
+    async def list_chats(self, user_id: str) -> List[Dict]:
+        await self.sync_user(user_id)
+        return await super().list_chats(user_id)
+
+    async def get_messages(self, user_id: str, chat_id: str, limit: int = 50, before: Optional[str] = None):
+        await self.sync_user(user_id)
+        return await super().get_messages(user_id, chat_id, limit=limit, before=before)
+
+    async def get_context(self, user_id: str, chat_id: str) -> Optional[Dict]:
+        await self.sync_user(user_id)
+        return await super().get_context(user_id, chat_id)
+
+    async def changes_since(self, user_id: str, since: int, message_limit: int = 500) -> Dict:
+        await self.sync_user(user_id)
+        return await super().changes_since(user_id, since, message_limit=message_limit)
+
+    async def delete_chat(self, user_id: str, chat_id: str) -> bool:
+        await self.sync_user(user_id)
+        return await super().delete_chat(user_id, chat_id)
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "flushed_entries": self.flushed_entries,
+            "flush_failures": self.flush_failures,
+            "adopted_entries": self.adopted_entries,
+            "wal_commits": self.wal_commits,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
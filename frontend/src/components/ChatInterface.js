@@ -4,7 +4,7 @@ import MemoryPanel from './MemoryPanel';
 
 const ChatInterface = () => {
   const [message, setMessage] = useState('');
-  const { currentChat, loading, sendMessage } = useChat();
+  const { currentChat, loading, sendMessageStream, loadOlderMessages } = useChat();
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -20,7 +20,7 @@ const ChatInterface = () => {
     if (!message.trim() || !currentChat) return;
 
     try {
-      await sendMessage(currentChat.chat_id, message.trim());
+      await sendMessageStream(currentChat.chat_id, message.trim());
       setMessage('');
     } catch (error) {
       console.error('Error sending message:', error);
@@ -69,6 +69,14 @@ const ChatInterface = () => {
   return (
     <div className="h-full flex flex-col">
       <div className="flex-1 overflow-y-auto p-4 space-y-4">
+        {currentChat.next_cursor && (
+          <button
+            onClick={loadOlderMessages}
+            className="w-full text-sm text-blue-600 hover:underline"
+          >
+            Load older messages
+          </button>
+        )}
         {currentChat.messages.map((msg, index) => renderMessage(msg, index))}
         <div ref={messagesEndRef} />
       </div>
@@ -2,7 +2,7 @@ import React from 'react';
 import { useChat } from '../context/ChatContext';
 
 const ChatList = () => {
-  const { chats, currentChat, setCurrentChat, createNewChat, deleteChat, loading } = useChat();
+  const { chats, currentChat, selectChat, createNewChat, deleteChat, loading } = useChat();
 
   const handleNewChat = async () => {
     if (loading) return;
@@ -56,10 +56,10 @@ const ChatList = () => {
             className={`p-4 cursor-pointer hover:bg-gray-100 flex justify-between items-center ${
               currentChat?.chat_id === chat.chat_id ? 'bg-gray-100' : ''
             }`}
-            onClick={() => setCurrentChat(chat)}
+            onClick={() => selectChat(chat)}
           >
             <div className="truncate flex-1">
-              {chat.messages[0]?.text || 'New Chat'}
+              {chat.preview || 'New Chat'}
             </div>
             <button
               onClick={(e) => {
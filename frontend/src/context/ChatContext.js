@@ -8,6 +8,33 @@ export const ChatProvider = ({ children }) => {
   const [currentChat, setCurrentChat] = useState(null);
   const [loading, setLoading] = useState(false);
   const pollingInterval = useRef(null);
+  // Last sync version seen from the server; null until the first full fetch
+  const syncVersion = useRef(null);
+  const pushConnected = useRef(false);
+
+  const applyChanges = (changes) => {
+    const changedIds = new Set(changes.chats.map(chat => chat.chat_id));
+    setChats(prev => [
+      ...prev.filter(chat => !changedIds.has(chat.chat_id)),
+      ...changes.chats.filter(chat => !chat.deleted)
+    ].sort((a, b) => (b.updated_at || '').localeCompare(a.updated_at || '')));
+
+    setCurrentChat(prev => {
+      if (!prev) return prev;
+      if (changes.chats.some(chat => chat.chat_id === prev.chat_id && chat.deleted)) {
+        return null;
+      }
+      // An in-flight streamed reply delivers its own messages when it finishes
+      if (prev.messages.some(msg => msg.streaming)) return prev;
+      const seen = new Set(prev.messages.map(msg => `${msg.role}|${msg.timestamp}`));
+      const incoming = changes.messages.filter(msg => (
+        msg.chat_id === prev.chat_id && !seen.has(`${msg.role}|${msg.timestamp}`)
+      ));
+      if (incoming.length === 0) return prev;
+      const newMessages = incoming.map(({ chat_id, version, ...msg }) => msg);
+      return { ...prev, messages: [...prev.messages, ...newMessages] };
+    });
+  };
 
   const fetchChats = useCallback(async (silent = false) => {
     if (!silent) {
@@ -21,14 +48,26 @@ export const ChatProvider = ({ children }) => {
         return;
       }
 
+      const since = syncVersion.current;
       const response = await axios.get(`${process.env.REACT_APP_BACKEND_URL}/api/chats`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: since !== null ? { since } : {},
+        validateStatus: status => status === 304 || (status >= 200 && status < 300)
       });
-      
-      const newChats = response.data.chats || [];
-      if (JSON.stringify(newChats) !== JSON.stringify(chats)) {
-        setChats(newChats);
+
+      // 304: nothing changed since our version
+      if (response.status === 304) return;
+
+      if (response.data.since !== undefined && !response.data.truncated) {
+        applyChanges(response.data);
+      } else if (response.data.since !== undefined) {
+        // Too much changed for a delta; fall back to a full reload
+        syncVersion.current = null;
+        return fetchChats(silent);
+      } else {
+        setChats(response.data.chats || []);
       }
+      syncVersion.current = response.data.version;
     } catch (error) {
       if (!silent) {
         console.error('Error fetching chats:', error);
@@ -38,14 +77,16 @@ export const ChatProvider = ({ children }) => {
         setLoading(false);
       }
     }
-  }, [chats]);
+  }, []);
 
   useEffect(() => {
     fetchChats(); // Initial fetch
     
-    // Set up polling every 30 seconds
+    // Poll every 30 seconds, but only while the push channel is down
     pollingInterval.current = setInterval(() => {
-      fetchChats(true); // Silent fetch for polling
+      if (!pushConnected.current) {
+        fetchChats(true);
+      }
     }, 30000);
 
     return () => {
@@ -55,6 +96,64 @@ export const ChatProvider = ({ children }) => {
     };
   }, [fetchChats]);
 
+  useEffect(() => {
+    // Push channel: the server sends our sync version whenever chats change
+    const controller = new AbortController();
+    let retryDelay = 1000;
+
+    const listen = async () => {
+      const token = localStorage.getItem('token');
+      if (!token) return;
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/sync/stream`, {
+        headers: { Authorization: `Bearer ${token}` },
+        signal: controller.signal
+      });
+      if (!response.ok || !response.body) {
+        throw new Error(`Sync stream failed with status ${response.status}`);
+      }
+      pushConnected.current = true;
+      retryDelay = 1000;
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+          if (!rawEvent.startsWith('data:')) continue;
+          const event = JSON.parse(rawEvent.slice(5));
+          if (event.type === 'version' && event.version !== syncVersion.current) {
+            fetchChats(true);
+          }
+        }
+      }
+    };
+
+    const connect = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          await listen();
+        } catch (error) {
+          if (controller.signal.aborted) return;
+        }
+        pushConnected.current = false;
+        await new Promise(resolve => setTimeout(resolve, retryDelay));
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      }
+    };
+
+    connect();
+    return () => {
+      controller.abort();
+      pushConnected.current = false;
+    };
+  }, [fetchChats]);
+
   const createNewChat = async (message) => {
     setLoading(true);
     try {
@@ -79,12 +178,12 @@ export const ChatProvider = ({ children }) => {
       }
 
       const newChat = {
-        chat_id: response.data.chat_id,
-        messages: response.data.messages || [],
-        created_at: new Date().toISOString()
+        ...response.data,
+        messages: response.data.messages || []
       };
 
-      setChats(prev => [newChat, ...prev]);
+      const { messages, ...summary } = newChat;
+      setChats(prev => [summary, ...prev]);
       setCurrentChat(newChat);
       return newChat;
 
@@ -106,27 +205,142 @@ export const ChatProvider = ({ children }) => {
         { headers: { Authorization: `Bearer ${token}` } }
       );
       
-      setChats(prev => prev.map(chat => {
-        if (chat.chat_id === chatId) {
-          return {
+      appendToChat(chatId, messages => [...messages, ...response.data.messages]);
+      touchChatSummary(chatId, response.data.messages);
+      
+      return response.data;
+    } catch (error) {
+      console.error('Error sending message:', error);
+      throw error;
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const appendToChat = (chatId, update) => {
+    setCurrentChat(prev => (
+      prev?.chat_id === chatId ? { ...prev, messages: update(prev.messages) } : prev
+    ));
+  };
+
+  const touchChatSummary = (chatId, messages) => {
+    const firstUserText = messages.find(msg => msg.role === 'user')?.text;
+    setChats(prev => prev.map(chat => (
+      chat.chat_id === chatId
+        ? {
             ...chat,
-            messages: [...chat.messages, ...response.data.messages]
-          };
+            preview: chat.preview || firstUserText,
+            message_count: (chat.message_count || 0) + messages.length,
+            updated_at: messages[messages.length - 1].timestamp
+          }
+        : chat
+    )));
+  };
+
+  const fetchMessages = async (chatId, before = null) => {
+    const token = localStorage.getItem('token');
+    const response = await axios.get(
+      `${process.env.REACT_APP_BACKEND_URL}/api/chat/${chatId}/messages`,
+      {
+        headers: { Authorization: `Bearer ${token}` },
+        params: before ? { before } : {}
+      }
+    );
+    return response.data;
+  };
+
+  const selectChat = async (chat) => {
+    setCurrentChat({ ...chat, messages: [], next_cursor: null });
+    try {
+      const page = await fetchMessages(chat.chat_id);
+      setCurrentChat(prev => (
+        prev?.chat_id === chat.chat_id
+          ? { ...prev, messages: page.messages, next_cursor: page.next_cursor }
+          : prev
+      ));
+    } catch (error) {
+      console.error('Error loading messages:', error);
+    }
+  };
+
+  const loadOlderMessages = async () => {
+    if (!currentChat?.next_cursor) return;
+    const chatId = currentChat.chat_id;
+    try {
+      const page = await fetchMessages(chatId, currentChat.next_cursor);
+      setCurrentChat(prev => (
+        prev?.chat_id === chatId
+          ? { ...prev, messages: [...page.messages, ...prev.messages], next_cursor: page.next_cursor }
+          : prev
+      ));
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+    }
+  };
+
+  const sendMessageStream = async (chatId, message) => {
+    setLoading(true);
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(
+        `${process.env.REACT_APP_BACKEND_URL}/api/chat/${chatId}/message/stream`,
+        {
+          method: 'POST',
+          headers: {
+            'Authorization': `Bearer ${token}`,
+            'Content-Type': 'application/json'
+          },
+          body: JSON.stringify({ message })
         }
-        return chat;
-      }));
+      );
 
-      // Also update currentChat if this is the active chat
-      if (currentChat?.chat_id === chatId) {
-        setCurrentChat(prev => ({
-          ...prev,
-          messages: [...prev.messages, ...response.data.messages]
-        }));
+      if (!response.ok || !response.body) {
+        throw new Error(`Streaming request failed with status ${response.status}`);
       }
-      
-      return response.data;
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finalMessages = null;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+          if (!rawEvent.startsWith('data:')) continue;
+          const event = JSON.parse(rawEvent.slice(5));
+
+          if (event.type === 'user_message') {
+            // Bot placeholder that tokens are appended to as they arrive
+            appendToChat(chatId, messages => [
+              ...messages,
+              event.message,
+              { role: 'bot', text: '', timestamp: new Date().toISOString(), streaming: true }
+            ]);
+          } else if (event.type === 'token') {
+            appendToChat(chatId, messages => messages.map(msg => (
+              msg.streaming ? { ...msg, text: msg.text + event.text } : msg
+            )));
+          } else if (event.type === 'done') {
+            finalMessages = event.messages;
+            appendToChat(chatId, messages => messages.map(msg => (
+              msg.streaming ? event.messages[1] : msg
+            )));
+            touchChatSummary(chatId, event.messages);
+          } else if (event.type === 'error') {
+            appendToChat(chatId, messages => messages.filter(msg => !msg.streaming));
+            throw new Error(event.detail);
+          }
+        }
+      }
+
+      return { messages: finalMessages };
     } catch (error) {
-      console.error('Error sending message:', error);
+      console.error('Error streaming message:', error);
       throw error;
     } finally {
       setLoading(false);
@@ -156,9 +370,12 @@ export const ChatProvider = ({ children }) => {
       currentChat,
       loading,
       setCurrentChat,
+      selectChat,
+      loadOlderMessages,
       fetchChats,
       createNewChat,
       sendMessage,
+      sendMessageStream,
       deleteChat
     }}>
       {children}